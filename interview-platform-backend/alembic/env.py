@@ -12,8 +12,8 @@ load_dotenv()
 # Add the parent directory to Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Import models and configuration
-from app.db.base_class import Base
+# Import models and configuration; app.db.base registers every model on Base
+from app.db.base import Base
 from app.core.config import settings
 
 # this is the Alembic Config object, which provides
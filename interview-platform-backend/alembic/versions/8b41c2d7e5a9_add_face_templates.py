@@ -0,0 +1,48 @@
+"""Add face templates
+
+Revision ID: 8b41c2d7e5a9
+Revises: f3a2953b28c3
+Create Date: 2026-10-19 10:12:31.418207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b41c2d7e5a9'
+down_revision: Union[str, None] = 'f3a2953b28c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'face_templates',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('interview_id', sa.Integer(), nullable=True),
+        sa.Column('model_name', sa.String(), nullable=False),
+        sa.Column('embedding', sa.LargeBinary(), nullable=False),
+        sa.Column('dimensions', sa.Integer(), nullable=False),
+        sa.Column('face_confidence', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['interview_id'], ['interviews.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_face_templates_id'), 'face_templates', ['id'], unique=False)
+    op.create_index(op.f('ix_face_templates_user_id'), 'face_templates', ['user_id'], unique=False)
+    op.create_index(op.f('ix_face_templates_interview_id'), 'face_templates', ['interview_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_face_templates_interview_id'), table_name='face_templates')
+    op.drop_index(op.f('ix_face_templates_user_id'), table_name='face_templates')
+    op.drop_index(op.f('ix_face_templates_id'), table_name='face_templates')
+    op.drop_table('face_templates')
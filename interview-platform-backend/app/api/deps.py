@@ -1,4 +1,6 @@
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -15,6 +17,12 @@ oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/auth/login"
 )
 
+# Same scheme, but lets media endpoints fall back to a query parameter
+optional_oauth2_scheme = OAuth2PasswordBearer(
+    tokenUrl=f"{settings.API_V1_STR}/auth/login",
+    auto_error=False
+)
+
 # Synchronous DB dependency (for compatibility)
 def get_db_session() -> Session:
     return next(get_db())
@@ -56,6 +64,25 @@ def get_current_user(
 
     return user
 
+# Current user dependency for media endpoints
+def get_current_user_for_media(
+    db: Session = Depends(get_db),
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    access_token: Optional[str] = Query(None),
+) -> User:
+    """
+    Like get_current_user, but also accepts the token as an `access_token`
+    query parameter, since <video> elements can't send an Authorization header.
+    """
+    token = token or access_token
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return get_current_user(db=db, token=token)
+
 # Current user dependency for async endpoints (new)
 async def get_current_user_async(
     db: AsyncSession = Depends(get_async_db_session), 
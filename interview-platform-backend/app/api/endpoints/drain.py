@@ -0,0 +1,45 @@
+# app/api/endpoints/drain.py
+from typing import Any
+
+from fastapi import APIRouter, Depends
+
+from app.api import deps
+from app.api.endpoints import websocket
+from app.core.events import startup_state
+from app.models.user import User
+
+router = APIRouter()
+
+
+def _status() -> dict:
+    service = websocket.webrtc_service
+    return {
+        "draining": startup_state.draining,
+        "sessions": len(service.connections) if service else 0,
+        "websockets": len(service.websocket_connections) if service else 0,
+    }
+
+
+@router.post("", status_code=202)
+async def start_drain(
+    current_user: User = Depends(deps.get_current_active_admin),
+) -> Any:
+    """
+    Start draining this worker ahead of a shutdown, e.g. from a preStop hook.
+
+    The worker reports itself not ready, refuses new sessions and moves its
+    clients elsewhere; poll GET until no sessions are left, then stop it.
+    """
+    startup_state.mark_draining()
+    service = websocket.webrtc_service
+    if service is not None:
+        service.start_drain()
+    return _status()
+
+
+@router.get("")
+async def drain_status(
+    current_user: User = Depends(deps.get_current_active_admin),
+) -> Any:
+    """Whether this worker is draining and how many sessions it still holds"""
+    return _status()
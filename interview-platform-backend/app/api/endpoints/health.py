@@ -0,0 +1,51 @@
+# app/api/endpoints/health.py
+from fastapi import APIRouter, Query
+from fastapi.responses import JSONResponse
+
+from app.core.events import startup_state
+from app.services.health import health_monitor
+
+router = APIRouter()
+
+# Minimum age of cached results before a deep check may trigger a new probe
+DEEP_REFRESH_MIN_AGE = 2.0
+
+
+@router.get("/health")
+async def health_check():
+    """Overall status from the last background probe; never touches the database"""
+    healthy = health_monitor.is_healthy()
+    return JSONResponse(
+        status_code=200 if healthy else 503,
+        content={
+            "status": "healthy" if healthy else "unhealthy",
+            "components": {name: component["status"] for name, component in health_monitor.components.items()},
+        }
+    )
+
+
+@router.get("/health/live")
+async def liveness_check():
+    """The process is up and its event loop is serving requests"""
+    return {"status": "alive"}
+
+
+@router.get("/health/ready")
+async def readiness_check():
+    """The process has finished warming up and no critical component is failing"""
+    ready = startup_state.ready and health_monitor.is_healthy()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "status": health_monitor.status(), "startup": startup_state.to_dict()}
+    )
+
+
+@router.get("/health/deep")
+async def deep_health_check(refresh: bool = Query(False, description="Probe now instead of reporting cached results")):
+    """Per-component status and details"""
+    if refresh:
+        await health_monitor.probe(max_age=DEEP_REFRESH_MIN_AGE)
+    return JSONResponse(
+        status_code=200 if health_monitor.is_healthy() else 503,
+        content={**health_monitor.to_dict(), "startup": startup_state.to_dict()}
+    )
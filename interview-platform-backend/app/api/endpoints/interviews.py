@@ -8,7 +8,6 @@ from app.schemas.interview import (
     InterviewCreate, InterviewUpdate, InterviewResponse, 
     AnalysisResponse, AnalysisSummary
 )
-from app.services.webrtc import WebRTCService
 
 from app.models.interview import Interview, InterviewStatus
 from app.models.analysis import Analysis
@@ -0,0 +1,16 @@
+# app/api/endpoints/metrics.py
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.metrics import REGISTRY
+
+router = APIRouter()
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Metrics of this process in the Prometheus text format"""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,73 @@
+# app/api/endpoints/profiling.py
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from app.api import deps
+from app.api.endpoints import websocket
+from app.models.user import User
+
+router = APIRouter()
+
+
+def _get_analysis_service(connection_id: str):
+    # Analysis runs in this process only on media workers, once the media stack is loaded
+    service = websocket.webrtc_service
+    analysis_service = service.analysis_services.get(connection_id) if service else None
+    if analysis_service is None:
+        raise HTTPException(status_code=404, detail="No analysis session for this connection on this worker")
+    return analysis_service
+
+
+@router.get("/sessions")
+async def list_sessions(
+    current_user: User = Depends(deps.get_current_active_admin),
+) -> Any:
+    """Analysis sessions on this worker and whether they are being profiled"""
+    service = websocket.webrtc_service
+    if service is None:
+        return []
+    return [
+        {
+            "connection_id": connection_id,
+            "profiling": analysis_service.profiler is not None,
+            "frames_recorded": analysis_service.profiler.recorded if analysis_service.profiler else 0,
+        }
+        for connection_id, analysis_service in list(service.analysis_services.items())
+    ]
+
+
+@router.get("/sessions/{connection_id}")
+async def get_session_profile(
+    connection_id: str,
+    slowest: int = Query(10, ge=0, le=100),
+    current_user: User = Depends(deps.get_current_active_admin),
+) -> Any:
+    """Stage percentiles and the slowest frames of a profiled session"""
+    analysis_service = _get_analysis_service(connection_id)
+    if analysis_service.profiler is None:
+        raise HTTPException(status_code=409, detail="Profiling is not enabled for this session")
+    return analysis_service.profiler.summary(slowest=slowest)
+
+
+@router.post("/sessions/{connection_id}")
+async def enable_session_profiling(
+    connection_id: str,
+    capacity: int = Query(None, ge=1, le=10000),
+    current_user: User = Depends(deps.get_current_active_admin),
+) -> Any:
+    """Start profiling a running session"""
+    analysis_service = _get_analysis_service(connection_id)
+    profiler = analysis_service.enable_profiling(capacity)
+    return {"connection_id": connection_id, "profiling": True, "capacity": profiler.capacity}
+
+
+@router.delete("/sessions/{connection_id}")
+async def disable_session_profiling(
+    connection_id: str,
+    current_user: User = Depends(deps.get_current_active_admin),
+) -> Any:
+    """Stop profiling a session and drop its recorded timings"""
+    analysis_service = _get_analysis_service(connection_id)
+    analysis_service.disable_profiling()
+    return {"connection_id": connection_id, "profiling": False}
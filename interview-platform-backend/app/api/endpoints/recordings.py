@@ -0,0 +1,95 @@
+# app/api/endpoints/recordings.py
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+from typing import Any, List
+from datetime import datetime, timezone
+import os
+
+from app.api import deps
+from app.api.responses import MEDIA_TYPES, RangeFileResponse
+from app.core.config import settings
+from app.db.session import get_db
+from app.models.interview import Interview
+from app.models.user import User
+from app.schemas.interview import RecordingResponse
+
+router = APIRouter()
+
+# Passthrough .frames/.json files aren't playable and are never served
+PLAYABLE_EXTENSIONS = {".mp4", ".webm", ".mkv", ".jpg"}
+
+
+def _get_reviewable_interview(interview_id: int, db: Session, current_user: User) -> Interview:
+    """Load an interview whose recordings the current user may watch"""
+    interview = db.query(Interview).filter(Interview.id == interview_id).first()
+    if not interview:
+        raise HTTPException(status_code=404, detail="Interview not found")
+
+    if interview.interviewer_id != current_user.id and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not enough permissions to view these recordings")
+
+    return interview
+
+
+def _recordings_dir(interview_id: int) -> str:
+    # Signaling rooms are named after the interview they belong to
+    return os.path.realpath(os.path.join(settings.RECORDINGS_DIR, str(interview_id)))
+
+
+@router.get("/{interview_id}/recordings", response_model=List[RecordingResponse])
+async def list_recordings(
+    interview_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_user)
+) -> Any:
+    """List the playable recordings of an interview"""
+    _get_reviewable_interview(interview_id, db, current_user)
+
+    directory = _recordings_dir(interview_id)
+    if not os.path.isdir(directory):
+        return []
+
+    recordings = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            extension = os.path.splitext(entry.name)[1].lower()
+            if not entry.is_file() or extension not in PLAYABLE_EXTENSIONS:
+                continue
+            stat_result = entry.stat()
+            recordings.append(RecordingResponse(
+                name=entry.name,
+                size=stat_result.st_size,
+                modified=datetime.fromtimestamp(stat_result.st_mtime, tz=timezone.utc),
+                content_type=MEDIA_TYPES[extension],
+                url=f"{settings.API_V1_STR}/interviews/{interview_id}/recordings/{entry.name}"
+            ))
+
+    return sorted(recordings, key=lambda recording: recording.modified)
+
+
+@router.api_route("/{interview_id}/recordings/{name}", methods=["GET", "HEAD"])
+async def stream_recording(
+    interview_id: int,
+    name: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_user_for_media)
+) -> Any:
+    """
+    Stream a recording with HTTP Range support.
+
+    Recordings written as fragmented MP4 can be played while the interview
+    is still in progress.
+    """
+    _get_reviewable_interview(interview_id, db, current_user)
+
+    directory = _recordings_dir(interview_id)
+    path = os.path.realpath(os.path.join(directory, name))
+    if (
+        os.path.dirname(path) != directory
+        or os.path.splitext(path)[1].lower() not in PLAYABLE_EXTENSIONS
+        or not os.path.isfile(path)
+    ):
+        raise HTTPException(status_code=404, detail="Recording not found")
+
+    return RangeFileResponse(path, request.headers)
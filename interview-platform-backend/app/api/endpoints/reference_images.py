@@ -0,0 +1,114 @@
+# app/api/endpoints/reference_images.py
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+from typing import Any
+import asyncio
+import logging
+import os
+import uuid
+
+from app.api import deps
+from app.core.config import settings
+from app.db.session import get_db
+from app.models.face_template import FaceTemplate
+from app.models.interview import Interview
+from app.models.user import User
+from app.schemas.face_template import FaceTemplateResponse
+from app.services.face_templates import PRIORITY_REFERENCE_TEMPLATE, latest_template_query, reference_upload_dir
+from app.services.jobs import job_queue
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+def _get_interview(interview_id: int, db: Session, current_user: User, upload: bool = False) -> Interview:
+    """
+    Load an interview whose candidate's reference image the current user may
+    see, or, with upload, replace. The candidate may only see it: a template
+    they uploaded themselves would let anyone sit the interview for them.
+    """
+    interview = db.query(Interview).filter(Interview.id == interview_id).first()
+    if not interview:
+        raise HTTPException(status_code=404, detail="Interview not found")
+
+    allowed = (interview.interviewer_id,) if upload else (interview.candidate_id, interview.interviewer_id)
+    if current_user.id not in allowed and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not enough permissions for this interview")
+
+    return interview
+
+
+def _save_upload(data: bytes) -> str:
+    directory = reference_upload_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{uuid.uuid4().hex}.img")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+@router.post("/{interview_id}/reference-image", response_model=FaceTemplateResponse, status_code=201)
+async def upload_reference_image(
+    interview_id: int,
+    image: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_user)
+) -> Any:
+    """
+    Upload the candidate's reference photo for an interview. Only the
+    interviewer or an admin may.
+
+    The face is detected, aligned and embedded once, by a job on the media
+    workers' queue; only the embedding is stored, and live sessions of the
+    candidate's interviews are verified against it. Answers 202 with the job's
+    id if the job doesn't finish within REFERENCE_TEMPLATE_TIMEOUT.
+    """
+    interview = _get_interview(interview_id, db, current_user, upload=True)
+
+    # Read one byte past the limit to tell a full-size upload from a larger one
+    data = await image.read(settings.REFERENCE_IMAGE_MAX_BYTES + 1)
+    if len(data) > settings.REFERENCE_IMAGE_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Reference image too large")
+
+    path = await asyncio.to_thread(_save_upload, data)
+    job_id = await job_queue.enqueue(
+        "reference_template",
+        {
+            "path": path,
+            "interview_id": interview.id,
+            "candidate_id": interview.candidate_id,
+            "model_name": settings.DEEPFACE_MODEL,
+        },
+        priority=PRIORITY_REFERENCE_TEMPLATE
+    )
+
+    job = await job_queue.wait(job_id, settings.REFERENCE_TEMPLATE_TIMEOUT)
+    if job is None:
+        logger.info("Reference template job %s for interview %s still pending", job_id, interview.id)
+        return JSONResponse(
+            status_code=202,
+            content={"detail": "Reference image is being processed", "job_id": job_id}
+        )
+    if job["status"] == "failed":
+        logger.error("Reference template job %s failed: %s", job_id, job["last_error"])
+        raise HTTPException(status_code=500, detail="Could not process the reference image")
+    if "error" in job["result"]:
+        raise HTTPException(status_code=400, detail=job["result"]["error"])
+
+    return db.get(FaceTemplate, job["result"]["template_id"])
+
+
+@router.get("/{interview_id}/reference-image", response_model=FaceTemplateResponse)
+async def get_reference_image(
+    interview_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(deps.get_current_user)
+) -> Any:
+    """The reference template the interview's candidate will be verified against"""
+    interview = _get_interview(interview_id, db, current_user)
+
+    template = db.execute(latest_template_query(interview.candidate_id, interview.id)).scalars().first()
+    if not template:
+        raise HTTPException(status_code=404, detail="No reference image uploaded for this candidate")
+    return template
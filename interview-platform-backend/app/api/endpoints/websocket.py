@@ -1,18 +1,53 @@
 from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+import asyncio
+import importlib
 import json
 import logging
 import uuid
 
-from app.db.session import get_db
-from app.services.webrtc import WebRTCService
+from app.core import security
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal, get_db
+from app.models.user import User
+from app.services.media_rpc import relay_signaling
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Create a WebRTC service instance
-webrtc_service = WebRTCService()
+# Shared WebRTC service instance, created on first use. Importing it pulls in
+# aiortc, PyAV, OpenCV and the analysis stack, which workers that only serve
+# REST requests never need.
+webrtc_service = None
+
+async def get_webrtc_service():
+    """Return the WebRTC service, importing the media stack on first use"""
+    global webrtc_service
+    if webrtc_service is None:
+        # The import takes a while; keep serving other connections meanwhile
+        module = await asyncio.to_thread(importlib.import_module, "app.services.webrtc")
+        if webrtc_service is None:
+            webrtc_service = module.WebRTCService()
+            webrtc_service.start()
+    return webrtc_service
+
+async def get_websocket_user_id(websocket: WebSocket) -> Optional[int]:
+    """
+    The active user whose JWT the client passed as the `access_token` query
+    parameter (browsers can't set headers on websockets), or None
+    """
+    token = websocket.query_params.get("access_token")
+    if not token:
+        return None
+    payload = security.decode_token(token)
+    if payload is None or payload.get("sub") is None:
+        return None
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User.id).where(User.email == payload["sub"], User.is_active))
+        return result.scalar()
 
 @router.websocket("/ws/{connection_id}")
 async def websocket_endpoint(websocket: WebSocket, connection_id: str):
@@ -20,15 +55,25 @@ async def websocket_endpoint(websocket: WebSocket, connection_id: str):
     if not connection_id:
         connection_id = str(uuid.uuid4())
     
+    user_id = await get_websocket_user_id(websocket)
+    
+    if settings.SERVICE_ROLE == "signaling":
+        # Peer connections live on the media workers
+        await relay_signaling(websocket, connection_id, user_id)
+        return
+    
+    webrtc_service = await get_webrtc_service()
+    
     try:
         # Register the websocket connection
-        await webrtc_service.register_websocket(connection_id, websocket)
+        await webrtc_service.register_websocket(connection_id, websocket, user_id)
         
         # Send connection ID to the client
         await websocket.send_json({"type": "connection_id", "id": connection_id})
         
-        # Handle messages
-        while True:
+        # Handle messages until either side closes; the server closes the
+        # websocket itself once a "leave" has been handled
+        while websocket.application_state == WebSocketState.CONNECTED:
             try:
                 # Receive message from the client
                 message = await websocket.receive_json()
@@ -37,12 +82,12 @@ async def websocket_endpoint(websocket: WebSocket, connection_id: str):
                 await webrtc_service.handle_websocket_message(connection_id, message)
                 
             except json.JSONDecodeError:
-                logger.error(f"Invalid JSON received from {connection_id}")
+                logger.error("Invalid JSON received from %s", connection_id)
                 
     except WebSocketDisconnect:
-        logger.info(f"WebSocket disconnected for {connection_id}")
+        logger.info("WebSocket disconnected for %s", connection_id)
         await webrtc_service.close_peer_connection(connection_id)
         
     except Exception as e:
-        logger.error(f"Error in websocket connection for {connection_id}: {e}")
+        logger.error("Error in websocket connection for %s: %s", connection_id, e)
         await webrtc_service.close_peer_connection(connection_id)
\ No newline at end of file
@@ -0,0 +1,160 @@
+# app/api/responses.py
+import os
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from mimetypes import guess_type
+from typing import Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# Containers that mimetypes doesn't know about on every platform
+MEDIA_TYPES = {
+    ".mp4": "video/mp4",
+    ".webm": "video/webm",
+    ".mkv": "video/x-matroska",
+    ".jpg": "image/jpeg",
+}
+
+
+class RangeFileResponse(Response):
+    """
+    Serve a (possibly still growing) media file with HTTP Range support.
+
+    - Single byte ranges get a 206; multiple ranges fall back to the full
+      file, which RFC 9110 allows and which players never ask for anyway.
+    - ETag / Last-Modified are derived from the file's stat, and
+      If-None-Match / If-Modified-Since / If-Range are honoured.
+    - When the ASGI server supports the `http.response.zerocopysend`
+      extension the body is sent with sendfile, otherwise it is read in
+      chunks off the event loop.
+    """
+    chunk_size = 256 * 1024
+
+    def __init__(self, path: str, request_headers: Headers, cache_control: str = "private, max-age=0, must-revalidate"):
+        self.path = path
+        self.request_headers = request_headers
+        self.status_code = 200
+        self.background = None
+        self.media_type = MEDIA_TYPES.get(os.path.splitext(path)[1].lower()) or guess_type(path)[0] or "application/octet-stream"
+        self.init_headers({"accept-ranges": "bytes", "cache-control": cache_control})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise RuntimeError(f"File at path {self.path} is not a file.")
+
+        size = stat_result.st_size
+        etag = f'"{stat_result.st_mtime_ns:x}-{size:x}"'
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        self.headers["etag"] = etag
+        self.headers["last-modified"] = last_modified
+
+        if self._not_modified(etag, stat_result.st_mtime):
+            del self.headers["content-type"]
+            self.status_code = 304
+            await self._send_empty(send)
+            return
+
+        byte_range = None
+        if self._should_use_range(etag, last_modified):
+            try:
+                byte_range = self._parse_range(self.request_headers.get("range"), size)
+            except ValueError:
+                self.status_code = 416
+                self.headers["content-range"] = f"bytes */{size}"
+                await self._send_empty(send)
+                return
+
+        if byte_range is None:
+            start, length = 0, size
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+        self.headers["content-length"] = str(length)
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD" or length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        fd = await anyio.to_thread.run_sync(os.open, self.path, os.O_RDONLY)
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": fd,
+                    "offset": start,
+                    "count": length,
+                    "more_body": False,
+                })
+            else:
+                await self._send_chunks(send, fd, start, length)
+        finally:
+            os.close(fd)
+
+    async def _send_chunks(self, send: Send, fd: int, offset: int, remaining: int) -> None:
+        while remaining > 0:
+            chunk = await anyio.to_thread.run_sync(os.pread, fd, min(self.chunk_size, remaining), offset)
+            if not chunk:
+                # The file was truncated underneath us. Finishing the response
+                # would hand the client a short body as if it were complete;
+                # raising aborts it, and the server resets the connection
+                raise OSError(f"{self.path} was truncated while being sent, {remaining} bytes short")
+            offset += len(chunk)
+            remaining -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+
+    async def _send_empty(self, send: Send) -> None:
+        self.headers["content-length"] = "0"
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    def _not_modified(self, etag: str, mtime: float) -> bool:
+        if_none_match = self.request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags
+
+        if_modified_since = self.request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _should_use_range(self, etag: str, last_modified: str) -> bool:
+        if "range" not in self.request_headers:
+            return False
+        if_range = self.request_headers.get("if-range")
+        return if_range is None or if_range in (etag, last_modified)
+
+    @staticmethod
+    def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+        """Return an inclusive (start, end) range, None to send everything, or raise ValueError if unsatisfiable"""
+        unit, _, ranges = header.partition("=")
+        if unit.strip().lower() != "bytes" or "," in ranges:
+            return None
+
+        first, _, last = ranges.strip().partition("-")
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else size - 1
+            else:
+                # Suffix range: the last N bytes
+                start = max(size - int(last), 0)
+                end = size - 1
+        except ValueError:
+            # Malformed ranges are ignored rather than rejected
+            return None
+
+        end = min(end, size - 1)
+        if start >= size or start > end:
+            raise ValueError("Range not satisfiable")
+        return start, end
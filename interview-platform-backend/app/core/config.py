@@ -7,9 +7,19 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+SERVICE_ROLES = ("api", "signaling", "media", "all")
+
 class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     PROJECT_NAME: str = "Interview Platform"
+
+    # Deployment role of this process:
+    # "api"       - REST endpoints
+    # "signaling" - websocket signaling, relayed to MEDIA_WORKERS
+    # "media"     - WebRTC media, recording, analysis and post-processing,
+    #               driven by signaling workers over the internal media RPC
+    # "all"       - everything in one process
+    SERVICE_ROLE: str = "all"
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8  # 8 days
 
@@ -25,14 +35,148 @@ class Settings(BaseSettings):
     SQLALCHEMY_DATABASE_URI: Optional[str] = None
     # ASYNC_SQLALCHEMY_DATABASE_URI will hold the URL for the asynchronous engine (postgresql+asyncpg://...)
     ASYNC_SQLALCHEMY_DATABASE_URI: Optional[str] = None
+    # Connection pools (applied to both the sync and the async engine)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 5  # extra connections allowed under load, closed again when returned
+    DB_POOL_TIMEOUT: float = 5.0  # seconds to wait for a connection before failing the request
+    DB_POOL_RECYCLE: int = 240  # seconds; below Neon's 5 minute idle suspend, so pooled connections stay valid
+    # Pinging on checkout costs a round trip per request; with DB_POOL_RECYCLE below
+    # the server's idle timeout it can be turned off, leaving stale connections to be
+    # invalidated (and the pool refreshed) on first use
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_USE_LIFO: bool = True  # reuse the most recent connection so surplus ones idle out and get recycled
+    DB_POOL_PREFILL: int = 2  # connections opened in each pool during startup warm-up
 
     # WebRTC
     STUN_SERVERS: List[str] = ["stun:stun.l.google.com:19302"]
     TURN_SERVERS: List[Dict[str, Any]] = []
 
+    # Negotiation profile applied to every peer connection (see app/services/media_profiles.py):
+    # codec preferences and video caps, trading recording fidelity against server decode CPU
+    WEBRTC_PROFILE: str = "default"
+    WEBRTC_PROFILES: Dict[str, Dict[str, Any]] = {
+        "default": {},
+        # Just enough for facial analysis; cheapest to decode and record
+        "analysis-lite": {
+            "video_codecs": ["VP8"], "max_video_bitrate": 500,  # kbit/s
+            "max_width": 640, "max_height": 480, "max_framerate": 15
+        },
+        # H264 first, so passthrough recordings can be remuxed to MP4 without transcoding
+        "archive-hq": {
+            "video_codecs": ["H264", "VP8"], "max_video_bitrate": 2500,
+            "max_width": 1280, "max_height": 720, "max_framerate": 30
+        },
+    }
+
+    # Sessions that are idle or stuck are torn down by a periodic reaper on media workers.
+    # Clients answer the server's {"type": "ping"} with {"type": "pong"}; a websocket is
+    # only considered idle while its peer connection isn't connected
+    SESSION_REAPER_INTERVAL: float = 15.0  # seconds between sweeps, also the ping interval
+    WEBSOCKET_IDLE_TIMEOUT: float = 120.0  # seconds without any message from the client
+    PEER_SETUP_TIMEOUT: float = 60.0  # seconds a peer connection may take to connect
+    PEER_DISCONNECTED_TIMEOUT: float = 30.0  # seconds a peer may stay disconnected or failed
+
+    # Admission control on media workers: new interviews are refused with a retry hint once
+    # any load signal reaches its limit, and live analysis is slowed down before that
+    ADMISSION_CONTROL_ENABLED: bool = True
+    ADMISSION_MAX_SESSIONS: int = 40  # peer connections, including participants joining running interviews
+    ADMISSION_RESERVED_SESSIONS: int = 4  # of those, kept free for participants of running interviews
+    ADMISSION_MAX_ENCODERS: int = 40  # forwarded tracks plus transcoding recorders, each encoding video
+    ADMISSION_MAX_ANALYSIS_QUEUE: int = 50  # queued offline analysis jobs
+    ADMISSION_MAX_LOOP_LAG: float = 0.1  # seconds, smoothed
+    ADMISSION_DEGRADE_AT: float = 0.75  # share of a limit from which live analysis is slowed down
+    ADMISSION_DEGRADED_ANALYSIS_FACTOR: float = 3.0  # multiplier on SPOOFING_DETECTION_INTERVAL meanwhile
+    ADMISSION_RETRY_AFTER: int = 30  # seconds refused clients are told to wait
+    ADMISSION_REDIRECT_URL: str = ""  # signaling URL of another deployment for refused clients
+    ADMISSION_REFRESH_INTERVAL: float = 5.0  # seconds between load samples
+
+    # Graceful drain of media workers before shutdown (POST /admin/drain, e.g. from a preStop
+    # hook, and again on shutdown): new sessions are refused, clients are told to reconnect
+    # elsewhere, live analysis is saved and the remaining sessions' recordings are finalised
+    DRAIN_TIMEOUT: float = 30.0  # seconds the whole drain may take
+    DRAIN_GRACE_PERIOD: float = 10.0  # seconds clients get to leave by themselves
+
+    RECORDINGS_DIR: str = "recordings"
+
+    # Internal media RPC between signaling and media workers
+    MEDIA_RPC_HOST: str = "127.0.0.1"  # address media workers listen on
+    MEDIA_RPC_PORT: int = 8765
+    MEDIA_RPC_TOKEN: str = ""  # shared secret; required unless media workers listen on loopback only
+    MEDIA_WORKERS: List[str] = ["127.0.0.1:8765"]  # host:port of media workers; rooms are spread across them
+
+    # Recording: "transcode" re-encodes to MP4 while recording, "passthrough"
+    # stores the received encoded frames and defers remuxing/transcoding
+    RECORDING_MODE: str = "transcode"
+    RECORDING_TRANSCODE: bool = False  # transcode passthrough recordings to MP4 in the background
+    RECORDING_KEYFRAME_INTERVAL: int = 10  # seconds between extracted key frames
+    RECORDING_MAX_KEYFRAMES: int = 360
+
+    # Background jobs (post-processing of recordings)
+    # Kept outside RECORDINGS_DIR, whose files are listed by the recordings API
+    JOB_QUEUE_PATH: str = "data/jobs.sqlite3"
+    JOB_WORKERS: int = max(1, (os.cpu_count() or 2) - 1)
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_DELAY: int = 30  # seconds, doubled on every retry
+    JOB_POLL_INTERVAL: int = 5  # seconds
+    ANALYSIS_JOB_CONCURRENCY: int = 1
+    OFFLINE_ANALYSIS_ENABLED: bool = True
+    OFFLINE_ANALYSIS_INTERVAL: int = 2  # seconds of video between analyzed frames
+
+    # Logging (queued and written by a background thread; see app/utils/logging.py)
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # "json" (one object per line) or "text"
+    LOG_FILE: str = "interview_platform.log"  # empty to log to stdout only
+    LOG_QUEUE_SIZE: int = 10000  # records waiting to be written; further records are dropped
+    LOG_RATE_LIMIT: float = 10.0  # records per second per call site of the loggers below; 0 disables
+    LOG_RATE_LIMITED_LOGGERS: List[str] = [
+        "app.services.webrtc", "app.services.facial_analysis", "app.services.media_rpc", "aiortc", "aioice"
+    ]
+
+    # Tracing: spans for REST requests, signaling messages, negotiation and analysis
+    # stages, exported as OTLP/JSON to a file and/or an OTLP/HTTP collector
+    TRACING_ENABLED: bool = False
+    TRACING_SAMPLE_RATE: float = 1.0  # share of traces recorded
+    TRACING_EXPORT_PATH: str = "data/traces.jsonl"  # empty to disable the file export
+    TRACING_ENDPOINT: str = ""  # e.g. http://localhost:4318/v1/traces
+    TRACING_EXPORT_INTERVAL: float = 5.0  # seconds between batched exports
+
+    # Metrics exposed at /metrics in the Prometheus text format; when off the
+    # endpoint isn't mounted and instrumented code paths skip all bookkeeping
+    METRICS_ENABLED: bool = True
+
+    # Event loop monitoring: lag probes and callbacks blocking the loop, logged and exported as metrics
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_LAG_SAMPLE_INTERVAL: float = 0.25  # seconds between lag probes
+    LOOP_SLOW_CALLBACK_THRESHOLD: float = 0.1  # seconds a callback may hold the loop before it is reported
+    LOOP_DEBUG: bool = False  # asyncio debug mode as well; much slower, for staging only
+
+    # Health checks (run in the background; endpoints report cached results)
+    HEALTH_CHECK_INTERVAL: float = 10.0  # seconds between probes
+    HEALTH_CHECK_TIMEOUT: float = 3.0  # seconds before a component check counts as failed
+    HEALTH_MIN_FREE_DISK_MB: int = 1024  # recordings volume; degraded below twice this
+    HEALTH_MAX_ANALYSIS_QUEUE_DEPTH: int = 50  # queued analysis jobs before reporting degraded
+
     # DeepFace
     DEEPFACE_MODEL: str = "VGG-Face"
+    WARM_UP_MODELS: bool = True  # load the facial models during startup on media workers
     SPOOFING_DETECTION_INTERVAL: int = 5  # seconds
+    REFERENCE_IMAGE_MAX_BYTES: int = 5 * 1024 * 1024  # largest reference photo accepted for upload
+    # seconds an upload waits for the media workers' job queue to embed the photo
+    # before answering 202; API workers must share JOB_QUEUE_PATH with the host's media workers
+    REFERENCE_TEMPLATE_TIMEOUT: float = 30.0
+    # Cross-interview identity checks: when a verified candidate's session ends,
+    # its face embeddings are searched against the templates of all other users
+    FACE_INDEX_ENABLED: bool = True
+    FACE_INDEX_PATH: str = "data/face_index"  # memory-mapped snapshot of the index; empty to keep it in memory
+    # Cosine distance counting as the same face; the model's verification
+    # threshold when unset, though large template counts call for a stricter one
+    FACE_INDEX_MAX_DISTANCE: Optional[float] = None
+    FACE_INDEX_SESSION_EMBEDDINGS: int = 20  # frame embeddings kept per session for the check
+    ANALYSIS_FRAME_INTERVAL: int = 30  # analyze every Nth frame the analyzer receives
+    # Per-stage timings of analysed frames, kept per session and reported by
+    # the admin profiling endpoint; can also be switched on for single sessions
+    ANALYSIS_PROFILING: bool = False
+    ANALYSIS_PROFILE_BUFFER_SIZE: int = 500  # frames kept per session
 
     class Config:
         case_sensitive = True
@@ -40,6 +184,12 @@ class Settings(BaseSettings):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
+        if self.SERVICE_ROLE not in SERVICE_ROLES:
+            raise ValueError(f"SERVICE_ROLE must be one of {', '.join(SERVICE_ROLES)}, got {self.SERVICE_ROLE!r}")
+
+        if self.WEBRTC_PROFILE not in self.WEBRTC_PROFILES:
+            raise ValueError(f"WEBRTC_PROFILE must be one of {', '.join(self.WEBRTC_PROFILES)}, got {self.WEBRTC_PROFILE!r}")
+
         # Parse and configure Neon PostgreSQL connection
         if not self.DATABASE_URL:
              raise ValueError("DATABASE_URL environment variable is required for database connection") # Raised if empty string default is used
@@ -62,5 +212,9 @@ class Settings(BaseSettings):
         else:
              self.ASYNC_SQLALCHEMY_DATABASE_URI = f"postgresql+asyncpg://{username}:{password}@{hostname}{path}?ssl=require"
 
+    def runs_role(self, role: str) -> bool:
+        """Whether this process takes on the given deployment role"""
+        return self.SERVICE_ROLE in (role, "all")
+
 
 settings = Settings()
\ No newline at end of file
@@ -1,51 +1,89 @@
 # app/core/events.py
+import asyncio
 import logging
-from typing import Callable
-from fastapi import FastAPI
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
-def create_start_app_handler(app: FastAPI) -> Callable:
-    """
-    Returns a function that executes on application startup.
-    """
-    async def start_app() -> None:
-        logger.info("--- Application Startup ---")
-        # Example: Initialize database connections, load ML models, etc.
-        # try:
-        #     await connect_to_database()
-        #     logger.info("Database connection established.")
-        # except Exception as e:
-        #     logger.error(f"Failed to connect to database: {e}")
-
-        # try:
-        #     await load_machine_learning_models()
-        #     logger.info("Machine learning models loaded.")
-        # except Exception as e:
-        #     logger.error(f"Failed to load ML models: {e}")
-        logger.info("Application startup tasks completed.")
-
-    return start_app
-
-def create_stop_app_handler(app: FastAPI) -> Callable:
+# Seconds between attempts of a required warm-up step that failed
+WARMUP_RETRY_DELAY = 5.0
+
+
+class StartupState:
     """
-    Returns a function that executes on application shutdown.
+    Tracks the warm-up phase of application startup.
+
+    The process is live as soon as it serves requests, but it only becomes
+    ready once every warm-up step (filling connection pools, loading models,
+    ...) has finished. The steps run concurrently in the background, so
+    liveness probes are answered while they run and load balancers only route
+    traffic to the process once it is warm.
+
+    Required steps are retried until they succeed; optional ones are tried
+    once, and a failure is reported but doesn't block readiness.
     """
-    async def stop_app() -> None:
-        logger.info("--- Application Shutdown ---")
-        # Example: Close database connections, release resources, etc.
-        # try:
-        #     await close_database_connection()
-        #     logger.info("Database connection closed.")
-        # except Exception as e:
-        #     logger.error(f"Failed to close database connection: {e}")
-        logger.info("Application shutdown tasks completed.")
-
-    return stop_app
-
-# Usage in main.py:
-# from app.core.events import create_start_app_handler, create_stop_app_handler
-#
-# app = FastAPI(...)
-# app.add_event_handler("startup", create_start_app_handler(app))
-# app.add_event_handler("shutdown", create_stop_app_handler(app))
+
+    def __init__(self):
+        self.ready = False
+        self.draining = False
+        self.started_at = time.time()
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self._warmups: List[Tuple[str, Callable[[], Awaitable], bool]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def add_warmup(self, name: str, step: Callable[[], Awaitable], required: bool = True) -> None:
+        """Register a warm-up step; must be called before start()"""
+        self._warmups.append((name, step, required))
+        self.steps[name] = {"status": "pending", "required": required}
+
+    def start(self) -> None:
+        """Run the warm-up steps concurrently in the background"""
+        self.started_at = time.time()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Mark the process as not ready and cancel unfinished warm-up steps"""
+        self.ready = False
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def mark_draining(self) -> None:
+        """Report the process as not ready, so load balancers stop routing to it, for good"""
+        self.draining = True
+        self.ready = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "draining": self.draining, "started_at": self.started_at, "steps": self.steps}
+
+    async def _run(self) -> None:
+        await asyncio.gather(*(self._run_step(*warmup) for warmup in self._warmups))
+        self.ready = not self.draining
+        logger.info("Application ready after %.2fs", time.time() - self.started_at)
+
+    async def _run_step(self, name: str, step: Callable[[], Awaitable], required: bool) -> None:
+        started = time.perf_counter()
+        attempts = 0
+        while True:
+            attempts += 1
+            self.steps[name].update(status="running", attempts=attempts)
+            try:
+                await step()
+            except Exception as e:
+                logger.error("Startup step %s failed (attempt %s): %s", name, attempts, e)
+                self.steps[name].update(status="failed", error=str(e))
+                if not required:
+                    return
+                await asyncio.sleep(WARMUP_RETRY_DELAY)
+                continue
+
+            duration = time.perf_counter() - started
+            self.steps[name].update(status="ok", error=None, duration=round(duration, 3))
+            logger.info("Startup step %s finished in %.2fs", name, duration)
+            return
+
+
+# Startup state of this process, reported by the readiness endpoint
+startup_state = StartupState()
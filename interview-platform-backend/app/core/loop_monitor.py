@@ -0,0 +1,144 @@
+# app/core/loop_monitor.py
+"""
+Event loop health: lag sampling and slow callback detection.
+
+Media transport, signaling and analysis share one asyncio loop, so any call
+that blocks it (DeepFace, bcrypt, sync SQLAlchemy, the Python LBP loop) stalls
+every session on the worker. The monitor measures how late the loop runs and
+reports each callback that held it longer than a threshold, together with the
+task and coroutine it belonged to.
+"""
+import asyncio
+import logging
+import time
+from typing import Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest sample in the smoothed lag
+LAG_SMOOTHING = 0.2
+
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LOOP_LAG_SECONDS = Histogram("event_loop_lag_seconds", "How late periodic lag probes ran", buckets=LAG_BUCKETS)
+LOOP_LAG_MAX_SECONDS = Gauge("event_loop_lag_max_seconds", "Largest loop lag since the previous scrape")
+SLOW_CALLBACK_SECONDS = Histogram(
+    "event_loop_slow_callback_seconds",
+    "Duration of callbacks that blocked the loop longer than the threshold",
+    buckets=LAG_BUCKETS
+)
+SLOW_CALLBACKS = Counter(
+    "event_loop_slow_callbacks_total",
+    "Callbacks that blocked the loop longer than the threshold, by coroutine or function",
+    ["callback"]
+)
+
+
+def describe_handle(handle: asyncio.Handle) -> Tuple[str, str]:
+    """
+    The code a loop callback ran, as (callback, details).
+
+    callback is a bounded name fit for a metric label (the coroutine's or
+    function's qualified name); details adds the task name and where the
+    coroutine is suspended now, i.e. just after the code that blocked.
+    """
+    callback = getattr(handle, "_callback", None)
+    owner = getattr(callback, "__self__", None)
+    if isinstance(owner, asyncio.Task):
+        coro = owner.get_coro()
+        name = getattr(coro, "__qualname__", type(coro).__name__)
+        frame = getattr(coro, "cr_frame", None)
+        location = f" at {frame.f_code.co_filename}:{frame.f_lineno}" if frame else ""
+        return name, f"task {owner.get_name()!r} running {name}{location}"
+    name = getattr(callback, "__qualname__", None) or repr(callback)
+    return name, f"callback {name}"
+
+
+class LoopMonitor:
+    """
+    Samples loop lag and reports slow callbacks.
+
+    Lag is how much later than scheduled a periodic probe wakes up. Slow
+    callbacks are found by timing every callback the loop runs, which costs a
+    clock read before and after each one; with LOOP_DEBUG asyncio's own debug
+    mode reports them as well, at a much higher cost.
+    """
+
+    def __init__(self, interval: float = None, threshold: float = None):
+        self.interval = interval or settings.LOOP_LAG_SAMPLE_INTERVAL
+        self.threshold = threshold or settings.LOOP_SLOW_CALLBACK_THRESHOLD
+        self.max_lag = 0.0
+        # Exponentially smoothed lag, for decisions that shouldn't react to a single spike
+        self.recent_lag = 0.0
+        self.slow_callbacks = 0
+        self._task: Optional[asyncio.Task] = None
+        self._original_run = None
+        LOOP_LAG_MAX_SECONDS.set_function(self._collect_max_lag)
+
+    def start(self) -> None:
+        if self._task:
+            return
+        loop = asyncio.get_running_loop()
+        if settings.LOOP_DEBUG:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+        self._install()
+        self._task = asyncio.create_task(self._sample(), name="loop-lag-monitor")
+
+    async def stop(self) -> None:
+        self._uninstall()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def report_slow_callback(self, handle: asyncio.Handle, duration: float) -> None:
+        callback, details = describe_handle(handle)
+        self.slow_callbacks += 1
+        SLOW_CALLBACKS.labels(callback).inc()
+        SLOW_CALLBACK_SECONDS.observe(duration)
+        logger.warning("Event loop blocked for %.3fs by %s", duration, details)
+
+    def _install(self) -> None:
+        # Only the pure Python loop runs Handle._run; other loops (uvloop) are
+        # left alone and rely on the lag sampler and LOOP_DEBUG
+        if not isinstance(asyncio.get_running_loop(), asyncio.BaseEventLoop):
+            logger.info("Slow callback detection is unavailable on this event loop")
+            return
+        original_run = self._original_run = asyncio.Handle._run
+        monitor = self
+        threshold = self.threshold
+
+        def _run(handle):
+            started = time.perf_counter()
+            original_run(handle)
+            duration = time.perf_counter() - started
+            if duration >= threshold:
+                monitor.report_slow_callback(handle, duration)
+
+        asyncio.Handle._run = _run
+
+    def _uninstall(self) -> None:
+        if self._original_run is not None:
+            asyncio.Handle._run = self._original_run
+            self._original_run = None
+
+    def _collect_max_lag(self) -> float:
+        max_lag, self.max_lag = self.max_lag, 0.0
+        return max_lag
+
+    async def _sample(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+            LOOP_LAG_SECONDS.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            self.recent_lag += LAG_SMOOTHING * (lag - self.recent_lag)
+
+
+# Loop monitor of this process, started with the application
+loop_monitor = LoopMonitor()
@@ -0,0 +1,252 @@
+# app/core/metrics.py
+"""
+A small Prometheus-compatible metrics registry.
+
+Counters, gauges and histograms are declared at module level next to the code
+they measure and rendered in the Prometheus text format by the `/metrics`
+endpoint. Updating a metric is a dict lookup plus an addition under a lock;
+with METRICS_ENABLED off every update returns immediately.
+"""
+import os
+import resource
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from app.core.config import settings
+
+# Latency buckets in seconds, from sub-millisecond dispatches to multi-second inference
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Holds every metric of the process and renders them for scraping"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric") -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry(enabled=settings.METRICS_ENABLED)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: MetricsRegistry = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry or REGISTRY
+        self._lock = threading.Lock()
+        self._children: Dict[LabelValues, object] = {}
+        self.registry.register(self)
+
+    def labels(self, *values: str):
+        """The child metric for a combination of label values"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class _Value:
+    __slots__ = ("metric", "value")
+
+    def __init__(self, metric: Metric):
+        self.metric = metric
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        if not self.metric.registry.enabled:
+            return
+        with self.metric._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def set(self, value: float) -> None:
+        if self.metric.registry.enabled:
+            self.value = value
+
+
+class _ValueMetric(Metric):
+    """
+    Base for counters and gauges.
+
+    Values can also be computed at scrape time with set_function(), which
+    costs nothing between scrapes. The function returns a number, or a dict
+    mapping label value tuples to numbers for labelled metrics.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function: Optional[Callable[[], Union[float, Dict[LabelValues, float]]]] = None
+
+    def _new_child(self):
+        return _Value(self)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def set_function(self, function: Callable[[], Union[float, Dict[LabelValues, float]]]) -> None:
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            try:
+                values = self._function()
+            except Exception:
+                return
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            values = {key: child.value for key, child in list(self._children.items())}
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Counter(_ValueMetric):
+    """A monotonically increasing count; names should end in `_total`"""
+    type = "counter"
+
+
+class Gauge(_ValueMetric):
+    """A value that goes up and down"""
+    type = "gauge"
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+
+class _HistogramValue:
+    __slots__ = ("metric", "counts", "sum", "count")
+
+    def __init__(self, metric: "Histogram"):
+        self.metric = metric
+        self.counts = [0] * (len(metric.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        if not self.metric.registry.enabled:
+            return
+        index = bisect_left(self.metric.buckets, value)
+        with self.metric._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self) -> "_Timer":
+        """Context manager observing the duration of its block"""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child: _HistogramValue):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class Histogram(Metric):
+    """Observations counted into cumulative buckets, plus their sum and count"""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: MetricsRegistry = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def samples(self):
+        for key, child in list(self._children.items()):
+            with self._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+# --- Process metrics ---
+
+def _resident_memory_bytes() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Peak rather than current RSS where /proc isn't available (kilobytes on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+PROCESS_CPU_SECONDS = Counter("process_cpu_seconds_total", "Total user and system CPU time spent in seconds")
+PROCESS_CPU_SECONDS.set_function(time.process_time)
+PROCESS_RESIDENT_MEMORY = Gauge("process_resident_memory_bytes", "Resident memory size in bytes")
+PROCESS_RESIDENT_MEMORY.set_function(_resident_memory_bytes)
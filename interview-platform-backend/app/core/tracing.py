@@ -0,0 +1,355 @@
+# app/core/tracing.py
+"""
+Lightweight request-scoped tracing with an OTLP-compatible exporter.
+
+Spans nest through a context variable, so a span opened while another is
+current (in the same task, or in a task created from it) becomes its child.
+Long-lived background work started from within a span, whose own spans
+shouldn't all join that trace, runs in a detached_context().
+Finished spans are batched and written by a background thread as OTLP/JSON,
+one export request per line, to TRACING_EXPORT_PATH (the format of the
+OpenTelemetry collector's file exporter) and/or POSTed to an OTLP/HTTP
+collector at TRACING_ENDPOINT.
+
+With TRACING_ENABLED off, opening a span returns a shared no-op span.
+"""
+import atexit
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.request
+from collections import deque
+from contextvars import Context, ContextVar, copy_context
+from typing import Any, Deque, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+# OTLP status codes
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# Queued spans that trigger an export before the interval is up
+EXPORT_BATCH_SIZE = 512
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class Span:
+    """A timed operation; use as a context manager to make it the current span"""
+
+    __slots__ = (
+        "tracer", "name", "kind", "trace_id", "span_id", "parent_id", "sampled",
+        "start_ns", "end_ns", "attributes", "status", "status_message", "_token"
+    )
+
+    def __init__(self, tracer: "Tracer", name: str, trace_id: str, parent_id: Optional[str],
+                 sampled: bool, kind: int = KIND_INTERNAL, attributes: Dict[str, Any] = None):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = dict(attributes or {})
+        self.status = STATUS_UNSET
+        self.status_message = ""
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, error: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if self.sampled:
+                self.tracer.exporter.export(self)
+
+    def traceparent(self) -> str:
+        """W3C trace context header value for propagating this span"""
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None:
+            self.set_error(exc)
+        _current_span.reset(self._token)
+        self.end()
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": self.status, "message": self.status_message},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """Stands in for a span when tracing is off"""
+
+    trace_id = None
+    sampled = False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_error(self, error: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class SpanExporter:
+    """
+    Batches finished spans and writes them from a background thread.
+
+    At most max_queue spans wait for export; older ones are dropped when
+    spans are produced faster than they can be written.
+    """
+
+    def __init__(self, path: str = "", endpoint: str = "", service_name: str = "",
+                 interval: float = 5.0, max_queue: int = 10000):
+        self.path = path
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.interval = interval
+        self._spans: Deque[Span] = deque(maxlen=max_queue)
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        self._spans.append(span)
+        if self._thread is None:
+            self._start()
+        elif len(self._spans) >= EXPORT_BATCH_SIZE:
+            self._wakeup.set()
+
+    def flush(self) -> None:
+        """Write all queued spans now"""
+        with self._lock:
+            spans = []
+            while self._spans:
+                spans.append(self._spans.popleft())
+            if not spans:
+                return
+            payload = json.dumps(self._request(spans))
+            if self.path:
+                try:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    with open(self.path, "a") as f:
+                        f.write(payload + "\n")
+                except OSError as e:
+                    logger.error("Failed to write %s spans to %s: %s", len(spans), self.path, e)
+            if self.endpoint:
+                request = urllib.request.Request(
+                    self.endpoint, data=payload.encode(), headers={"Content-Type": "application/json"}
+                )
+                try:
+                    urllib.request.urlopen(request, timeout=5).close()
+                except OSError as e:
+                    logger.error("Failed to export %s spans to %s: %s", len(spans), self.endpoint, e)
+
+    def _request(self, spans: List[Span]) -> Dict[str, Any]:
+        resource = {"service.name": self.service_name, "service.role": settings.SERVICE_ROLE, "process.pid": os.getpid()}
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes(resource)},
+                "scopeSpans": [{
+                    "scope": {"name": "app.core.tracing"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Span export failed: %s", e)
+
+
+class Tracer:
+    """Creates spans; traces are sampled as a whole at their root span"""
+
+    def __init__(self, enabled: bool, sample_rate: float, exporter: SpanExporter):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+    def span(self, name: str, attributes: Dict[str, Any] = None, kind: int = KIND_INTERNAL,
+             traceparent: str = None):
+        """
+        Open a span, child of the current span or of an incoming traceparent.
+
+        Spans without a parent start a new trace, which is recorded with
+        probability TRACING_SAMPLE_RATE; the spans of an unsampled trace are
+        tracked for propagation but never exported.
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        parent = _current_span.get()
+        if parent is not None:
+            return Span(self, name, parent.trace_id, parent.span_id, parent.sampled, kind, attributes)
+        remote = parse_traceparent(traceparent) if traceparent else None
+        if remote:
+            trace_id, parent_id, sampled = remote
+            return Span(self, name, trace_id, parent_id, sampled, kind, attributes)
+        sampled = self.sample_rate >= 1.0 or random.random() < self.sample_rate
+        return Span(self, name, os.urandom(16).hex(), None, sampled, kind, attributes)
+
+    def current_span(self):
+        return _current_span.get() or NOOP_SPAN
+
+
+def detached_context() -> Context:
+    """
+    A copy of the current context without a current span. Tasks created in
+    it (e.g. with context.run(asyncio.create_task, coro)) start a new,
+    separately sampled trace with every span opened outside another one.
+    """
+    context = copy_context()
+    context.run(_current_span.set, None)
+    return context
+
+
+def parse_traceparent(header: str) -> Optional[tuple]:
+    """(trace_id, parent span_id, sampled) from a W3C traceparent header"""
+    parts = header.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3][:2], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def _route_template(scope) -> Optional[str]:
+    """
+    Path template of the matched route, including the prefixes of the
+    routers it was included from (route.path is relative to its router).
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if not template:
+        return None
+    try:
+        relative = template.format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return template
+    path = scope["path"]
+    return path[:len(path) - len(relative)] + template if path.endswith(relative) else template
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a server span for every HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        traceparent = headers.get(b"traceparent", b"").decode("latin-1") or None
+        span = tracer.span(
+            f"{scope['method']} {scope['path']}",
+            {"http.method": scope["method"], "http.target": scope["path"]},
+            kind=KIND_SERVER,
+            traceparent=traceparent
+        )
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    span.status = STATUS_ERROR
+            await send(message)
+
+        with span:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                # Name the span after the route template rather than the raw path
+                template = _route_template(scope)
+                if template:
+                    span.name = f"{scope['method']} {template}"
+                    span.set_attribute("http.route", template)
+
+
+# Tracer of this process
+tracer = Tracer(
+    enabled=settings.TRACING_ENABLED,
+    sample_rate=settings.TRACING_SAMPLE_RATE,
+    exporter=SpanExporter(
+        path=settings.TRACING_EXPORT_PATH,
+        endpoint=settings.TRACING_ENDPOINT,
+        service_name=settings.PROJECT_NAME,
+        interval=settings.TRACING_EXPORT_INTERVAL
+    )
+)
@@ -4,4 +4,5 @@ from app.db.base_class import Base
 from app.models.user import User
 from app.models.interview import Interview
 from app.models.analysis import Analysis
+from app.models.face_template import FaceTemplate
 # Import all models here
\ No newline at end of file
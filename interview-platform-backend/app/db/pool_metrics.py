@@ -0,0 +1,168 @@
+# app/db/pool_metrics.py
+"""
+Instrumentation for the SQLAlchemy connection pools.
+
+Counts connects, checkouts, checkins and invalidations from pool events, and
+times how long checkouts wait for a connection, so pool size and overflow can
+be set from data rather than guessed. Query latency is timed from cursor
+events into the application's metrics registry.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Type
+
+from sqlalchemy import event
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool, QueuePool
+
+from app.core.metrics import Counter, Gauge, Histogram
+
+QUERY_SECONDS = Histogram("db_query_seconds", "Time spent executing database statements", ["engine"])
+QUERY_ERRORS = Counter("db_query_errors_total", "Database statements that raised", ["engine"])
+POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections currently checked out of the pool", ["engine"])
+POOL_OVERFLOW = Gauge("db_pool_overflow", "Connections open beyond the pool size", ["engine"])
+POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "Connections checked out of the pool", ["engine"])
+POOL_TIMEOUTS = Counter("db_pool_timeouts_total", "Checkouts that timed out waiting for a connection", ["engine"])
+POOL_WAIT_SECONDS = Counter("db_pool_wait_seconds_total", "Time spent waiting to check out a connection", ["engine"])
+
+
+class PoolMetrics:
+    """Counters for one engine's connection pool"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.overflow_max = 0
+
+    def attach(self, engine: Engine) -> None:
+        """Listen to the pool events of an engine (and of pools it recreates on dispose)"""
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        event.listen(engine, "soft_invalidate", self._on_soft_invalidate)
+
+    def record_wait(self, seconds: float, overflow: int, timed_out: bool = False) -> None:
+        with self._lock:
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            self.overflow_max = max(self.overflow_max, overflow)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self, pool: Pool) -> Dict[str, Any]:
+        """Current pool state and counters since startup"""
+        with self._lock:
+            stats = {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "soft_invalidations": self.soft_invalidations,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": self.wait_seconds_total,
+                "wait_seconds_max": self.wait_seconds_max,
+                "wait_seconds_avg": self.wait_seconds_total / self.checkouts if self.checkouts else 0.0,
+                "overflow_max": self.overflow_max,
+            }
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=pool.overflow(),
+            )
+        return stats
+
+    def _increment(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _on_connect(self, dbapi_connection, connection_record) -> None:
+        self._increment("connects")
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        self._increment("checkouts")
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        self._increment("checkins")
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception) -> None:
+        self._increment("invalidations")
+
+    def _on_soft_invalidate(self, dbapi_connection, connection_record, exception) -> None:
+        self._increment("soft_invalidations")
+
+
+def instrumented_pool_class(base: Type[QueuePool], metrics: PoolMetrics) -> Type[QueuePool]:
+    """
+    Subclass a queue pool to time checkouts.
+
+    Pool events fire only once a connection has been handed out, so the wait
+    itself (for a free connection, or to open a new one) is timed here.
+    """
+
+    class InstrumentedPool(base):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except sa_exc.TimeoutError:
+                metrics.record_wait(time.perf_counter() - started, self.overflow(), timed_out=True)
+                raise
+            metrics.record_wait(time.perf_counter() - started, self.overflow())
+            return connection
+
+    InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+    return InstrumentedPool
+
+
+def instrument_queries(engine: Engine, name: str) -> None:
+    """Observe the execution time of every statement run on an engine, and count those that fail"""
+    histogram = QUERY_SECONDS.labels(name)
+    errors = QUERY_ERRORS.labels(name)
+
+    # The start time is kept on the statement's execution context, which
+    # neither outlives the statement nor is shared with other statements
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "query_started", None)
+        if started is not None:
+            histogram.observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # Also called for failed connection attempts, which aren't statements
+        if exception_context.statement is None:
+            return
+        errors.inc()
+        started = getattr(exception_context.execution_context, "query_started", None)
+        if started is not None:
+            histogram.observe(time.perf_counter() - started)
+
+
+def export_pool_metrics(get_stats: Callable[[], Dict[str, Dict[str, Any]]]) -> None:
+    """Expose the pools' stats, keyed by engine name, in the metrics registry at scrape time"""
+
+    def by_engine(key: str) -> Callable[[], Dict[tuple, float]]:
+        return lambda: {(name,): stats.get(key, 0) for name, stats in get_stats().items()}
+
+    POOL_CHECKED_OUT.set_function(by_engine("checked_out"))
+    POOL_OVERFLOW.set_function(by_engine("overflow"))
+    POOL_CHECKOUTS.set_function(by_engine("checkouts"))
+    POOL_TIMEOUTS.set_function(by_engine("timeouts"))
+    POOL_WAIT_SECONDS.set_function(by_engine("wait_seconds_total"))
@@ -1,15 +1,37 @@
 # app/db/session.py
-from sqlalchemy import create_engine # For synchronous engine
+import asyncio
+
+from sqlalchemy import create_engine, text # For synchronous engine
 from sqlalchemy.orm import sessionmaker # For synchronous sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 # Import asynchronous components
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncConnection, AsyncSession
 # Correct import for asynchronous sessionmaker
 from sqlalchemy.ext.asyncio.session import async_sessionmaker # <-- Correct import
 
 from app.core.config import settings
 # Use the existing Base class from base_class.py
 from app.db.base_class import Base
+from app.db.pool_metrics import (
+    PoolMetrics, export_pool_metrics, instrument_queries, instrumented_pool_class
+)
+
+
+# --- Pool configuration ---
+# Both engines share the settings; every worker process holds up to
+# 2 * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections against the Neon budget
+POOL_OPTIONS = dict(
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    pool_use_lifo=settings.DB_POOL_USE_LIFO,
+)
+
+sync_pool_metrics = PoolMetrics("sync")
+async_pool_metrics = PoolMetrics("async")
 
 
 # --- Synchronous Engine and Session ---
@@ -17,10 +39,13 @@ from app.db.base_class import Base
 # Uses the raw DATABASE_URL (e.g., postgresql://...)
 engine = create_engine(
     settings.SQLALCHEMY_DATABASE_URI,
-    pool_pre_ping=True
+    poolclass=instrumented_pool_class(QueuePool, sync_pool_metrics),
+    **POOL_OPTIONS
     # Add connect_args if your synchronous driver also needs specific SSL config
     # For standard 'psycopg2' used by 'postgresql://', sslmode can often be in the URL
 )
+sync_pool_metrics.attach(engine)
+instrument_queries(engine, "sync")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Dependency for synchronous operations
@@ -39,12 +64,16 @@ async_engine = create_async_engine(
     settings.ASYNC_SQLALCHEMY_DATABASE_URI,
     echo=False, # Set to True to see SQL queries
     future=True, # Recommended for SQLAlchemy 2.0 style
-    pool_pre_ping=True
+    poolclass=instrumented_pool_class(AsyncAdaptedQueuePool, async_pool_metrics),
+    **POOL_OPTIONS
     # Note: ssl=require is included in the URL by config.py,
     # so connect_args={'ssl': 'require'} is NOT needed here unless
     # you remove it from the URL construction in config.py
 )
 
+async_pool_metrics.attach(async_engine.sync_engine)
+instrument_queries(async_engine.sync_engine, "async")
+
 # Correct way to create an asynchronous sessionmaker
 AsyncSessionLocal = async_sessionmaker(
     bind=async_engine, # Use bind=
@@ -58,4 +87,57 @@ async def get_async_db() -> AsyncSession:
     async with AsyncSessionLocal() as session:
         yield session
     # The async with block automatically calls await session.close() when exiting,
-    # so the 'finally: await session.close()' is redundant and removed.
\ No newline at end of file
+    # so the 'finally: await session.close()' is redundant and removed.
+
+
+# --- Pool metrics ---
+def get_pool_stats() -> dict:
+    """Current state and counters of both connection pools"""
+    return {
+        "sync": sync_pool_metrics.snapshot(engine.pool),
+        "async": async_pool_metrics.snapshot(async_engine.sync_engine.pool),
+    }
+
+
+export_pool_metrics(get_pool_stats)
+
+
+# --- Pool warm-up ---
+async def prefill_pools(size: int) -> None:
+    """
+    Open `size` connections in both pools at startup and return them to the
+    pools, so the first requests after a deploy don't pay for connecting
+    (TCP, TLS and authentication against Neon).
+    """
+    if size <= 0:
+        return
+
+    def open_sync():
+        conn = engine.connect()
+        conn.execute(text("SELECT 1"))
+        return conn
+
+    async def open_async():
+        conn = async_engine.connect()
+        await conn.start()
+        await conn.execute(text("SELECT 1"))
+        return conn
+
+    # Connections are held until all are open, otherwise the pools would keep
+    # handing out the same one
+    results = await asyncio.gather(
+        *(asyncio.to_thread(open_sync) for _ in range(size)),
+        *(open_async() for _ in range(size)),
+        return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    for result in results:
+        if isinstance(result, BaseException):
+            continue
+        if isinstance(result, AsyncConnection):
+            await result.close()
+        else:
+            await asyncio.to_thread(result.close)
+    if errors:
+        raise errors[0]
+
@@ -1,31 +1,128 @@
+from contextlib import asynccontextmanager
+from functools import partial
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import logging
 import os
 import asyncio
 
-from app.api.endpoints import auth, interviews, users, websocket
+from app.api.endpoints import (
+    auth, drain, health, interviews, metrics, profiling, recordings, reference_images, users, websocket
+)
 from app.core.config import settings
-from app.db.session import engine, async_engine
-from app.models.base import Base
+from app.core.events import startup_state
+from app.core.loop_monitor import loop_monitor
+from app.core.tracing import TracingMiddleware
+from app.db.session import async_engine, prefill_pools
+from app.services.health import (
+    check_database, check_disk_space, check_job_queue, check_media_service,
+    check_media_workers, health_monitor
+)
+from app.services.jobs import job_queue
+from app.services.media_rpc import MediaRPCServer
+from app.services.postprocessing import register_jobs
+from app.utils.logging import setup_logging
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
-# Create database tables (using synchronous engine for setup)
-Base.metadata.create_all(bind=engine)
+# The schema is managed with Alembic (`alembic upgrade head`), never at startup
+
+# Dedicated media workers take their signaling from signaling workers;
+# with role "all" the websocket endpoint drives the media service directly
+media_rpc_server = MediaRPCServer(websocket.get_webrtc_service) if settings.SERVICE_ROLE == "media" else None
+
+
+def _warm_up_facial_models() -> None:
+    # Imported here so that only processes running analysis load the stack
+    from app.services.facial_analysis import warm_up_models
+    warm_up_models()
+
+
+async def _load_face_index() -> None:
+    from app.services.face_index import template_index
+    await template_index.refresh()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start the services of this process's role.
+
+    Cheap steps run before the app starts serving. Slow warm-up steps (filling
+    the connection pools, importing the media stack, loading the facial
+    models) run concurrently in the background; the process reports itself
+    live meanwhile and ready once they're done.
+    """
+    logger.info("Starting with service role %r", settings.SERVICE_ROLE)
+
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+
+    if settings.runs_role("api") or settings.runs_role("media"):
+        os.makedirs(settings.RECORDINGS_DIR, exist_ok=True)
+
+    if settings.runs_role("api"):
+        startup_state.add_warmup("database_pools", lambda: prefill_pools(settings.DB_POOL_PREFILL))
+
+    if settings.runs_role("media"):
+        register_jobs(job_queue)
+        await job_queue.start()
+        startup_state.add_warmup("media_stack", websocket.get_webrtc_service)
+        if settings.WARM_UP_MODELS:
+            startup_state.add_warmup(
+                "facial_models", lambda: asyncio.to_thread(_warm_up_facial_models), required=False
+            )
+        if settings.FACE_INDEX_ENABLED:
+            startup_state.add_warmup("face_index", _load_face_index, required=False)
+
+    if media_rpc_server:
+        startup_state.add_warmup("media_rpc", media_rpc_server.start)
+
+    startup_state.start()
+
+    # Component checks for the health endpoints, run in the background
+    if settings.runs_role("api"):
+        health_monitor.register("database", check_database)
+    if settings.runs_role("api") or settings.runs_role("media"):
+        # Media workers can't record without disk; the API only serves recordings
+        health_monitor.register("disk", check_disk_space, critical=settings.runs_role("media"))
+    if settings.runs_role("media"):
+        health_monitor.register("media", partial(check_media_service, lambda: websocket.webrtc_service))
+        health_monitor.register("job_queue", partial(check_job_queue, job_queue), critical=False)
+    if settings.SERVICE_ROLE == "signaling":
+        health_monitor.register("media_workers", check_media_workers, critical=False)
+    await health_monitor.start()
+
+    yield
+
+    await health_monitor.stop()
+    await startup_state.stop()
+    if settings.runs_role("media") and websocket.webrtc_service:
+        # Finish what a drain requested before shutdown started, or drain now
+        startup_state.mark_draining()
+        await websocket.webrtc_service.drain()
+    if media_rpc_server:
+        # Stop accepting signaling sessions and close the open ones
+        await media_rpc_server.stop()
+    if settings.runs_role("media"):
+        await job_queue.stop()
+        if websocket.webrtc_service:
+            await websocket.webrtc_service.stop()
+
+    # Close database connections
+    await asyncio.shield(async_engine.dispose())
+    logger.info("Database connections closed")
+
+    await loop_monitor.stop()
 
-# Create recordings directory if it doesn't exist
-os.makedirs("recordings", exist_ok=True)
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # Set up CORS
@@ -37,43 +134,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Include routers
-app.include_router(auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["auth"])
-app.include_router(users.router, prefix=f"{settings.API_V1_STR}/users", tags=["users"])
-app.include_router(interviews.router, prefix=f"{settings.API_V1_STR}/interviews", tags=["interviews"])
-app.include_router(websocket.router, tags=["websocket"])
-
-# Serve static files (recordings)
-app.mount("/recordings", StaticFiles(directory="recordings"), name="recordings")
-
-@app.on_event("startup")
-async def startup_db_connection():
-    """Verify database connection on startup"""
-    try:
-        # Test async connection
-        from sqlalchemy import text
-        async with async_engine.connect() as conn:
-            result = await conn.execute(text("SELECT 1"))
-            await conn.commit()
-            logger.info("Successfully connected to Neon PostgreSQL database")
-    except Exception as e:
-        logger.error(f"Database connection error: {e}")
-        raise
-
-@app.on_event("shutdown")
-async def shutdown_db_connection():
-    """Close database connections"""
-    await asyncio.shield(async_engine.dispose())
-    logger.info("Database connections closed")
+# Trace every REST request; added last so that it wraps the other middleware
+if settings.TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
+# Include routers for this process's role
+if settings.runs_role("api"):
+    app.include_router(auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["auth"])
+    app.include_router(users.router, prefix=f"{settings.API_V1_STR}/users", tags=["users"])
+    app.include_router(interviews.router, prefix=f"{settings.API_V1_STR}/interviews", tags=["interviews"])
+    app.include_router(recordings.router, prefix=f"{settings.API_V1_STR}/interviews", tags=["recordings"])
+    app.include_router(reference_images.router, prefix=f"{settings.API_V1_STR}/interviews", tags=["reference images"])
+if settings.runs_role("signaling"):
+    app.include_router(websocket.router, tags=["websocket"])
+if settings.runs_role("media"):
+    # Analysis sessions live on media workers, so each worker reports its own
+    app.include_router(profiling.router, prefix=f"{settings.API_V1_STR}/admin/profiling", tags=["admin"])
+    app.include_router(drain.router, prefix=f"{settings.API_V1_STR}/admin/drain", tags=["admin"])
+app.include_router(health.router, tags=["health"])
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.router, tags=["metrics"])
 
 @app.get("/")
 def root():
     return {"message": "Welcome to the Interview Platform API"}
-
-@app.get("/health")
-async def health_check():
-    from sqlalchemy import text
-    async with async_engine.connect() as conn:
-        await conn.execute(text("SELECT 1"))
-        await conn.commit()
-    return {"status": "healthy", "database": "connected"}   
\ No newline at end of file
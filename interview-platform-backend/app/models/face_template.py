@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, ForeignKey, Float, LargeBinary, String
+from sqlalchemy.orm import relationship
+from app.models.base import BaseModel
+
+class FaceTemplate(BaseModel):
+    __tablename__ = "face_templates"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    interview_id = Column(Integer, ForeignKey("interviews.id"), index=True)  # Interview it was uploaded for, if any
+    model_name = Column(String, nullable=False)  # Embeddings of different models can't be compared
+    embedding = Column(LargeBinary, nullable=False)  # L2-normalized little-endian float32 vector
+    dimensions = Column(Integer, nullable=False)
+    face_confidence = Column(Float)  # Detector confidence for the reference face
+    
+    user = relationship("User")
@@ -0,0 +1,16 @@
+# app/schemas/face_template.py
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+class FaceTemplateResponse(BaseModel):
+    id: int
+    user_id: int
+    interview_id: Optional[int] = None
+    model_name: str
+    dimensions: int
+    face_confidence: Optional[float] = None
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
@@ -54,4 +54,11 @@ class AnalysisResponse(BaseModel):
     updated_at: datetime
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class RecordingResponse(BaseModel):
+    name: str
+    size: int
+    modified: datetime
+    content_type: str
+    url: str
@@ -0,0 +1,151 @@
+# app/services/admission.py
+"""
+Admission control for new interview sessions on a media worker.
+
+Every peer connection, recorder and analysis service on a worker shares its
+CPU and event loop, so once the worker saturates all of its rooms degrade
+together. The controller watches live load signals and, relative to their
+configured limits:
+
+- below ADMISSION_DEGRADE_AT admits everything at full analysis rate,
+- from there on slows down live analysis of all sessions,
+- at the limit refuses new interviews with a retry hint (and a redirect when
+  ADMISSION_REDIRECT_URL is set), while participants of interviews already
+  running on the worker are still admitted up to ADMISSION_MAX_SESSIONS.
+"""
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from aiortc.contrib.media import MediaRecorder
+
+from app.core.config import settings
+from app.core.loop_monitor import loop_monitor
+from app.core.metrics import Counter, Gauge
+from app.services.jobs import job_queue
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_DECISIONS = Counter(
+    "admission_decisions_total",
+    "New sessions admitted or refused, by reason",
+    ["decision"]
+)
+ADMISSION_PRESSURE = Gauge("admission_pressure", "Highest load signal relative to its limit")
+ANALYSIS_SLOWDOWN = Gauge("admission_analysis_slowdown", "Factor live analysis intervals are stretched by")
+
+# Load levels
+LEVEL_NORMAL = "normal"
+LEVEL_DEGRADED = "degraded"
+LEVEL_OVERLOADED = "overloaded"
+
+
+class AdmissionController:
+    """Decides whether the WebRTCService takes on new sessions"""
+
+    def __init__(self, service):
+        self.service = service
+        self.level = LEVEL_NORMAL
+        self.analysis_factor = 1.0
+        # Offline analysis backlog, refreshed in the background since it takes a query
+        self.analysis_queue_depth = 0
+        self._task: Optional[asyncio.Task] = None
+        ADMISSION_PRESSURE.set_function(self.pressure)
+        ANALYSIS_SLOWDOWN.set_function(lambda: self.analysis_factor)
+
+    def start(self) -> None:
+        if self._task is None and settings.ADMISSION_CONTROL_ENABLED:
+            self._task = asyncio.create_task(self._run(), name="admission-control")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def load(self) -> Dict[str, Tuple[float, float]]:
+        """Current load signals and their limits, as {signal: (value, limit)}"""
+        service = self.service
+        # aiortc re-encodes every relayed track it sends, and transcoding recorders encode too
+        encoders = sum(1 for recorder in service.recorders.values() if isinstance(recorder, MediaRecorder))
+        encoders += sum(len(forwarded) for forwarded in service.forwarded_tracks.values())
+        return {
+            # New interviews leave some sessions for participants of running ones
+            "sessions": (len(service.connections), settings.ADMISSION_MAX_SESSIONS - settings.ADMISSION_RESERVED_SESSIONS),
+            "encoders": (encoders, settings.ADMISSION_MAX_ENCODERS),
+            "analysis_queue": (self.analysis_queue_depth, settings.ADMISSION_MAX_ANALYSIS_QUEUE),
+            "loop_lag": (loop_monitor.recent_lag, settings.ADMISSION_MAX_LOOP_LAG),
+        }
+
+    def pressure(self) -> float:
+        """Highest load signal as a share of its limit; 1.0 means at capacity"""
+        return max((value / limit for value, limit in self.load().values() if limit > 0), default=0.0)
+
+    def update(self) -> str:
+        """Re-evaluate the load level and slow down or restore live analysis to match"""
+        pressure = self.pressure()
+        if pressure >= 1.0:
+            level = LEVEL_OVERLOADED
+        elif pressure >= settings.ADMISSION_DEGRADE_AT:
+            level = LEVEL_DEGRADED
+        else:
+            level = LEVEL_NORMAL
+        if level != self.level:
+            logger.warning("Worker load %s -> %s (pressure %.2f)", self.level, level, pressure)
+            self.level = level
+        factor = 1.0 if level == LEVEL_NORMAL else settings.ADMISSION_DEGRADED_ANALYSIS_FACTOR
+        if factor != self.analysis_factor:
+            self.analysis_factor = factor
+            for analysis_service in self.service.analysis_services.values():
+                self.apply_analysis_rate(analysis_service)
+        return level
+
+    def apply_analysis_rate(self, analysis_service) -> None:
+        analysis_service.interval = settings.SPOOFING_DETECTION_INTERVAL * self.analysis_factor
+
+    def check(self, room_id: str) -> Optional[str]:
+        """
+        Whether to admit a new session into a room: None to admit it,
+        otherwise the reason it was refused.
+        """
+        if self.service.draining:
+            ADMISSION_DECISIONS.labels("draining").inc()
+            return "draining"
+        if not settings.ADMISSION_CONTROL_ENABLED:
+            return None
+        level = self.update()
+        if len(self.service.connections) >= settings.ADMISSION_MAX_SESSIONS:
+            reason = "capacity"
+        elif level == LEVEL_OVERLOADED and not self._room_is_live(room_id):
+            reason = "overloaded"
+        else:
+            reason = None
+        ADMISSION_DECISIONS.labels(reason or "admitted").inc()
+        return reason
+
+    def rejection(self, reason: str) -> dict:
+        """Message telling a refused client when, or where, to try again"""
+        # A draining worker's clients can go elsewhere right away
+        retry_after = 0 if reason == "draining" else settings.ADMISSION_RETRY_AFTER
+        message = {"type": "admission_rejected", "reason": reason, "retryAfter": retry_after}
+        if settings.ADMISSION_REDIRECT_URL:
+            message["redirect"] = settings.ADMISSION_REDIRECT_URL
+        return message
+
+    def _room_is_live(self, room_id: str) -> bool:
+        """Whether an interview in the room already runs on this worker"""
+        return any(
+            connection_id in self.service.connections
+            for connection_id in self.service.room_participants.get(room_id, ())
+        )
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if job_queue.is_running():
+                    depths = await job_queue.depths()
+                    self.analysis_queue_depth = depths.get("analysis", {}).get("queued", 0)
+                self.update()
+            except Exception as e:
+                logger.error("Admission control load sampling failed: %s", e)
+            await asyncio.sleep(settings.ADMISSION_REFRESH_INTERVAL)
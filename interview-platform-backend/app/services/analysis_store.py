@@ -0,0 +1,88 @@
+# app/services/analysis_store.py
+"""
+Persistence of live analysis results.
+
+Live analysis normally only reaches the client, in the analysis summary sent
+when it leaves. Sessions a worker closes itself (e.g. while draining for a
+deploy) have their summaries saved to the interview's analysis record instead,
+so they aren't lost with the process.
+
+Cross-interview identity checks are only ever stored here: they name other
+users, so they aren't sent to the client.
+"""
+import logging
+from typing import Any, Dict
+
+from sqlalchemy import select
+
+from app.db.session import AsyncSessionLocal
+from app.models.analysis import Analysis
+
+logger = logging.getLogger(__name__)
+
+
+async def save_live_analysis(summaries: Dict[str, Dict[str, Dict[str, Any]]]) -> int:
+    """
+    Merge live analysis summaries into the analysis records of their interviews.
+
+    summaries maps room ids (which are interview ids) to {connection_id:
+    summary}. They are stored under summary["live_sessions"], and spoofing
+    detected in any session flags the interview. Returns the number of
+    analysis records updated.
+    """
+    # Sessions that never analysed a frame have nothing to keep
+    completed = {}
+    for room_id, sessions in summaries.items():
+        sessions = {
+            connection_id: summary for connection_id, summary in sessions.items()
+            if summary.get("status") == "completed"
+        }
+        if sessions:
+            completed[room_id] = sessions
+    if not completed:
+        return 0
+
+    updated = 0
+    async with AsyncSessionLocal() as db:
+        for room_id, sessions in completed.items():
+            try:
+                interview_id = int(room_id)
+            except ValueError:
+                logger.warning("Not saving live analysis of room %r: not an interview id", room_id)
+                continue
+
+            result = await db.execute(select(Analysis).where(Analysis.interview_id == interview_id))
+            analysis = result.scalars().first()
+            if analysis is None:
+                # Created when the interview starts; without it there is no interview to attach to
+                logger.warning("Not saving live analysis of interview %s: no analysis record", interview_id)
+                continue
+
+            summary = dict(analysis.summary or {})
+            summary["live_sessions"] = {**(summary.get("live_sessions") or {}), **sessions}
+            analysis.summary = summary
+            if any(session.get("has_spoofing_detected") for session in sessions.values()):
+                analysis.has_spoofing_detected = True
+            updated += 1
+        await db.commit()
+    return updated
+
+
+async def save_identity_check(interview_id: int, connection_id: str, result: Dict[str, Any]) -> bool:
+    """
+    Store the cross-interview identity check of a session under
+    summary["identity_checks"] of its interview's analysis record. Returns
+    whether there was a record to store it in.
+    """
+    async with AsyncSessionLocal() as db:
+        query = await db.execute(select(Analysis).where(Analysis.interview_id == interview_id))
+        analysis = query.scalars().first()
+        if analysis is None:
+            logger.warning("Not saving identity check of interview %s: no analysis record", interview_id)
+            return False
+
+        summary = dict(analysis.summary or {})
+        summary["identity_checks"] = {**(summary.get("identity_checks") or {}), connection_id: result}
+        analysis.summary = summary
+        await db.commit()
+    return True
@@ -0,0 +1,334 @@
+# app/services/face_index.py
+"""
+Similarity index over every stored reference face template.
+
+Catches proxy interviewing, the same face turning up as different
+candidates: when a verified candidate's session ends, the embeddings sampled
+from its frames are searched, in one batch, against the templates of all
+other users.
+
+Templates are L2-normalized, so cosine similarity is a dot product and a
+search is a matrix product, done block by block to bound the scratch memory
+whatever the number of templates. The index is an exact search, bound by
+reading the matrix once per batch: 300k templates of 512 dimensions are 600 MB
+and take a few hundred milliseconds on one core, for all of a session's
+embeddings at once. It is loaded from the face_templates table once and kept up to date by
+fetching newer templates. A snapshot is written to FACE_INDEX_PATH and
+memory-mapped on restart, so workers share the pages through the OS cache and
+only fetch what was uploaded since.
+"""
+import asyncio
+import errno
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge
+from app.db.session import AsyncSessionLocal
+from app.models.face_template import FaceTemplate
+from app.services.face_templates import EMBEDDING_DTYPE, cosine_threshold
+
+logger = logging.getLogger(__name__)
+
+IDENTITY_CHECKS = Counter(
+    "identity_checks_total",
+    "Cross-interview identity checks of finished sessions, by outcome",
+    ["outcome"]
+)
+INDEXED_TEMPLATES = Gauge("face_index_templates", "Reference templates in the similarity index")
+
+# Templates scored at a time; bounds the scratch matrix to queries x BLOCK_ROWS
+BLOCK_ROWS = 65536
+# Templates fetched from the database per round trip
+LOAD_BATCH_SIZE = 5000
+# Templates added since the snapshot before it is rewritten
+SNAPSHOT_MIN_NEW_ROWS = 10000
+# Nearest templates looked at per session embedding
+TOP_K = 10
+# Share of a session's embeddings that must match another user to report them
+MIN_MATCHING_SHARE = 0.5
+
+
+class FaceIndex:
+    """
+    Exact nearest-neighbour search over normalized embeddings, each labelled
+    with the id of the user it belongs to.
+
+    Embeddings are kept in segments: the snapshot (possibly memory-mapped) and
+    those added since, stacked on the next search.
+    """
+
+    def __init__(self):
+        self.dimensions: Optional[int] = None
+        self._segments: List[Tuple[np.ndarray, np.ndarray]] = []  # (vectors, labels)
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []
+        self.metadata: Dict[str, Any] = {}  # saved and loaded with the index
+
+    def __len__(self) -> int:
+        return sum(len(labels) for _, labels in self._segments + self._pending)
+
+    def add(self, labels: Sequence[int], vectors: np.ndarray) -> None:
+        """Add normalized embeddings, one row per label"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(labels):
+            raise ValueError("Expected one embedding row per label")
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+        elif vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Expected {self.dimensions}-dimensional embeddings, got {vectors.shape[1]}")
+        self._pending.append((vectors, np.asarray(labels, dtype=np.int64)))
+
+    def search(self, queries: np.ndarray, k: int = 5,
+               exclude_label: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k most similar embeddings for each normalized query row.
+
+        Returns (labels, similarities), both queries x k and ordered by
+        descending similarity; rows are padded with label -1 and similarity
+        -inf when there are fewer than k candidates. Embeddings labelled
+        exclude_label are skipped.
+        """
+        self._flush()
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_labels = np.full((len(queries), k), -1, dtype=np.int64)
+
+        for vectors, labels in self._segments:
+            for start in range(0, len(labels), BLOCK_ROWS):
+                block_labels = labels[start:start + BLOCK_ROWS]
+                scores = queries @ vectors[start:start + BLOCK_ROWS].T
+                if exclude_label is not None:
+                    scores[:, block_labels == exclude_label] = -np.inf
+
+                # Best k of the block, then merged into the best k so far
+                block_k = min(k, len(block_labels))
+                top = np.argpartition(-scores, block_k - 1, axis=1)[:, :block_k]
+                scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+                candidates = np.concatenate([best_labels, block_labels[top]], axis=1)
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(scores, top, axis=1)
+                best_labels = np.take_along_axis(candidates, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_labels = np.take_along_axis(best_labels, order, axis=1)
+        best_labels[np.isneginf(best_scores)] = -1
+        return best_labels, best_scores
+
+    def _flush(self) -> None:
+        """Stack embeddings added since the last search into one segment"""
+        if len(self._pending) > 1:
+            self._segments.append((
+                np.concatenate([vectors for vectors, _ in self._pending]),
+                np.concatenate([labels for _, labels in self._pending])
+            ))
+        else:
+            self._segments.extend(self._pending)
+        self._pending = []
+
+    def save(self, path: str) -> None:
+        """
+        Write the index and its metadata to a directory, streaming the
+        segments into one file.
+
+        Everything is written to a temporary directory that then replaces the
+        previous snapshot, so a crash never leaves files of two snapshots
+        side by side. Workers sharing the path each stage their own; if another
+        worker's snapshot is swapped in first, it is kept and this one dropped.
+        """
+        self._flush()
+        parent, name = os.path.split(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        partial_path = tempfile.mkdtemp(prefix=f"{name}.partial-", dir=parent)
+        try:
+            self._write(partial_path)
+
+            # A directory can't be renamed over a non-empty one, so the current
+            # snapshot is moved aside first; a crash in between leaves no
+            # snapshot, and the index is rebuilt
+            previous_path = tempfile.mkdtemp(prefix=f"{name}.previous-", dir=parent)
+            try:
+                os.replace(path, previous_path)
+            except FileNotFoundError:
+                pass
+            try:
+                os.replace(partial_path, path)
+            except OSError as e:
+                if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                    raise
+            shutil.rmtree(previous_path, ignore_errors=True)
+        finally:
+            shutil.rmtree(partial_path, ignore_errors=True)
+
+    def _write(self, path: str) -> None:
+        """Write the index's files into an empty directory"""
+        rows = len(self)
+        vectors = np.lib.format.open_memmap(
+            os.path.join(path, "vectors.npy"), mode="w+", dtype=np.float32,
+            shape=(rows, self.dimensions or 0)
+        )
+        labels = np.empty(rows, dtype=np.int64)
+        offset = 0
+        for segment_vectors, segment_labels in self._segments:
+            vectors[offset:offset + len(segment_labels)] = segment_vectors
+            labels[offset:offset + len(segment_labels)] = segment_labels
+            offset += len(segment_labels)
+        vectors.flush()
+        del vectors
+        with open(os.path.join(path, "labels.npy"), "wb") as f:
+            np.save(f, labels)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({**self.metadata, "rows": rows}, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "FaceIndex":
+        """
+        Read an index written by save(), memory-mapping the embeddings by
+        default. Raises ValueError if its files don't belong together.
+        """
+        index = cls()
+        with open(os.path.join(path, "meta.json")) as f:
+            index.metadata = json.load(f)
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r" if mmap else None)
+        labels = np.load(os.path.join(path, "labels.npy"))
+        if not len(labels) == len(vectors) == index.metadata.get("rows"):
+            raise ValueError(
+                f"snapshot has {len(vectors)} embeddings and {len(labels)} labels, "
+                f"expected {index.metadata.get('rows')}"
+            )
+        if len(labels):
+            index.dimensions = vectors.shape[1]
+            index._segments.append((vectors, labels))
+        return index
+
+
+class TemplateIndex:
+    """The FaceIndex of all stored templates of the configured model, kept in sync with the database"""
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.model_name = settings.DEEPFACE_MODEL
+        self.index = FaceIndex()
+        self.last_template_id = 0  # templates up to this id are indexed
+        self.unsaved_rows = 0  # templates indexed since the snapshot was written
+        self.has_snapshot = False
+        self.loaded = False
+        self._lock = asyncio.Lock()
+        INDEXED_TEMPLATES.set_function(lambda: len(self.index))
+
+    async def refresh(self) -> int:
+        """Index the templates stored since the last refresh; returns how many were added"""
+        async with self._lock:
+            return await self._refresh()
+
+    async def _refresh(self) -> int:
+        if not self.loaded:
+            await asyncio.to_thread(self._load_snapshot)
+            self.loaded = True
+
+        added = 0
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(
+                select(FaceTemplate.id, FaceTemplate.user_id, FaceTemplate.embedding)
+                .where(FaceTemplate.model_name == self.model_name, FaceTemplate.id > self.last_template_id)
+                .order_by(FaceTemplate.id)
+                .execution_options(yield_per=LOAD_BATCH_SIZE)
+            )
+            async for rows in result.partitions():
+                vectors = np.frombuffer(b"".join(row.embedding for row in rows), dtype=EMBEDDING_DTYPE)
+                self.index.add([row.user_id for row in rows], vectors.reshape(len(rows), -1))
+                self.last_template_id = rows[-1].id
+                added += len(rows)
+
+        if added:
+            logger.info("Indexed %s new face templates, %s in total", added, len(self.index))
+            self.unsaved_rows += added
+            if self.path and (not self.has_snapshot or self.unsaved_rows >= SNAPSHOT_MIN_NEW_ROWS):
+                await asyncio.to_thread(self._save_snapshot)
+        return added
+
+    def _load_snapshot(self) -> None:
+        if not self.path:
+            return
+        try:
+            index = FaceIndex.load(self.path)
+            if index.metadata.get("model_name") != self.model_name:
+                logger.info("Ignoring face index snapshot of model %s", index.metadata.get("model_name"))
+                return
+            self.index = index
+            self.last_template_id = index.metadata["last_template_id"]
+            self.has_snapshot = True
+            logger.info("Loaded face index snapshot of %s templates", len(self.index))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            # Rebuilt from the database instead
+            logger.error("Error loading face index snapshot: %s", e)
+
+    def _save_snapshot(self) -> None:
+        try:
+            self.index.metadata = {"model_name": self.model_name, "last_template_id": self.last_template_id}
+            self.index.save(self.path)
+            self.unsaved_rows = 0
+            self.has_snapshot = True
+            # Search the file from now on rather than a second copy in memory.
+            # It may be another worker's snapshot, saved at the same time; the
+            # next refresh fetches whatever that one lacks
+            index = FaceIndex.load(self.path)
+            if index.metadata.get("model_name") == self.model_name:
+                self.index = index
+                self.last_template_id = index.metadata["last_template_id"]
+        except Exception as e:
+            logger.error("Error saving face index snapshot: %s", e)
+
+    async def check_identity(self, candidate_id: int, embeddings: Sequence[np.ndarray]) -> Dict[str, Any]:
+        """
+        Search a session's face embeddings against the templates of all users but the candidate.
+
+        Returns the users matching at least MIN_MATCHING_SHARE of the
+        embeddings within FACE_INDEX_MAX_DISTANCE, most matching first.
+        """
+        max_distance = settings.FACE_INDEX_MAX_DISTANCE
+        if max_distance is None:
+            max_distance = await asyncio.to_thread(cosine_threshold, self.model_name)
+        queries = np.stack(embeddings)
+        # Searched under the lock so that no refresh adds to the index meanwhile
+        async with self._lock:
+            await self._refresh()
+            labels, similarities = await asyncio.to_thread(self.index.search, queries, TOP_K, candidate_id)
+
+        matches: Dict[int, Dict[str, Any]] = {}
+        for frame, (row_labels, row_similarities) in enumerate(zip(labels, similarities)):
+            # Several templates of a user may match the same embedding; count it once
+            for label, similarity in zip(row_labels, row_similarities):
+                if label < 0 or 1.0 - similarity > max_distance:
+                    continue
+                match = matches.setdefault(int(label), {"user_id": int(label), "frames": set(), "similarity": 0.0})
+                match["frames"].add(frame)
+                match["similarity"] = max(match["similarity"], float(similarity))
+
+        reported = []
+        for match in matches.values():
+            frames = len(match.pop("frames"))
+            if frames >= MIN_MATCHING_SHARE * len(queries):
+                reported.append({**match, "matching_frames": frames})
+        reported.sort(key=lambda match: (match["matching_frames"], match["similarity"]), reverse=True)
+
+        IDENTITY_CHECKS.labels("proxy_suspected" if reported else "clear").inc()
+        return {
+            "model_name": self.model_name,
+            "templates_searched": len(self.index),
+            "frames": len(queries),
+            "max_distance": max_distance,
+            "matches": reported,
+        }
+
+
+template_index = TemplateIndex(settings.FACE_INDEX_PATH or None)
@@ -0,0 +1,196 @@
+# app/services/face_templates.py
+"""
+Reference face templates of candidates.
+
+A candidate's reference photo is detected, aligned and embedded once, when it
+is uploaded, and only the embedding is stored: an L2-normalized float32 vector
+of the configured DeepFace model. Live sessions compare frames against it with
+a dot product instead of re-processing the photo for every frame.
+
+The embedding is computed by a job on the host's job queue, so that only media
+workers load the models; the upload waits for the job.
+"""
+import logging
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+from sqlalchemy import case, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.face_template import FaceTemplate
+from app.models.interview import Interview
+
+logger = logging.getLogger(__name__)
+
+# Ahead of recording post-processing: the uploader is waiting for it
+PRIORITY_REFERENCE_TEMPLATE = 40
+
+# Stored byte order, independent of the host's
+EMBEDDING_DTYPE = np.dtype("<f4")
+
+# DeepFace's cosine distance thresholds, for versions that don't expose them
+COSINE_THRESHOLDS = {
+    "VGG-Face": 0.68,
+    "Facenet": 0.40,
+    "Facenet512": 0.30,
+    "ArcFace": 0.68,
+    "Dlib": 0.07,
+    "SFace": 0.593,
+    "OpenFace": 0.10,
+    "DeepFace": 0.23,
+    "DeepID": 0.015,
+    "GhostFaceNet": 0.65,
+}
+
+
+class NoSingleFaceError(ValueError):
+    """The reference image doesn't show exactly one face"""
+
+
+def normalize(vector) -> np.ndarray:
+    """Scale an embedding to unit length, so that cosine similarity is a dot product"""
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if not norm:
+        raise ValueError("Cannot normalize an all-zero embedding")
+    return vector / norm
+
+
+def encode_embedding(vector: np.ndarray) -> bytes:
+    return np.asarray(vector, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def decode_embedding(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=EMBEDDING_DTYPE).astype(np.float32)
+
+
+def cosine_threshold(model_name: str = None) -> float:
+    """Cosine distance below which two faces embedded by the model count as the same person"""
+    model_name = model_name or settings.DEEPFACE_MODEL
+    try:
+        from deepface.modules.verification import find_threshold
+        return float(find_threshold(model_name, "cosine"))
+    except (ImportError, KeyError, ValueError):
+        return COSINE_THRESHOLDS.get(model_name, 0.40)
+
+
+def compute_template(image: np.ndarray, model_name: str = None) -> Tuple[np.ndarray, Optional[float]]:
+    """
+    Detect, align and embed the face in a BGR reference image.
+
+    Returns the normalized embedding and the detector's confidence. Raises
+    NoSingleFaceError unless the image shows exactly one face. Blocks for as
+    long as the model takes; run it in a thread.
+    """
+    # Imported here so that the REST endpoints using this module don't load OpenCV
+    from app.services.facial_analysis import get_deepface
+    try:
+        faces = get_deepface().represent(
+            img_path=image,
+            model_name=model_name or settings.DEEPFACE_MODEL,
+            detector_backend='opencv',
+            align=True,
+            enforce_detection=True
+        )
+    except ValueError as e:
+        # DeepFace raises ValueError when no face is detected
+        raise NoSingleFaceError("No face detected in the reference image") from e
+    if len(faces) != 1:
+        raise NoSingleFaceError(f"Expected one face in the reference image, found {len(faces)}")
+    return normalize(faces[0]["embedding"]), faces[0].get("face_confidence")
+
+
+def reference_upload_dir() -> str:
+    """Where uploaded photos wait for their template job, next to the job queue"""
+    return os.path.join(os.path.dirname(settings.JOB_QUEUE_PATH) or ".", "reference_images")
+
+
+def reference_template_job(payload: dict) -> dict:
+    """
+    Embed an uploaded reference photo and store the template.
+
+    Photos that can't be used are reported in the result rather than raised,
+    as retrying wouldn't help; the photo is deleted once it has been handled.
+    """
+    import cv2
+    from app.db.session import SessionLocal
+
+    path = payload["path"]
+    with open(path, "rb") as f:
+        data = f.read()
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        result = {"error": "Invalid reference image: Unsupported or corrupt image"}
+    else:
+        try:
+            embedding, face_confidence = compute_template(image, payload["model_name"])
+        except NoSingleFaceError as e:
+            result = {"error": str(e)}
+        except ValueError as e:
+            result = {"error": f"Invalid reference image: {e}"}
+        else:
+            template = FaceTemplate(
+                user_id=payload["candidate_id"],
+                interview_id=payload["interview_id"],
+                model_name=payload["model_name"],
+                embedding=encode_embedding(embedding),
+                dimensions=len(embedding),
+                face_confidence=float(face_confidence) if face_confidence is not None else None
+            )
+            with SessionLocal() as db:
+                db.add(template)
+                db.commit()
+                result = {"template_id": template.id}
+            logger.info("Stored %s reference template for candidate %s", payload["model_name"], payload["candidate_id"])
+    os.remove(path)
+    return result
+
+
+def latest_template_query(candidate_id: int, interview_id: int):
+    """
+    Query for the template to verify a candidate against in an interview: one
+    uploaded for the interview, else the candidate's latest. Only templates of
+    the configured model are used.
+    """
+    return (
+        select(FaceTemplate)
+        .where(FaceTemplate.user_id == candidate_id, FaceTemplate.model_name == settings.DEEPFACE_MODEL)
+        .order_by(
+            case((FaceTemplate.interview_id == interview_id, 0), else_=1),
+            FaceTemplate.created_at.desc()
+        )
+        .limit(1)
+    )
+
+
+def get_interview_template(db: Session, interview_id: int) -> Optional[Tuple[int, np.ndarray]]:
+    """load_interview_template for synchronous callers, such as job handlers"""
+    candidate_id = db.execute(select(Interview.candidate_id).where(Interview.id == interview_id)).scalar()
+    if candidate_id is None:
+        return None
+    template = db.execute(latest_template_query(candidate_id, interview_id)).scalars().first()
+    if template is None:
+        return None
+    return candidate_id, decode_embedding(template.embedding)
+
+
+async def load_interview_template(interview_id: int) -> Optional[Tuple[int, np.ndarray]]:
+    """
+    Load the reference template to verify an interview's candidate against.
+
+    Returns (candidate_id, embedding), or None if the candidate has none.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(Interview.candidate_id).where(Interview.id == interview_id))
+        candidate_id = result.scalar()
+        if candidate_id is None:
+            return None
+
+        result = await db.execute(latest_template_query(candidate_id, interview_id))
+        template = result.scalars().first()
+    if template is None:
+        return None
+    return candidate_id, decode_embedding(template.embedding)
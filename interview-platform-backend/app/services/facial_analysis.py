@@ -1,20 +1,92 @@
-from deepface import DeepFace
 import numpy as np
 import cv2
 import asyncio
 import time
-from typing import Dict, Any, List, Tuple
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
 import logging
 from app.core.config import settings
+from app.core.metrics import Counter, Histogram
+from app.core.tracing import tracer
+from app.services.profiling import AnalysisProfiler
 import tempfile
 import os
+from collections import deque
 
 logger = logging.getLogger(__name__)
 
+ANALYSIS_STAGE_SECONDS = Histogram(
+    "analysis_stage_seconds",
+    "Time spent in each stage of analysing a sampled frame",
+    ["stage"]
+)
+ANALYSIS_FRAMES = Counter(
+    "analysis_frames_total",
+    "Frames submitted for facial analysis, by outcome",
+    ["outcome"]
+)
+
+_deepface = None
+
+def get_deepface():
+    """
+    Import DeepFace on first use.
+
+    DeepFace pulls in TensorFlow, which takes seconds and hundreds of MB to
+    load, so it is only imported once a frame actually needs analysing.
+    """
+    global _deepface
+    if _deepface is None:
+        from deepface import DeepFace
+        _deepface = DeepFace
+    return _deepface
+
+_face_cascade = None
+
+def get_face_cascade():
+    """Load the Haar face detector used by the liveness check once per process"""
+    global _face_cascade
+    if _face_cascade is None:
+        _face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    return _face_cascade
+
+def warm_up_models() -> None:
+    """
+    Load DeepFace's models and run every analysis step once on a blank frame.
+
+    Models are otherwise loaded (and their graphs traced) on the first frame
+    of the first interview, which stalls that interview's analysis for seconds.
+    """
+    DeepFace = get_deepface()
+    frame = np.zeros((224, 224, 3), dtype=np.uint8)
+    DeepFace.represent(
+        img_path=frame,
+        model_name=settings.DEEPFACE_MODEL,
+        detector_backend='opencv',
+        enforce_detection=False
+    )
+    DeepFace.analyze(
+        img_path=frame,
+        actions=['emotion', 'age', 'gender'],
+        detector_backend='opencv',
+        enforce_detection=False,
+        silent=True
+    )
+    get_face_cascade().detectMultiScale(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), 1.3, 5)
+
 class FacialAnalysisService:
-    def __init__(self):
+    def __init__(self, connection_id: str = None, room_id: str = None):
+        # Identify the session in traces
+        self.connection_id = connection_id
+        self.room_id = room_id
         self.model_name = settings.DEEPFACE_MODEL
         self.reference_image = None
+        # Precomputed template of the reference face (see app.services.face_templates),
+        # used instead of reference_image when set
+        self.reference_embedding: Optional[np.ndarray] = None
+        self.match_threshold: Optional[float] = None
+        # Normalized embeddings of recently analysed frames, for the cross-interview identity check
+        self.embeddings = deque(maxlen=settings.FACE_INDEX_SESSION_EMBEDDINGS)
         self.analysis_results = {
             "emotion_data": [],
             "face_match_scores": [],
@@ -23,6 +95,29 @@ class FacialAnalysisService:
         }
         self.last_processed_time = 0
         self.interval = settings.SPOOFING_DETECTION_INTERVAL
+        self.profiler: Optional[AnalysisProfiler] = None
+        if settings.ANALYSIS_PROFILING:
+            self.enable_profiling()
+    
+    def enable_profiling(self, capacity: int = None) -> AnalysisProfiler:
+        """Start keeping per-stage timings of analysed frames (a no-op if already on)"""
+        if self.profiler is None:
+            self.profiler = AnalysisProfiler(capacity or settings.ANALYSIS_PROFILE_BUFFER_SIZE)
+        return self.profiler
+    
+    def disable_profiling(self) -> None:
+        self.profiler = None
+    
+    @contextmanager
+    def _stage(self, name: str, stages: Dict[str, float]):
+        """Time a pipeline stage into the metrics and this frame's profile"""
+        started = time.perf_counter()
+        try:
+            with tracer.span(f"analysis.{name}"):
+                yield
+        finally:
+            stages[name] = time.perf_counter() - started
+            ANALYSIS_STAGE_SECONDS.labels(name).observe(stages[name])
     
     def set_reference_image(self, image):
         """Set the reference image for comparison"""
@@ -30,7 +125,7 @@ class FacialAnalysisService:
         # Pre-process the reference image
         try:
             # Extract face from the reference image
-            detected_face = DeepFace.extract_faces(
+            detected_face = get_deepface().extract_faces(
                 img_path=self.reference_image,
                 detector_backend='opencv'
             )
@@ -40,11 +135,42 @@ class FacialAnalysisService:
             logger.error("No face detected in reference image")
             return False
         except Exception as e:
-            logger.error(f"Error processing reference image: {e}")
+            logger.error("Error processing reference image: %s", e)
             return False
     
-    async def process_frame(self, frame) -> Dict[str, Any]:
-        """Process a video frame for facial analysis"""
+    def set_reference_embedding(self, embedding: np.ndarray, threshold: float) -> None:
+        """
+        Set a precomputed, L2-normalized reference embedding and the cosine
+        distance up to which a frame's face matches it
+        """
+        self.reference_embedding = embedding
+        self.match_threshold = threshold
+    
+    def _verify_embedding(self, frame: np.ndarray) -> Dict[str, Any]:
+        """Match the face in a frame against the reference embedding, like DeepFace.verify does"""
+        faces = get_deepface().represent(
+            img_path=frame,
+            model_name=self.model_name,
+            detector_backend='opencv',
+            align=True
+        )
+        embedding = np.asarray(faces[0]['embedding'], dtype=np.float32)
+        embedding /= np.linalg.norm(embedding)
+        self.embeddings.append(embedding)
+        distance = float(1.0 - np.dot(self.reference_embedding, embedding))
+        return {
+            'verified': distance <= self.match_threshold,
+            'distance': distance,
+            'threshold': self.match_threshold,
+        }
+    
+    async def process_frame(self, frame, conversion_time: float = None) -> Dict[str, Any]:
+        """
+        Process a video frame for facial analysis.
+        
+        conversion_time is the time the caller spent converting the frame to
+        an array, reported as part of the frame's profile.
+        """
         current_time = time.time()
         
         # Only process frames at the defined interval
@@ -53,77 +179,118 @@ class FacialAnalysisService:
         
         self.last_processed_time = current_time
         
-        if self.reference_image is None:
+        if self.reference_image is None and self.reference_embedding is None:
             logger.warning("No reference image set for comparison")
+            ANALYSIS_FRAMES.labels("no_reference").inc()
             return None
         
-        try:
-            # Convert frame to numpy array if it's not already
-            if not isinstance(frame, np.ndarray):
+        started = time.perf_counter()
+        stages: Dict[str, float] = {}
+        if conversion_time is not None:
+            stages["convert"] = conversion_time
+        with tracer.span(
+            "analysis.process_frame",
+            {"connection_id": self.connection_id, "room_id": self.room_id}
+        ) as span:
+            try:
+                # The models block for hundreds of milliseconds, so they run in
+                # a worker thread; callers keep one frame in flight per session
+                # and drop the rest, so the thread never mutates shared state
+                # concurrently
+                verification, analysis, liveness_score = await asyncio.to_thread(
+                    self._run_models, frame, stages
+                )
+                
+                # Add results to history
+                result = {
+                    'timestamp': current_time,
+                    'face_match': {
+                        'verified': verification['verified'],
+                        'distance': verification['distance'],
+                        'threshold': verification['threshold'],
+                    },
+                    'emotion': analysis[0]['emotion'],
+                    'liveness_score': liveness_score,
+                    'spoofing_detected': liveness_score < 0.7  # Threshold for spoofing detection
+                }
+                
+                # Update analysis results
+                with self._stage("history", stages):
+                    self.analysis_results['emotion_data'].append({
+                        'timestamp': current_time,
+                        'emotions': analysis[0]['emotion']
+                    })
+                    self.analysis_results['face_match_scores'].append({
+                        'timestamp': current_time, 
+                        'score': 1 - verification['distance']
+                    })
+                    self.analysis_results['liveness_scores'].append({
+                        'timestamp': current_time,
+                        'score': liveness_score
+                    })
+                    
+                    if result['spoofing_detected']:
+                        self.analysis_results['has_spoofing_detected'] = True
+                
+                total = time.perf_counter() - started
+                ANALYSIS_STAGE_SECONDS.labels("total").observe(total)
+                ANALYSIS_FRAMES.labels("analyzed").inc()
+                if self.profiler is not None:
+                    self.profiler.record(current_time, stages, total)
+                return result
+                
+            except Exception as e:
+                logger.error("Error processing frame: %s", e)
+                ANALYSIS_FRAMES.labels("error").inc()
+                span.set_error(e)
+                return None
+    
+    def _run_models(self, frame, stages: Dict[str, float]) -> Tuple[Dict[str, Any], List[Dict[str, Any]], float]:
+        """
+        Verify, analyse and liveness-check a sampled frame. Blocks for as long
+        as the models take; process_frame runs it in a thread.
+        """
+        # Convert frame to numpy array if it's not already
+        if not isinstance(frame, np.ndarray):
+            with self._stage("convert", stages):
                 frame = np.array(frame)
-            
-            # Save frame to temporary file for DeepFace
+        
+        # Save frame to temporary file for DeepFace
+        with self._stage("encode", stages):
             with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as temp:
                 temp_path = temp.name
                 cv2.imwrite(temp_path, frame)
-            
+        
+        try:
             # Verify face match with reference image
-            verification = DeepFace.verify(
-                img1_path=self.reference_image,
-                img2_path=temp_path,
-                model_name=self.model_name,
-                detector_backend='opencv'
-            )
+            with self._stage("verify", stages):
+                if self.reference_embedding is not None:
+                    verification = self._verify_embedding(frame)
+                else:
+                    verification = get_deepface().verify(
+                        img1_path=self.reference_image,
+                        img2_path=temp_path,
+                        model_name=self.model_name,
+                        detector_backend='opencv'
+                    )
             
             # Analyze emotions
-            analysis = DeepFace.analyze(
-                img_path=temp_path,
-                actions=['emotion', 'age', 'gender'],
-                detector_backend='opencv',
-                silent=True
-            )
-            
-            # Check for spoofing (basic implementation)
-            liveness_score = self._check_liveness(frame)
-            
-            # Add results to history
-            result = {
-                'timestamp': current_time,
-                'face_match': {
-                    'verified': verification['verified'],
-                    'distance': verification['distance'],
-                    'threshold': verification['threshold'],
-                },
-                'emotion': analysis[0]['emotion'],
-                'liveness_score': liveness_score,
-                'spoofing_detected': liveness_score < 0.7  # Threshold for spoofing detection
-            }
-            
-            # Update analysis results
-            self.analysis_results['emotion_data'].append({
-                'timestamp': current_time,
-                'emotions': analysis[0]['emotion']
-            })
-            self.analysis_results['face_match_scores'].append({
-                'timestamp': current_time, 
-                'score': 1 - verification['distance']
-            })
-            self.analysis_results['liveness_scores'].append({
-                'timestamp': current_time,
-                'score': liveness_score
-            })
-            
-            if result['spoofing_detected']:
-                self.analysis_results['has_spoofing_detected'] = True
-            
+            with self._stage("analyze", stages):
+                analysis = get_deepface().analyze(
+                    img_path=temp_path,
+                    actions=['emotion', 'age', 'gender'],
+                    detector_backend='opencv',
+                    silent=True
+                )
+        finally:
             # Clean up temp file
             os.unlink(temp_path)
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"Error processing frame: {e}")
-            return None
+        
+        # Check for spoofing (basic implementation)
+        with self._stage("liveness", stages):
+            liveness_score = self._check_liveness(frame)
+        
+        return verification, analysis, liveness_score
     
     def _check_liveness(self, frame) -> float:
         """
@@ -135,8 +302,7 @@ class FacialAnalysisService:
             gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
             
             # Detect faces
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+            faces = get_face_cascade().detectMultiScale(gray, 1.3, 5)
             
             if len(faces) == 0:
                 return 0.0  # No face detected
@@ -156,7 +322,7 @@ class FacialAnalysisService:
             return liveness_score
             
         except Exception as e:
-            logger.error(f"Error in liveness check: {e}")
+            logger.error("Error in liveness check: %s", e)
             return 0.5  # Default to uncertain
     
     def _compute_local_binary_pattern(self, image):
@@ -0,0 +1,205 @@
+# app/services/health.py
+"""
+Health checks with cached results.
+
+Probes hit the health endpoints several times a second per pod, so the
+endpoints never run checks themselves: a background prober runs every
+registered check on an interval and the endpoints report the cached results.
+"""
+import asyncio
+import logging
+import shutil
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.db.session import async_engine, get_pool_stats
+
+logger = logging.getLogger(__name__)
+
+STATUS_OK = "ok"
+STATUS_DEGRADED = "degraded"
+STATUS_FAILED = "failed"
+
+
+class HealthMonitor:
+    """
+    Runs the registered component checks in the background and caches them.
+
+    A check is an async callable returning a dict with a "status" (ok,
+    degraded or failed) plus any details worth reporting. Checks that raise or
+    time out are reported as failed. A failed critical component makes the
+    process unhealthy; non-critical ones only degrade the overall status.
+    """
+
+    def __init__(self, interval: float = None, timeout: float = None):
+        self.interval = interval or settings.HEALTH_CHECK_INTERVAL
+        self.timeout = timeout or settings.HEALTH_CHECK_TIMEOUT
+        self.checks: Dict[str, Tuple[Callable[[], Awaitable[Dict[str, Any]]], bool]] = {}
+        self.components: Dict[str, Dict[str, Any]] = {}
+        self.checked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._probe: Optional[asyncio.Task] = None
+
+    def register(self, name: str, check: Callable[[], Awaitable[Dict[str, Any]]], critical: bool = True) -> None:
+        """Register a component check"""
+        self.checks[name] = (check, critical)
+
+    async def start(self) -> None:
+        """Start probing in the background"""
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def probe(self, max_age: float = 0.0) -> None:
+        """
+        Run all checks now, unless the cached results are younger than max_age.
+
+        Concurrent callers share a single run.
+        """
+        if self.checked_at is not None and time.time() - self.checked_at < max_age:
+            return
+        if self._probe is None or self._probe.done():
+            self._probe = asyncio.create_task(self._probe_all())
+        await asyncio.shield(self._probe)
+
+    def is_stale(self) -> bool:
+        """Whether the prober has stopped producing results"""
+        return self.checked_at is None or time.time() - self.checked_at > 3 * self.interval + self.timeout
+
+    def is_healthy(self) -> bool:
+        """No critical component failed at the last probe"""
+        if self.is_stale():
+            return False
+        return not any(
+            component["status"] == STATUS_FAILED and component["critical"]
+            for component in self.components.values()
+        )
+
+    def status(self) -> str:
+        if not self.is_healthy():
+            return STATUS_FAILED
+        if any(component["status"] != STATUS_OK for component in self.components.values()):
+            return STATUS_DEGRADED
+        return STATUS_OK
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": self.status(),
+            "checked_at": self.checked_at,
+            "components": self.components,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.probe()
+            except Exception as e:
+                logger.error("Health probe failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def _probe_all(self) -> None:
+        names = list(self.checks)
+        results = await asyncio.gather(*(self._check(name) for name in names))
+        self.components = dict(zip(names, results))
+        self.checked_at = time.time()
+
+    async def _check(self, name: str) -> Dict[str, Any]:
+        check, critical = self.checks[name]
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(check(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            result = {"status": STATUS_FAILED, "error": f"timed out after {self.timeout}s"}
+        except Exception as e:
+            result = {"status": STATUS_FAILED, "error": str(e)}
+        if result["status"] != STATUS_OK:
+            logger.warning("Health check %s is %s: %s", name, result['status'], result.get('error', ''))
+        result["critical"] = critical
+        result["latency"] = round(time.perf_counter() - started, 4)
+        return result
+
+
+# --- Component checks ---
+
+async def check_database() -> Dict[str, Any]:
+    """Round trip to the database through the async pool, plus both pools' stats"""
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    return {"status": STATUS_OK, "pools": get_pool_stats()}
+
+
+async def check_disk_space(path: str = None) -> Dict[str, Any]:
+    """Free space on the volume recordings are written to"""
+    usage = await asyncio.to_thread(shutil.disk_usage, path or settings.RECORDINGS_DIR)
+    free_mb = usage.free // (1024 * 1024)
+    if free_mb < settings.HEALTH_MIN_FREE_DISK_MB:
+        status = STATUS_FAILED
+    elif free_mb < 2 * settings.HEALTH_MIN_FREE_DISK_MB:
+        status = STATUS_DEGRADED
+    else:
+        status = STATUS_OK
+    return {
+        "status": status,
+        "free_mb": free_mb,
+        "total_mb": usage.total // (1024 * 1024),
+        "free_percent": round(100 * usage.free / usage.total, 1) if usage.total else 0.0,
+    }
+
+
+async def check_job_queue(queue) -> Dict[str, Any]:
+    """Post-processing backlog, flagging a growing analysis queue"""
+    if not queue.is_running():
+        return {"status": STATUS_FAILED, "error": "job queue is not running"}
+    depths = await queue.depths()
+    analysis_queued = depths.get("analysis", {}).get("queued", 0)
+    status = STATUS_DEGRADED if analysis_queued > settings.HEALTH_MAX_ANALYSIS_QUEUE_DEPTH else STATUS_OK
+    return {"status": status, "jobs": depths}
+
+
+async def check_media_service(get_service: Callable[[], Any]) -> Dict[str, Any]:
+    """Whether the media stack is loaded, and how busy it is"""
+    service = get_service()
+    if service is None:
+        return {"status": STATUS_DEGRADED, "error": "media service not loaded yet"}
+    return {
+        "status": STATUS_OK,
+        "connections": len(service.connections),
+        "rooms": sum(1 for participants in service.room_participants.values() if participants),
+        "recordings": len(service.recorders),
+    }
+
+
+async def check_media_workers(workers: List[str] = None) -> Dict[str, Any]:
+    """Whether the media workers signaling sessions are relayed to accept connections"""
+    workers = workers or settings.MEDIA_WORKERS
+
+    async def reachable(worker: str) -> bool:
+        host, _, port = worker.rpartition(":")
+        try:
+            _, writer = await asyncio.open_connection(host, int(port))
+        except OSError:
+            return False
+        writer.close()
+        return True
+
+    results = dict(zip(workers, await asyncio.gather(*(reachable(worker) for worker in workers))))
+    up = sum(results.values())
+    if up == len(workers):
+        status = STATUS_OK
+    elif up:
+        status = STATUS_DEGRADED
+    else:
+        status = STATUS_FAILED
+    return {"status": status, "workers": results}
+
+
+# Health monitor of this process; checks are registered per role at startup
+health_monitor = HealthMonitor()
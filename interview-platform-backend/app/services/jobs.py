@@ -0,0 +1,298 @@
+# app/services/jobs.py
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+import traceback
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_type TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    depends_on INTEGER REFERENCES jobs (id),
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    last_error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_pending ON jobs (status, priority DESC, run_after);
+"""
+
+
+class JobQueue:
+    """
+    A local, persistent job queue for post-interview work.
+
+    Jobs are stored in a local SQLite file, so they survive restarts and stay
+    on the host that has the recordings they refer to. Handlers run in
+    a process pool sized from the core count, outside the event loop and the
+    media path. Higher priority jobs are claimed first, failed jobs are
+    retried with exponential backoff, and each job type can be limited to a
+    number of concurrent runs. A job can depend on another one, and is only
+    claimed once that one is done or has finally failed.
+
+    Other processes on the host, such as API workers, can enqueue jobs and
+    wait for them without starting the queue themselves.
+    """
+
+    def __init__(self, path: str = None, workers: int = None):
+        self.path = path or settings.JOB_QUEUE_PATH
+        self.workers = workers or settings.JOB_WORKERS
+        self.handlers: Dict[str, Callable[[dict], Any]] = {}
+        self._limits: Dict[str, int] = {}
+        self._running: Dict[str, int] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks = []
+        self._wakeup: Optional[asyncio.Event] = None
+        # Held from reading the free concurrency slots until the claimed job
+        # takes one, so that workers woken together can't overrun a limit
+        self._claim_lock: Optional[asyncio.Lock] = None
+        self._schema_ready = False
+
+    def register(self, job_type: str, handler: Callable[[dict], Any], concurrency: int = None) -> None:
+        """
+        Register a handler for a job type.
+
+        Handlers run in worker processes, so they must be module-level
+        functions taking the job payload and returning a JSON-serializable result.
+        """
+        self.handlers[job_type] = handler
+        if concurrency:
+            self._limits[job_type] = concurrency
+
+    async def enqueue(self, job_type: str, payload: dict, priority: int = 0, max_attempts: int = None,
+                      depends_on: int = None) -> int:
+        """Add a job to the queue and return its id; depends_on is the id of a job it must wait for"""
+        if not self._schema_ready:
+            await asyncio.to_thread(self._create_schema)
+        now = time.time()
+        job_id = await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO jobs (job_type, payload, priority, depends_on, max_attempts, run_after, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job_type, json.dumps(payload), priority, depends_on,
+                max_attempts or settings.JOB_MAX_ATTEMPTS, now, now, now
+            ),
+        )
+        if self._wakeup:
+            self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: int) -> Optional[dict]:
+        """Return a job as a dict, or None if it doesn't exist"""
+        rows = await asyncio.to_thread(self._query, "SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._row_to_job(rows[0]) if rows else None
+
+    async def wait(self, job_id: int, timeout: float, interval: float = 0.5) -> Optional[dict]:
+        """Wait for a job to be done or finally failed and return it, or None on timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.get(job_id)
+            if job is None or job["status"] in ("done", "failed"):
+                return job
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(interval)
+
+    async def depths(self) -> Dict[str, Dict[str, int]]:
+        """Number of queued and running jobs per job type"""
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT job_type, status, COUNT(*) AS count FROM jobs "
+            "WHERE status IN ('queued', 'running') GROUP BY job_type, status",
+            ()
+        )
+        depths = {job_type: {"queued": 0, "running": 0} for job_type in self.handlers}
+        for row in rows:
+            depths.setdefault(row["job_type"], {"queued": 0, "running": 0})[row["status"]] = row["count"]
+        return depths
+
+    def is_running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    async def start(self) -> None:
+        """Create the schema, recover interrupted jobs and start the workers"""
+        if self._tasks:
+            return
+
+        await asyncio.to_thread(self._init_db)
+        self._executor = self._create_executor()
+        self._wakeup = asyncio.Event()
+        self._claim_lock = asyncio.Lock()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info("Job queue started with %s workers (%s)", self.workers, self.path)
+
+    async def stop(self) -> None:
+        """Stop the workers; jobs still running are picked up again on next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            async with self._claim_lock:
+                job = await asyncio.to_thread(self._claim, self._available_types())
+                if job is not None:
+                    self._running[job["job_type"]] = self._running.get(job["job_type"], 0) + 1
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_type = job["job_type"]
+            try:
+                logger.info("Running job %s (%s), attempt %s", job['id'], job_type, job['attempts'])
+                result = await loop.run_in_executor(self._executor, self.handlers[job_type], job["payload"])
+                await asyncio.to_thread(self._finish, job["id"], result)
+            except asyncio.CancelledError:
+                raise
+            except BrokenProcessPool as e:
+                # A worker process died (e.g. OOM during inference); replace the
+                # pool so the remaining jobs don't all fail with it
+                logger.error("Job %s (%s) lost its worker process: %s", job['id'], job_type, e)
+                await asyncio.to_thread(self._fail, job, repr(e))
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._create_executor()
+            except Exception as e:
+                logger.error("Job %s (%s) failed: %s", job['id'], job_type, e)
+                await asyncio.to_thread(self._fail, job, "".join(traceback.format_exception(e)))
+            finally:
+                self._running[job_type] -= 1
+                # A freed concurrency slot may unblock a job another worker skipped
+                self._wakeup.set()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # Spawned rather than forked: the parent runs aiortc and asyncio threads
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def _available_types(self):
+        return [
+            job_type for job_type in self.handlers
+            if self._running.get(job_type, 0) < self._limits.get(job_type, self.workers)
+        ]
+
+    # --- SQLite access (run in threads) ---
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _create_schema(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # Queues created before jobs could depend on each other
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "depends_on" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN depends_on INTEGER REFERENCES jobs (id)")
+        self._schema_ready = True
+
+    def _init_db(self) -> None:
+        self._create_schema()
+        with closing(self._connect()) as conn, conn:
+            # Jobs that were running when the process died get another go
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+                (time.time(),)
+            )
+
+    def _execute(self, sql: str, params: tuple) -> int:
+        with closing(self._connect()) as conn, conn:
+            return conn.execute(sql, params).lastrowid
+
+    def _query(self, sql: str, params: tuple):
+        with closing(self._connect()) as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _claim(self, job_types) -> Optional[dict]:
+        if not job_types:
+            return None
+        now = time.time()
+        placeholders = ",".join("?" for _ in job_types)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                f"SELECT * FROM jobs WHERE status = 'queued' AND run_after <= ? AND job_type IN ({placeholders}) "
+                "AND NOT EXISTS (SELECT 1 FROM jobs AS dependency WHERE dependency.id = jobs.depends_on "
+                "AND dependency.status NOT IN ('done', 'failed')) "
+                "ORDER BY priority DESC, id LIMIT 1",
+                (now, *job_types)
+            ).fetchone()
+            if row is None:
+                conn.rollback()
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (now, row["id"])
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        job = self._row_to_job(row)
+        job["attempts"] += 1
+        return job
+
+    def _finish(self, job_id: int, result: Any) -> None:
+        self._execute(
+            "UPDATE jobs SET status = 'done', result = ?, last_error = NULL, updated_at = ? WHERE id = ?",
+            (json.dumps(result), time.time(), job_id)
+        )
+
+    def _fail(self, job: dict, error: str) -> None:
+        now = time.time()
+        if job["attempts"] < job["max_attempts"]:
+            delay = settings.JOB_RETRY_DELAY * 2 ** (job["attempts"] - 1)
+            self._execute(
+                "UPDATE jobs SET status = 'queued', run_after = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                (now + delay, error, now, job["id"])
+            )
+        else:
+            self._execute(
+                "UPDATE jobs SET status = 'failed', last_error = ?, updated_at = ? WHERE id = ?",
+                (error, now, job["id"])
+            )
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        if job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+
+# Shared queue for the process; started and stopped with the application
+job_queue = JobQueue()
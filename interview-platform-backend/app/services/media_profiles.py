@@ -0,0 +1,159 @@
+# app/services/media_profiles.py
+"""
+Negotiation profiles: which codecs peer connections negotiate and how much
+video clients are asked to send.
+
+A profile is an entry of settings.WEBRTC_PROFILES with any of:
+
+- video_codecs / audio_codecs: codec names in order of preference, e.g.
+  ["VP8", "H264"]; codecs not listed are not negotiated, unless the client
+  offers none of them
+- max_video_bitrate: kbit/s, announced with b=AS and b=TIAS on video sections
+- max_width, max_height: announced as max-fs (in macroblocks) for VP8 and H264
+- max_framerate: announced as max-fr for VP8
+
+Browsers honour the bandwidth lines of the remote description; the
+resolution and frame rate parameters are hints only some of them apply, so
+the caps are also sent to the client with the answer, to be applied with
+RTCRtpSender.setParameters().
+"""
+import logging
+import math
+from typing import Dict, List, Optional
+
+from aiortc import RTCPeerConnection, RTCRtpSender
+from aiortc.rtcpeerconnection import filter_preferred_codecs
+from aiortc.rtcrtpparameters import RTCRtpCodecCapability
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Codecs whose fmtp parameters carry a maximum frame size (RFC 7741, RFC 6184)
+MAX_FS_CODECS = ("VP8", "H264")
+
+
+def codec_preferences(kind: str, names: List[str]) -> List[RTCRtpCodecCapability]:
+    """Capabilities of the named codecs in the given order, plus RTX for retransmissions"""
+    capabilities = RTCRtpSender.getCapabilities(kind).codecs
+    preferences = []
+    for name in names:
+        matching = [codec for codec in capabilities if codec.mimeType.lower() == f"{kind}/{name}".lower()]
+        if not matching:
+            raise ValueError(f"Unsupported {kind} codec {name!r}")
+        preferences.extend(matching)
+    preferences.extend(codec for codec in capabilities if codec.mimeType.lower() == f"{kind}/rtx")
+    return preferences
+
+
+class MediaProfile:
+    """Codec preferences and sending caps applied to every peer connection"""
+
+    def __init__(self, name: str, video_codecs: List[str] = None, audio_codecs: List[str] = None,
+                 max_video_bitrate: int = None, max_width: int = None, max_height: int = None,
+                 max_framerate: int = None):
+        self.name = name
+        self.preferences: Dict[str, List[RTCRtpCodecCapability]] = {}
+        if video_codecs:
+            self.preferences["video"] = codec_preferences("video", video_codecs)
+        if audio_codecs:
+            self.preferences["audio"] = codec_preferences("audio", audio_codecs)
+        self.max_video_bitrate = max_video_bitrate
+        self.max_width = max_width
+        self.max_height = max_height
+        self.max_framerate = max_framerate
+
+    @classmethod
+    def from_settings(cls, name: str = None) -> "MediaProfile":
+        name = name or settings.WEBRTC_PROFILE
+        return cls(name, **settings.WEBRTC_PROFILES[name])
+
+    @property
+    def max_frame_size(self) -> Optional[int]:
+        """Largest frame in 16x16 macroblocks, as used by max-fs"""
+        if not self.max_width or not self.max_height:
+            return None
+        return math.ceil(self.max_width / 16) * math.ceil(self.max_height / 16)
+
+    def apply_codec_preferences(self, pc: RTCPeerConnection) -> None:
+        """
+        Restrict the codecs of the connection's transceivers to the profile's.
+
+        Call after setRemoteDescription and before createAnswer or createOffer:
+        the codecs of an answer were already picked from the remote offer when
+        it was applied, so they are filtered here as well.
+        """
+        for transceiver in pc.getTransceivers():
+            preferences = self.preferences.get(transceiver.kind)
+            if not preferences:
+                continue
+            transceiver.setCodecPreferences(preferences)
+            negotiated = filter_preferred_codecs(transceiver._codecs, preferences)
+            if negotiated:
+                transceiver._codecs = negotiated
+            elif transceiver._codecs:
+                logger.info(
+                    "Client offered none of the %s codecs of profile %s, keeping its own",
+                    transceiver.kind, self.name
+                )
+
+    def apply_to_sdp(self, sdp: str) -> str:
+        """Add the profile's bandwidth and frame size caps to the video sections of a local description"""
+        max_fs = self.max_frame_size
+        if not self.max_video_bitrate and not max_fs and not self.max_framerate:
+            return sdp
+
+        sections = sdp.split("\r\nm=")
+        for index in range(1, len(sections)):
+            if sections[index].startswith("video "):
+                sections[index] = self._apply_to_video_section(sections[index], max_fs)
+        return "\r\nm=".join(sections)
+
+    def _apply_to_video_section(self, section: str, max_fs: Optional[int]) -> str:
+        lines = [line for line in section.split("\r\n") if not (self.max_video_bitrate and line.startswith("b="))]
+
+        # Frame size and rate parameters, by payload type
+        parameters: Dict[str, List[str]] = {}
+        for line in lines:
+            if line.startswith("a=rtpmap:"):
+                payload_type, encoding = line[len("a=rtpmap:"):].split(" ", 1)
+                codec = encoding.split("/")[0].upper()
+                if codec in MAX_FS_CODECS:
+                    params = [f"max-fs={max_fs}"] if max_fs else []
+                    if codec == "VP8" and self.max_framerate:
+                        params.append(f"max-fr={self.max_framerate}")
+                    if params:
+                        parameters[payload_type] = params
+
+        result = []
+        for line in lines:
+            if line.startswith("a=fmtp:"):
+                payload_type = line[len("a=fmtp:"):].split(" ", 1)[0]
+                params = parameters.pop(payload_type, None)
+                if params:
+                    line = f"{line};{';'.join(params)}"
+            result.append(line)
+            if line.startswith("c=") and self.max_video_bitrate:
+                # b= lines follow the connection line
+                result.append(f"b=AS:{self.max_video_bitrate}")
+                result.append(f"b=TIAS:{self.max_video_bitrate * 1000}")
+            elif line.startswith("a=rtpmap:"):
+                payload_type = line[len("a=rtpmap:"):].split(" ", 1)[0]
+                if payload_type in parameters and not any(
+                    other.startswith(f"a=fmtp:{payload_type} ") for other in lines
+                ):
+                    result.append(f"a=fmtp:{payload_type} {';'.join(parameters.pop(payload_type))}")
+        return "\r\n".join(result)
+
+    def constraints(self) -> Dict[str, Dict[str, int]]:
+        """Sending caps for the client, in RTCRtpEncodingParameters / MediaTrackConstraints terms"""
+        video = {}
+        if self.max_video_bitrate:
+            video["maxBitrate"] = self.max_video_bitrate * 1000
+        if self.max_width:
+            video["maxWidth"] = self.max_width
+        if self.max_height:
+            video["maxHeight"] = self.max_height
+        if self.max_framerate:
+            video["maxFramerate"] = self.max_framerate
+        return {"video": video} if video else {}
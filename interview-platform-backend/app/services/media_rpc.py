@@ -0,0 +1,242 @@
+# app/services/media_rpc.py
+"""
+Internal RPC between signaling and media workers.
+
+When the roles are split, signaling workers hold the clients' websockets and
+media workers run the WebRTCService (peer connections, forwarding, recording
+and analysis). Each client websocket is mirrored by one stream connection to a
+media worker, carrying the same signaling messages as newline-delimited JSON:
+
+    signaling -> media:  {"connection_id": ..., "user_id": ..., "token": ...}   (hello)
+    signaling -> media:  client messages (join, offer, answer, ice_candidate, ...)
+    media -> signaling:  server messages (answer, offer, user_joined, ...)
+
+Closing the stream on either side ends the session on the other. Every room is
+pinned to one media worker, since its participants' media is forwarded
+in-process.
+"""
+import asyncio
+import hmac
+import ipaddress
+import json
+import logging
+import zlib
+from typing import Awaitable, Callable, Optional, Set, Tuple
+
+from fastapi import WebSocket
+from starlette.websockets import WebSocketDisconnect
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# SDP offers with many candidates can be large
+STREAM_LIMIT = 1024 * 1024
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+def media_worker_for(room_id: str) -> Tuple[str, int]:
+    """Pick the media worker that handles a room"""
+    worker = settings.MEDIA_WORKERS[zlib.crc32(room_id.encode()) % len(settings.MEDIA_WORKERS)]
+    host, _, port = worker.rpartition(":")
+    return host, int(port)
+
+
+def _is_loopback(host: str) -> bool:
+    """Whether a listening address only accepts connections from this host"""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class StreamWebSocket:
+    """
+    Presents a media RPC stream to the WebRTCService as if it were the client's
+    websocket, so the service runs unchanged on media workers.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+
+    async def accept(self) -> None:
+        pass
+
+    async def send_json(self, message: dict) -> None:
+        if self.writer.is_closing():
+            raise WebSocketDisconnect()
+        self.writer.write(_encode(message))
+        await self.writer.drain()
+
+    async def close(self) -> None:
+        if not self.writer.is_closing():
+            self.writer.close()
+
+
+class MediaRPCServer:
+    """Accepts signaling sessions from signaling workers on a media worker"""
+
+    def __init__(self, get_service: Callable[[], Awaitable], host: str = None, port: int = None):
+        self.get_service = get_service
+        self.host = host or settings.MEDIA_RPC_HOST
+        self.port = port or settings.MEDIA_RPC_PORT
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._sessions: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        """Load the media stack and start listening"""
+        if self._server:
+            return
+        # Whoever opens a session can take over any connection_id's media
+        # session, so the listener is only open to other hosts with a token
+        if not settings.MEDIA_RPC_TOKEN and not _is_loopback(self.host):
+            raise RuntimeError(f"MEDIA_RPC_TOKEN must be set for media RPC to listen on {self.host}")
+        await self.get_service()
+        self._server = await asyncio.start_server(self._handle_session, self.host, self.port, limit=STREAM_LIMIT)
+        logger.info("Media RPC listening on %s:%s", self.host, self.port)
+
+    async def stop(self) -> None:
+        """Stop listening and end the open sessions"""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for task in list(self._sessions):
+            task.cancel()
+        await asyncio.gather(*self._sessions, return_exceptions=True)
+
+    async def _handle_session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._sessions.add(task)
+        connection_id = None
+        service = await self.get_service()
+        try:
+            line = await reader.readline()
+            if not line:
+                # Connection check (e.g. the signaling workers' health prober)
+                return
+            hello = json.loads(line)
+            connection_id = hello.get("connection_id")
+            if not connection_id or not hmac.compare_digest(str(hello.get("token", "")), settings.MEDIA_RPC_TOKEN):
+                logger.warning("Rejected media RPC session from %s", writer.get_extra_info('peername'))
+                return
+
+            # The user was authenticated by the signaling worker; the shared token
+            # vouches for the signaling worker
+            await service.register_websocket(connection_id, StreamWebSocket(writer), hello.get("user_id"))
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.error("Invalid JSON received over media RPC from %s", connection_id)
+                    continue
+                await service.handle_websocket_message(connection_id, message)
+
+        except (ConnectionError, ValueError, AttributeError) as e:
+            logger.error("Media RPC session for %s failed: %s", connection_id, e)
+        finally:
+            if connection_id:
+                await service.close_peer_connection(connection_id)
+            if not writer.is_closing():
+                writer.close()
+            self._sessions.discard(task)
+
+
+class MediaWorkerConnection:
+    """The signaling side of a session with a media worker"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, connection_id: str, room_id: str, user_id: int = None) -> "MediaWorkerConnection":
+        host, port = media_worker_for(room_id)
+        reader, writer = await asyncio.open_connection(host, port, limit=STREAM_LIMIT)
+        connection = cls(reader, writer)
+        await connection.send({"connection_id": connection_id, "user_id": user_id, "token": settings.MEDIA_RPC_TOKEN})
+        return connection
+
+    async def send(self, message: dict) -> None:
+        self.writer.write(_encode(message))
+        await self.writer.drain()
+
+    async def receive(self) -> Optional[dict]:
+        """Return the next message from the media worker, or None once it has closed the session"""
+        line = await self.reader.readline()
+        return json.loads(line) if line else None
+
+    async def close(self) -> None:
+        if not self.writer.is_closing():
+            self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def relay_signaling(websocket: WebSocket, connection_id: str, user_id: int = None) -> None:
+    """
+    Serve a client's signaling websocket, opened by user_id if it
+    authenticated, on a signaling worker.
+
+    The media worker session is opened on the first message, since that is when
+    the room, and therefore the media worker, is known.
+    """
+    await websocket.accept()
+    await websocket.send_json({"type": "connection_id", "id": connection_id})
+
+    connection: Optional[MediaWorkerConnection] = None
+    forward_task: Optional[asyncio.Task] = None
+
+    async def forward_to_client():
+        # The media worker ends the session after "leave" or when the peer
+        # connection fails; close the client's websocket with it
+        try:
+            while True:
+                message = await connection.receive()
+                if message is None:
+                    break
+                await websocket.send_json(message)
+        except Exception as e:
+            logger.error("Error relaying media worker messages to %s: %s", connection_id, e)
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    try:
+        while True:
+            try:
+                message = await websocket.receive_json()
+            except json.JSONDecodeError:
+                logger.error("Invalid JSON received from %s", connection_id)
+                continue
+
+            if connection is None:
+                room_id = message.get("roomId")
+                if not room_id:
+                    logger.error("Missing roomId in message: %s", message)
+                    continue
+                connection = await MediaWorkerConnection.open(connection_id, room_id, user_id)
+                forward_task = asyncio.create_task(forward_to_client())
+
+            await connection.send(message)
+
+    except WebSocketDisconnect:
+        logger.info("WebSocket disconnected for %s", connection_id)
+    except Exception as e:
+        logger.error("Error in websocket connection for %s: %s", connection_id, e)
+    finally:
+        if connection:
+            await connection.close()
+        if forward_task:
+            forward_task.cancel()
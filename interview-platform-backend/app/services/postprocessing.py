@@ -0,0 +1,174 @@
+# app/services/postprocessing.py
+"""
+Post-interview work on recordings.
+
+The job handlers here run in the job queue's worker processes, never on the
+event loop, so they are free to block on decoding, encoding and inference.
+PyAV, OpenCV and the analysis stack are imported inside the handlers, so the
+API process only pays for them when it actually runs post-processing.
+"""
+import asyncio
+import logging
+import os
+
+from app.core.config import settings
+from app.services.face_templates import reference_template_job
+from app.services.jobs import JobQueue
+from app.services.recording import METADATA_SUFFIX, recording_base_path
+
+logger = logging.getLogger(__name__)
+
+# Reviewers need a playable file first; offline analysis can wait
+PRIORITY_REMUX = 30
+PRIORITY_THUMBNAILS = 20
+PRIORITY_TRANSCODE = 10
+PRIORITY_ANALYSIS = 0
+
+THUMBNAIL_WIDTH = 320
+
+
+def playable_path(path: str) -> str:
+    """Return a decodable file for a recording, remuxing passthrough recordings if needed"""
+    base = recording_base_path(path) or path
+    if not os.path.exists(base + METADATA_SUFFIX):
+        return path
+    for extension in (".webm", ".mkv"):
+        if os.path.exists(base + extension):
+            return base + extension
+
+    from app.tools.remux_recording import remux
+    return remux(base)
+
+
+def remux_job(payload: dict) -> dict:
+    """Remux a passthrough recording into WebM/MKV"""
+    from app.tools.remux_recording import remux
+
+    return {"output": remux(payload["path"])}
+
+
+def transcode_job(payload: dict) -> dict:
+    """Transcode a recording to H.264/AAC MP4"""
+    from app.tools.remux_recording import transcode
+
+    source = playable_path(payload["path"])
+    if source.endswith(".mp4"):
+        return {"output": source}
+    return {"output": transcode(source)}
+
+
+def thumbnails_job(payload: dict) -> dict:
+    """Extract a thumbnail and periodic key frames from a recording"""
+    import av
+    import cv2
+
+    source = playable_path(payload["path"])
+    name = os.path.splitext(source)[0]
+    keyframes_dir = f"{name}_keyframes"
+    os.makedirs(keyframes_dir, exist_ok=True)
+
+    keyframes = []
+    with av.open(source) as container:
+        if not container.streams.video:
+            return {"thumbnail": None, "keyframes": []}
+        stream = container.streams.video[0]
+        # Only key frames are decoded, which is enough for a timeline strip
+        stream.codec_context.skip_frame = "NONKEY"
+
+        for frame in container.decode(stream):
+            timestamp = float(frame.pts * stream.time_base) if frame.pts is not None else 0.0
+            if keyframes and timestamp - keyframes[-1]["time"] < settings.RECORDING_KEYFRAME_INTERVAL:
+                continue
+            keyframe_path = os.path.join(keyframes_dir, f"{timestamp:010.3f}.jpg")
+            cv2.imwrite(keyframe_path, frame.to_ndarray(format="bgr24"))
+            keyframes.append({"time": timestamp, "path": keyframe_path})
+            if len(keyframes) >= settings.RECORDING_MAX_KEYFRAMES:
+                break
+
+    if not keyframes:
+        return {"thumbnail": None, "keyframes": []}
+
+    # The very first frame is often black while the camera warms up
+    image = cv2.imread(keyframes[min(1, len(keyframes) - 1)]["path"])
+    height = int(image.shape[0] * THUMBNAIL_WIDTH / image.shape[1])
+    thumbnail_path = f"{name}_thumbnail.jpg"
+    cv2.imwrite(thumbnail_path, cv2.resize(image, (THUMBNAIL_WIDTH, height), interpolation=cv2.INTER_AREA))
+
+    return {"thumbnail": thumbnail_path, "keyframes": keyframes}
+
+
+def _load_reference_template(payload: dict):
+    """The stored template of the recorded interview's candidate, as (candidate_id, embedding), if any"""
+    from app.db.session import SessionLocal
+    from app.services.face_templates import get_interview_template
+
+    try:
+        # Rooms, and so recording directories, are named after their interview
+        interview_id = int(payload.get("room_id"))
+    except (TypeError, ValueError):
+        return None
+    with SessionLocal() as db:
+        return get_interview_template(db, interview_id)
+
+
+def analysis_job(payload: dict) -> dict:
+    """Run facial analysis over the whole recording"""
+    import av
+
+    from app.services.face_templates import cosine_threshold
+    from app.services.facial_analysis import FacialAnalysisService
+
+    analysis_service = FacialAnalysisService(room_id=payload.get("room_id"))
+    # Sampling is driven by video time below, not by wall-clock time
+    analysis_service.interval = 0
+    reference = _load_reference_template(payload)
+    if reference is not None:
+        analysis_service.set_reference_embedding(reference[1], cosine_threshold())
+    elif payload.get("reference_image"):
+        analysis_service.set_reference_image(payload["reference_image"])
+    else:
+        # Without a reference every frame would be skipped; don't decode the recording for nothing
+        logger.info("No reference template for %s, skipping offline analysis", payload["path"])
+        return analysis_service.get_analysis_summary()
+
+    source = playable_path(payload["path"])
+
+    async def analyze():
+        with av.open(source) as container:
+            if not container.streams.video:
+                return
+            stream = container.streams.video[0]
+            next_time = 0.0
+            for frame in container.decode(stream):
+                timestamp = float(frame.pts * stream.time_base) if frame.pts is not None else next_time
+                if timestamp < next_time:
+                    continue
+                next_time = timestamp + settings.OFFLINE_ANALYSIS_INTERVAL
+                await analysis_service.process_frame(frame.to_ndarray(format="bgr24"))
+
+    asyncio.run(analyze())
+    return analysis_service.get_analysis_summary()
+
+
+def register_jobs(queue: JobQueue) -> None:
+    """Register the recording post-processing handlers, and the reference template one, with a job queue"""
+    queue.register("reference_template", reference_template_job)
+    queue.register("remux", remux_job)
+    queue.register("transcode", transcode_job)
+    queue.register("thumbnails", thumbnails_job)
+    # Every analysis worker process loads its own copy of the models
+    queue.register("analysis", analysis_job, concurrency=settings.ANALYSIS_JOB_CONCURRENCY)
+
+
+async def enqueue_recording_jobs(queue: JobQueue, path: str, passthrough: bool, **metadata) -> None:
+    """Queue the post-processing for a finished recording"""
+    payload = {"path": path, **metadata}
+    # Everything else reads the remuxed file, so it waits for the remux to finish
+    remux_id = None
+    if passthrough:
+        remux_id = await queue.enqueue("remux", payload, priority=PRIORITY_REMUX)
+    await queue.enqueue("thumbnails", payload, priority=PRIORITY_THUMBNAILS, depends_on=remux_id)
+    if passthrough and settings.RECORDING_TRANSCODE:
+        await queue.enqueue("transcode", payload, priority=PRIORITY_TRANSCODE, depends_on=remux_id)
+    if settings.OFFLINE_ANALYSIS_ENABLED:
+        await queue.enqueue("analysis", payload, priority=PRIORITY_ANALYSIS, depends_on=remux_id)
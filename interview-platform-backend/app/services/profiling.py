@@ -0,0 +1,72 @@
+# app/services/profiling.py
+"""
+Per-session profiling of the facial analysis pipeline.
+
+When profiling is on for a session, every analysed frame's stage timings are
+kept in a bounded ring buffer, so the stage that makes a session fall behind
+can be found from the admin endpoint without attaching a profiler to the pod.
+"""
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Sequence
+
+# Percentiles reported for each stage
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class AnalysisProfiler:
+    """Ring buffer of per-frame stage timings for one session"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.frames: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+        self.recorded = 0
+        self.started_at = time.time()
+
+    def record(self, timestamp: float, stages: Dict[str, float], total: float) -> None:
+        """Add one analysed frame; the oldest frame is dropped once the buffer is full"""
+        self.frames.append({"timestamp": timestamp, "total": total, "stages": stages})
+        self.recorded += 1
+
+    def summary(self, slowest: int = 10) -> Dict[str, Any]:
+        """Percentiles per stage and the slowest frames in the buffer, in milliseconds"""
+        frames = list(self.frames)
+        by_stage: Dict[str, List[float]] = {}
+        for frame in frames:
+            for stage, seconds in frame["stages"].items():
+                by_stage.setdefault(stage, []).append(seconds)
+        by_stage["total"] = [frame["total"] for frame in frames]
+
+        stages = {}
+        for stage, values in by_stage.items():
+            values.sort()
+            stages[stage] = {
+                "count": len(values),
+                "mean_ms": round(1000 * sum(values) / len(values), 3) if values else 0.0,
+                **{f"p{pct}_ms": round(1000 * percentile(values, pct), 3) for pct in PERCENTILES},
+                "max_ms": round(1000 * values[-1], 3) if values else 0.0,
+            }
+
+        return {
+            "started_at": self.started_at,
+            "frames_recorded": self.recorded,
+            "frames_buffered": len(frames),
+            "capacity": self.capacity,
+            "stages": stages,
+            "slowest_frames": [
+                {
+                    "timestamp": frame["timestamp"],
+                    "total_ms": round(1000 * frame["total"], 3),
+                    "stages_ms": {stage: round(1000 * seconds, 3) for stage, seconds in frame["stages"].items()},
+                }
+                for frame in sorted(frames, key=lambda frame: frame["total"], reverse=True)[:slowest]
+            ],
+        }
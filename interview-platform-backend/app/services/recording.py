@@ -0,0 +1,136 @@
+# app/services/recording.py
+import json
+import logging
+import os
+import struct
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    # Only needed for annotations; the remux tooling reads recordings without aiortc
+    from aiortc import RTCRtpTransceiver
+
+logger = logging.getLogger(__name__)
+
+# One record per encoded frame: stream index, RTP timestamp, arrival time (ms), payload length
+FRAME_HEADER = struct.Struct(">BIQI")
+
+FRAMES_SUFFIX = ".frames"
+METADATA_SUFFIX = ".json"
+
+
+class PassthroughRecorder:
+    """
+    A media sink that stores the encoded frames received on a peer connection
+    as they arrive, without decoding or re-encoding them.
+
+    Each received stream is tapped after aiortc's jitter buffer, so frames are
+    already re-assembled from RTP (retransmissions included) and depayloaded.
+    Frames are appended to `<path>.frames` and the negotiated codecs are
+    written to `<path>.json`; `app/tools/remux_recording.py` turns the pair
+    into a playable WebM/MKV file offline.
+
+    aiortc has no public API for encoded frames, so this relies on the
+    receiver's private jitter buffer.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.streams: List[Dict[str, Any]] = []
+        self._transceivers: List["RTCRtpTransceiver"] = []
+        self._file = None
+
+    def addTransceiver(self, transceiver: "RTCRtpTransceiver") -> None:
+        """Add the receiving side of a negotiated transceiver to the recording"""
+        self._transceivers.append(transceiver)
+
+    async def start(self) -> None:
+        """Start recording"""
+        if self._file is not None:
+            return
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path + FRAMES_SUFFIX, "wb", buffering=1024 * 1024)
+        for transceiver in self._transceivers:
+            codec = self._primary_codec(transceiver)
+            if codec is None:
+                logger.warning("No codec negotiated for %s transceiver %s", transceiver.kind, transceiver.mid)
+                continue
+
+            index = len(self.streams)
+            self.streams.append({
+                "index": index,
+                "kind": transceiver.kind,
+                "mid": transceiver.mid,
+                "codec": {
+                    "mimeType": codec.mimeType,
+                    "clockRate": codec.clockRate,
+                    "channels": codec.channels,
+                    "parameters": codec.parameters,
+                },
+            })
+            self._tap(transceiver, index)
+
+        with open(self.path + METADATA_SUFFIX, "w") as f:
+            json.dump({"version": 1, "started": time.time(), "streams": self.streams}, f)
+
+    async def stop(self) -> None:
+        """Stop recording and flush the frames file"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._transceivers = []
+
+    def _tap(self, transceiver: "RTCRtpTransceiver", index: int) -> None:
+        jitter_buffer = transceiver.receiver._RTCRtpReceiver__jitter_buffer
+        add = jitter_buffer.add
+
+        def add_and_record(packet):
+            pli_flag, encoded_frame = add(packet)
+            if encoded_frame is not None and self._file is not None:
+                self._file.write(FRAME_HEADER.pack(
+                    index,
+                    encoded_frame.timestamp,
+                    int(time.time() * 1000),
+                    len(encoded_frame.data)
+                ))
+                self._file.write(encoded_frame.data)
+            return pli_flag, encoded_frame
+
+        jitter_buffer.add = add_and_record
+
+    @staticmethod
+    def _primary_codec(transceiver: "RTCRtpTransceiver"):
+        for codec in transceiver._codecs:
+            if codec.mimeType.lower().split("/")[-1] != "rtx":
+                return codec
+        return None
+
+
+def read_metadata(path: str) -> Dict[str, Any]:
+    """Read the stream metadata of a passthrough recording"""
+    with open(path + METADATA_SUFFIX) as f:
+        return json.load(f)
+
+
+def read_frames(path: str):
+    """Yield (stream index, RTP timestamp, arrival ms, data) from a passthrough recording"""
+    with open(path + FRAMES_SUFFIX, "rb") as f:
+        while True:
+            header = f.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            index, timestamp, arrival_ms, length = FRAME_HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                # Truncated by a crash mid-write; everything before it is usable
+                return
+            yield index, timestamp, arrival_ms, data
+
+
+def recording_base_path(path: str) -> Optional[str]:
+    """Strip the passthrough suffix from a `.frames` or `.json` path"""
+    for suffix in (FRAMES_SUFFIX, METADATA_SUFFIX):
+        if path.endswith(suffix):
+            return path[: -len(suffix)]
+    return None
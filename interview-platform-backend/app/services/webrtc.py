@@ -2,29 +2,112 @@
 import asyncio
 import json
 import logging
+import os
+import time
 import uuid
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple, Union
 
-import cv2
 import numpy as np
 from aiortc import (
-    MediaStreamTrack, RTCPeerConnection, RTCSessionDescription,
-    VideoStreamTrack
+    MediaStreamTrack, RTCConfiguration, RTCIceCandidate, RTCIceServer, RTCPeerConnection,
+    RTCSessionDescription, VideoStreamTrack
 )
 from aiortc.contrib.media import MediaBlackhole, MediaRecorder, MediaRelay
-from av import VideoFrame
+from aiortc.sdp import candidate_from_sdp
 from fastapi import WebSocket
 from starlette.websockets import WebSocketDisconnect
 
 from app.core.config import settings
-from app.services.facial_analysis import FacialAnalysisService
+from app.core.metrics import Counter, Gauge, Histogram
+from app.core.tracing import KIND_SERVER, detached_context, tracer
+from app.services.admission import AdmissionController
+from app.services.analysis_store import save_identity_check, save_live_analysis
+from app.services.face_index import template_index
+from app.services.face_templates import cosine_threshold, load_interview_template
+from app.services.facial_analysis import ANALYSIS_STAGE_SECONDS, FacialAnalysisService
+from app.services.jobs import job_queue
+from app.services.media_profiles import MediaProfile
+from app.services.postprocessing import enqueue_recording_jobs
+from app.services.recording import PassthroughRecorder
 
 logger = logging.getLogger(__name__)
 
+FRAGMENTED_MP4_OPTIONS = {
+    "movflags": "frag_keyframe+empty_moov+default_base_moof",
+    "frag_duration": "1000000",  # microseconds
+    "flush_packets": "1",
+}
+
+SIGNALING_MESSAGE_TYPES = ("join", "offer", "answer", "ice_candidate", "chat", "ping", "pong", "leave")
+
+# ICE candidates held per connection until its remote description is set
+MAX_PENDING_ICE_CANDIDATES = 64
+
+VIDEO_FRAMES = Counter(
+    "video_frames_total",
+    "Video frames received by analysis tracks, by what happened to them",
+    ["outcome"]
+)
+SIGNALING_MESSAGE_SECONDS = Histogram(
+    "signaling_message_seconds",
+    "Time spent handling a signaling websocket message",
+    ["type"]
+)
+BROADCAST_SECONDS = Histogram(
+    "broadcast_seconds",
+    "Time spent fanning a message out to a room"
+)
+BROADCAST_RECIPIENTS = Histogram(
+    "broadcast_recipients",
+    "Participants a room broadcast is sent to",
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 32)
+)
+ICE_CANDIDATES = Counter(
+    "ice_candidates_total",
+    "Trickled ICE candidates received from clients, by what happened to them",
+    ["outcome"]
+)
+SESSIONS_REAPED = Counter(
+    "webrtc_sessions_reaped_total",
+    "Idle or stuck sessions torn down by the reaper, by reason",
+    ["reason"]
+)
+ACTIVE_CONNECTIONS = Gauge("webrtc_connections", "Open peer connections")
+ACTIVE_ROOMS = Gauge("webrtc_rooms", "Rooms with at least one participant")
+ACTIVE_RECORDINGS = Gauge("webrtc_recordings", "Recordings in progress")
+FORWARDED_TRACKS = Gauge("webrtc_forwarded_tracks", "Tracks relayed from a publisher to a subscriber")
+
+def parse_ice_candidate(candidate: dict) -> Optional[RTCIceCandidate]:
+    """
+    Convert a browser's RTCIceCandidateInit into an RTCIceCandidate.
+    
+    Returns None for the empty candidate that signals end-of-candidates;
+    raises ValueError if the candidate can't be parsed or doesn't say which
+    media section it belongs to.
+    """
+    sdp = candidate.get("candidate") or ""
+    for prefix in ("a=", "candidate:"):
+        if sdp.startswith(prefix):
+            sdp = sdp[len(prefix):]
+    if not sdp.strip():
+        return None
+    if candidate.get("sdpMid") is None and candidate.get("sdpMLineIndex") is None:
+        raise ValueError(f"candidate {sdp!r} has neither sdpMid nor sdpMLineIndex")
+    try:
+        parsed = candidate_from_sdp(sdp)
+    except (AssertionError, IndexError, ValueError) as e:
+        raise ValueError(f"invalid candidate {sdp!r}") from e
+    parsed.sdpMid = candidate.get("sdpMid")
+    parsed.sdpMLineIndex = candidate.get("sdpMLineIndex")
+    return parsed
+
 class VideoTransformTrack(MediaStreamTrack):
     """
-    A video stream track that transforms frames from an another track and
-    analyzes them using FacialAnalysisService.
+    A video stream track that passes frames through from another track and
+    analyzes a sample of them using FacialAnalysisService.
+    
+    The source is expected to be an unbuffered relay subscription, so frames
+    that arrive while analysis is busy are simply dropped.
     """
     kind = "video"
 
@@ -34,19 +117,31 @@ class VideoTransformTrack(MediaStreamTrack):
         self.analysis_service = analysis_service
         self.frame_count = 0
         self.last_frame = None
+        self._analysis_task: Optional[asyncio.Task] = None
 
     async def recv(self):
         frame = await self.track.recv()
         self.frame_count += 1
         
-        # Process every 30th frame for analysis (adjust based on performance needs)
-        if self.frame_count % 30 == 0:
-            # Convert frame to numpy array for analysis
+        # Sample frames for analysis, skipping while the previous one is still running
+        if self.frame_count % settings.ANALYSIS_FRAME_INTERVAL != 0:
+            VIDEO_FRAMES.labels("passed").inc()
+        elif self._analysis_task is not None and not self._analysis_task.done():
+            VIDEO_FRAMES.labels("skipped_busy").inc()
+        else:
+            VIDEO_FRAMES.labels("sampled").inc()
+            # Convert frame to numpy array for analysis; the bgr24 conversion
+            # already produces a new buffer, so no extra copy is needed
+            started = time.perf_counter()
             img = frame.to_ndarray(format="bgr24")
-            self.last_frame = img.copy()
+            conversion_time = time.perf_counter() - started
+            ANALYSIS_STAGE_SECONDS.labels("convert").observe(conversion_time)
+            self.last_frame = img
             
             # Run facial analysis (non-blocking)
-            asyncio.create_task(self.analysis_service.process_frame(img))
+            self._analysis_task = asyncio.create_task(
+                self.analysis_service.process_frame(img, conversion_time=conversion_time)
+            )
         
         return frame
 
@@ -54,49 +149,117 @@ class WebRTCService:
     def __init__(self):
         self.connections: Dict[str, RTCPeerConnection] = {}
         self.room_participants: Dict[str, Set[str]] = {}  # room_id -> set of connection_ids
-        self.relays = {}
+        self.relays: Dict[str, MediaRelay] = {}
         self.analysis_services: Dict[str, FacialAnalysisService] = {}
-        self.recorders: Dict[str, MediaRecorder] = {}
+        self.recorders: Dict[str, Union[MediaRecorder, PassthroughRecorder]] = {}
+        self.recording_paths: Dict[str, str] = {}
+        self.analysis_sinks: Dict[str, MediaBlackhole] = {}
         self.websocket_connections: Dict[str, WebSocket] = {}
+        # SFU state: tracks received from each connection, and the relay proxies
+        # fanned out from them keyed by (subscriber_id, source_track_id)
+        self.published_tracks: Dict[str, List[MediaStreamTrack]] = {}
+        self.forwarded_tracks: Dict[str, Dict[Tuple[str, str], MediaStreamTrack]] = {}
+        self.pending_renegotiation: Set[str] = set()
+        # Recorder setups waiting for negotiation to complete, by connection_id
+        self.recorder_tasks: Dict[str, asyncio.Task] = {}
+        # Trickled ICE candidates that arrived before the remote description
+        self.pending_candidates: Dict[str, List[Optional[RTCIceCandidate]]] = {}
+        # Codec preferences and video caps negotiated with every client
+        self.media_profile = MediaProfile.from_settings()
+        # Liveness, for the reaper: when each client last sent a message, and
+        # when each peer connection last changed state (monotonic seconds)
+        self.last_seen: Dict[str, float] = {}
+        self.state_changed_at: Dict[str, float] = {}
+        self._reaper_task: Optional[asyncio.Task] = None
+        # Decides on new sessions from the worker's load, and slows analysis under load
+        self.admission = AdmissionController(self)
+        # Set while the worker moves its sessions elsewhere before shutting down
+        self.draining = False
+        self.drained_summaries: Dict[str, Dict[str, dict]] = {}  # room_id -> connection_id -> summary
+        self._drain_task: Optional[asyncio.Task] = None
+        # Authenticated user of each signaling connection, to tell the candidate
+        # from the interviewer; never taken from what the client says about itself
+        self.user_ids: Dict[str, int] = {}
+        # Reference templates of the rooms' candidates, loaded once per room as
+        # (candidate_id, embedding), or None if the candidate has none
+        self.room_references: Dict[str, Optional[Tuple[int, np.ndarray]]] = {}
+        self.reference_tasks: Dict[str, asyncio.Task] = {}
+        self.match_threshold: Optional[float] = None
+        # Cross-interview identity checks of ended sessions still running
+        self.identity_tasks: Set[asyncio.Task] = set()
+        
+        # Report the service's state at scrape time rather than on every change
+        ACTIVE_CONNECTIONS.set_function(lambda: len(self.connections))
+        ACTIVE_ROOMS.set_function(
+            lambda: sum(1 for participants in self.room_participants.values() if participants)
+        )
+        ACTIVE_RECORDINGS.set_function(lambda: len(self.recorders))
+        FORWARDED_TRACKS.set_function(
+            lambda: sum(len(forwarded) for forwarded in self.forwarded_tracks.values())
+        )
         
     async def create_peer_connection(self, connection_id: str, room_id: str) -> RTCPeerConnection:
         """Create a new WebRTC peer connection"""
         self._ensure_room_exists(room_id)
         
         # Create peer connection with STUN/TURN servers
-        ice_servers = [{"urls": server} for server in settings.STUN_SERVERS]
-        ice_servers.extend(settings.TURN_SERVERS)
+        ice_servers = [RTCIceServer(urls=server) for server in settings.STUN_SERVERS]
+        ice_servers.extend(RTCIceServer(**server) for server in settings.TURN_SERVERS)
         
-        pc = RTCPeerConnection(configuration={"iceServers": ice_servers})
+        pc = RTCPeerConnection(configuration=RTCConfiguration(iceServers=ice_servers))
         
         # Store connection
         self.connections[connection_id] = pc
+        self.state_changed_at[connection_id] = time.monotonic()
         self.room_participants[room_id].add(connection_id)
         
-        # Create media relay for this connection
+        # Create media relay for this connection; every track it publishes is
+        # read once by the relay and fanned out to the other room participants
         self.relays[connection_id] = MediaRelay()
+        self.published_tracks[connection_id] = []
         
         # Create facial analysis service for this connection
-        self.analysis_services[connection_id] = FacialAnalysisService()
+        self.analysis_services[connection_id] = FacialAnalysisService(connection_id=connection_id, room_id=room_id)
+        self.admission.apply_analysis_rate(self.analysis_services[connection_id])
+        self._apply_room_reference(connection_id, room_id)
         
         # Handle ICE connection state changes
         @pc.on("iceconnectionstatechange")
         async def on_iceconnectionstatechange():
-            logger.info(f"ICE connection state for {connection_id}: {pc.iceConnectionState}")
+            logger.info("ICE connection state for %s: %s", connection_id, pc.iceConnectionState)
+            # A connection already being closed (e.g. on "leave") is no longer
+            # registered; tearing it down again here would close the websocket
+            # before its analysis summary is sent
+            if self.connections.get(connection_id) is not pc:
+                return
+            self.state_changed_at[connection_id] = time.monotonic()
             if pc.iceConnectionState == "failed" or pc.iceConnectionState == "closed":
                 await self.close_peer_connection(connection_id)
         
+        @pc.on("connectionstatechange")
+        def on_connectionstatechange():
+            if self.connections.get(connection_id) is pc:
+                self.state_changed_at[connection_id] = time.monotonic()
+        
+        # Forward incoming media to the rest of the room
+        @pc.on("track")
+        async def on_track(track):
+            logger.info("Track %s received from %s", track.kind, connection_id)
+            self.published_tracks.setdefault(connection_id, []).append(track)
+            await self._forward_track(connection_id, room_id, track)
+            self._schedule_recorder_setup(connection_id, room_id, pc)
+        
         # Handle data channel
         @pc.on("datachannel")
         def on_datachannel(channel):
-            logger.info(f"Data channel established for {connection_id}: {channel.label}")
+            logger.info("Data channel established for %s: %s", connection_id, channel.label)
             
             @channel.on("message")
             def on_message(message):
                 # Handle data channel messages
                 try:
                     data = json.loads(message)
-                    logger.info(f"Received message from {connection_id}: {data}")
+                    logger.debug("Received %s message from %s", data.get("type"), connection_id)
                     
                     # Process message based on type
                     if data.get("type") == "chat":
@@ -111,7 +274,7 @@ class WebRTCService:
                             exclude=[connection_id]
                         ))
                 except Exception as e:
-                    logger.error(f"Error handling data channel message: {e}")
+                    logger.error("Error handling data channel message: %s", e)
         
         return pc
     
@@ -123,66 +286,177 @@ class WebRTCService:
                 pc = await self.create_peer_connection(connection_id, room_id)
             
             # Set remote description
-            await pc.setRemoteDescription(RTCSessionDescription(
-                sdp=offer["sdp"], type=offer["type"]
-            ))
+            with tracer.span("webrtc.set_remote_description"):
+                await pc.setRemoteDescription(RTCSessionDescription(
+                    sdp=offer["sdp"], type=offer["type"]
+                ))
+            await self._add_pending_candidates(connection_id, pc)
+            
+            # Send the media already published in the room with this answer
+            self._subscribe_to_room(connection_id, room_id)
+            self.media_profile.apply_codec_preferences(pc)
             
             # Create answer
-            answer = await pc.createAnswer()
-            await pc.setLocalDescription(answer)
+            with tracer.span("webrtc.create_answer"):
+                answer = await pc.createAnswer()
+            with tracer.span("webrtc.set_local_description"):
+                await pc.setLocalDescription(answer)
+            
+            # Tracks that found no matching transceiver in the client's offer
+            # can only be delivered with a server-initiated offer
+            if any(
+                transceiver.sender.track is not None
+                and transceiver.currentDirection not in ("sendonly", "sendrecv")
+                for transceiver in pc.getTransceivers()
+            ):
+                self.pending_renegotiation.add(connection_id)
             
-            # Set up media recording
-            self._setup_recorder(connection_id, room_id)
+            # Recording and analysis are attached in the background once the
+            # received tracks are negotiated, so the answer goes out right away
             
-            # Return answer to client
-            return {"sdp": pc.localDescription.sdp, "type": pc.localDescription.type}
+            # Return answer to client, with the profile's caps for what it sends
+            return {
+                "sdp": self.media_profile.apply_to_sdp(pc.localDescription.sdp),
+                "type": pc.localDescription.type
+            }
             
         except Exception as e:
-            logger.error(f"Error handling offer: {e}")
+            logger.error("Error handling offer: %s", e)
             raise
     
-    async def handle_ice_candidate(self, connection_id: str, candidate: dict) -> None:
-        """Handle ICE candidate from client"""
+    async def handle_answer(self, connection_id: str, room_id: str, answer: dict) -> None:
+        """Handle SDP answer from client to a server-initiated renegotiation"""
         try:
             pc = self.connections.get(connection_id)
-            if pc:
-                await pc.addIceCandidate(candidate)
-            else:
-                logger.warning(f"Received ICE candidate for unknown connection: {connection_id}")
+            if not pc:
+                logger.warning("Received answer for unknown connection: %s", connection_id)
+                return
+            
+            await pc.setRemoteDescription(RTCSessionDescription(
+                sdp=answer["sdp"], type=answer["type"]
+            ))
+            await self._add_pending_candidates(connection_id, pc)
+            
+            # Tracks may have been added while this offer was outstanding
+            if connection_id in self.pending_renegotiation:
+                await self._renegotiate(connection_id, room_id)
+                
         except Exception as e:
-            logger.error(f"Error handling ICE candidate: {e}")
+            logger.error("Error handling answer: %s", e)
             raise
     
-    async def close_peer_connection(self, connection_id: str) -> None:
-        """Close WebRTC peer connection"""
+    async def handle_ice_candidate(self, connection_id: str, candidate: Union[dict, List[dict]]) -> None:
+        """
+        Handle ICE candidates from client, one or a batch of them.
+        
+        Candidates may overtake the offer, or arrive before the peer connection
+        exists; those are held until the remote description has been set.
+        """
         try:
-            # Close recorder if exists
-            if connection_id in self.recorders:
-                await self.recorders[connection_id].stop()
-                del self.recorders[connection_id]
+            candidates = []
+            for init in candidate if isinstance(candidate, list) else [candidate]:
+                try:
+                    candidates.append(parse_ice_candidate(init))
+                except (AttributeError, ValueError) as e:
+                    ICE_CANDIDATES.labels("invalid").inc()
+                    logger.warning("Ignoring ICE candidate from %s: %s", connection_id, e)
             
-            # Close peer connection
             pc = self.connections.get(connection_id)
+            if pc is None or pc.remoteDescription is None:
+                if connection_id not in self.websocket_connections:
+                    logger.warning("Received ICE candidate for unknown connection: %s", connection_id)
+                    return
+                pending = self.pending_candidates.setdefault(connection_id, [])
+                accepted = candidates[:max(0, MAX_PENDING_ICE_CANDIDATES - len(pending))]
+                pending.extend(accepted)
+                ICE_CANDIDATES.labels("buffered").inc(len(accepted))
+                if len(accepted) < len(candidates):
+                    ICE_CANDIDATES.labels("dropped").inc(len(candidates) - len(accepted))
+                    logger.warning("Too many early ICE candidates from %s, dropping some", connection_id)
+                return
+            
+            await self._add_candidates(connection_id, pc, candidates)
+        except Exception as e:
+            logger.error("Error handling ICE candidate: %s", e)
+            raise
+    
+    async def _add_pending_candidates(self, connection_id: str, pc: RTCPeerConnection) -> None:
+        """Add the candidates held back until the remote description was set"""
+        candidates = self.pending_candidates.pop(connection_id, None)
+        if candidates:
+            await self._add_candidates(connection_id, pc, candidates)
+    
+    async def _add_candidates(self, connection_id: str, pc: RTCPeerConnection,
+                              candidates: List[Optional[RTCIceCandidate]]) -> None:
+        """Add candidates one by one, so that one the connection rejects doesn't hold up the others"""
+        for ice_candidate in candidates:
+            try:
+                await pc.addIceCandidate(ice_candidate)
+            except Exception as e:
+                ICE_CANDIDATES.labels("invalid").inc()
+                logger.warning("Ignoring ICE candidate from %s: %s", connection_id, e)
+            else:
+                ICE_CANDIDATES.labels("added").inc()
+    
+    async def close_peer_connection(self, connection_id: str, close_websocket: bool = True) -> Optional[dict]:
+        """Close WebRTC peer connection and return its analysis summary, if any"""
+        summary = None
+        try:
+            # Entries are popped before awaiting so that state-change callbacks
+            # fired while closing don't tear down the same connection twice
+            
+            # Cancel a recorder setup still in progress, then close the recorder if it exists
+            recorder_task = self.recorder_tasks.pop(connection_id, None)
+            if recorder_task:
+                recorder_task.cancel()
+            recorder = self.recorders.pop(connection_id, None)
+            recording_path = self.recording_paths.pop(connection_id, None)
+            if recorder:
+                try:
+                    await recorder.stop()
+                except Exception as e:
+                    # A broken recording must not keep the connection from being cleaned up
+                    logger.error("Error stopping recorder for %s: %s", connection_id, e)
+                await self._enqueue_post_processing(connection_id, recorder, recording_path)
+            
+            # Stop analysis consumer if exists
+            analysis_sink = self.analysis_sinks.pop(connection_id, None)
+            if analysis_sink:
+                await analysis_sink.stop()
+            
+            # Stop relaying media to and from this connection
+            self._stop_forwarding(connection_id)
+            
+            # Close peer connection
+            pc = self.connections.pop(connection_id, None)
             if pc:
                 await pc.close()
-                del self.connections[connection_id]
             
             # Remove from relays
             if connection_id in self.relays:
                 del self.relays[connection_id]
+            self.published_tracks.pop(connection_id, None)
+            self.pending_renegotiation.discard(connection_id)
+            self.pending_candidates.pop(connection_id, None)
+            self.state_changed_at.pop(connection_id, None)
             
             # Remove from analysis services
             if connection_id in self.analysis_services:
                 analysis_service = self.analysis_services[connection_id]
                 # Get analysis summary before deleting
                 summary = analysis_service.get_analysis_summary()
+                self._schedule_identity_check(connection_id, analysis_service)
                 del self.analysis_services[connection_id]
-                return summary
             
             # Remove from room participants
-            for room_id, participants in self.room_participants.items():
+            for room_id, participants in list(self.room_participants.items()):
                 if connection_id in participants:
                     participants.remove(connection_id)
+                    if not any(participant in self.connections for participant in participants):
+                        self._forget_room_reference(room_id)
+                    if self.draining and summary:
+                        # Saved once the drain is done, as the session can't be resumed here
+                        self.drained_summaries.setdefault(room_id, {})[connection_id] = summary
                     # Notify other participants about the leave
                     await self._broadcast_to_room(
                         room_id,
@@ -191,129 +465,602 @@ class WebRTCService:
                     )
             
             # Remove websocket connection
-            if connection_id in self.websocket_connections:
-                ws = self.websocket_connections[connection_id]
-                await ws.close()
-                del self.websocket_connections[connection_id]
+            if close_websocket:
+                await self._close_websocket(connection_id)
                 
         except Exception as e:
-            logger.error(f"Error closing peer connection: {e}")
+            logger.error("Error closing peer connection: %s", e)
+        
+        return summary
+    
+    async def _close_websocket(self, connection_id: str) -> None:
+        """Close and forget the signaling websocket for a connection"""
+        ws = self.websocket_connections.pop(connection_id, None)
+        self.last_seen.pop(connection_id, None)
+        self.user_ids.pop(connection_id, None)
+        if ws:
+            try:
+                await ws.close()
+            except Exception as e:
+                logger.error("Error closing websocket for %s: %s", connection_id, e)
+    
+    def start(self) -> None:
+        """Start the background tasks: the session reaper and admission control's load sampling"""
+        if self._reaper_task is None:
+            self._reaper_task = asyncio.create_task(self._run_reaper(), name="session-reaper")
+        self.admission.start()
+    
+    async def stop(self) -> None:
+        await self.admission.stop()
+        if self._reaper_task:
+            self._reaper_task.cancel()
+            await asyncio.gather(self._reaper_task, return_exceptions=True)
+            self._reaper_task = None
+    
+    def start_drain(self) -> asyncio.Task:
+        """Start draining in the background (a no-op if already started)"""
+        if self._drain_task is None:
+            self._drain_task = asyncio.create_task(self._drain(), name="drain")
+        return self._drain_task
+    
+    async def drain(self) -> Dict[str, int]:
+        """
+        Move this worker's sessions elsewhere before it shuts down.
+        
+        New sessions are refused and clients are told to reconnect, which the
+        load balancer routes to another worker once this one reports itself
+        not ready. Sessions still open after DRAIN_GRACE_PERIOD are closed
+        concurrently, finalising their recordings, and the analysis summaries
+        of all sessions closed meanwhile are saved to their interviews. Returns
+        within DRAIN_TIMEOUT.
+        """
+        return await asyncio.shield(self.start_drain())
+    
+    async def _drain(self) -> Dict[str, int]:
+        started = time.monotonic()
+        deadline = started + settings.DRAIN_TIMEOUT
+        self.draining = True
+        logger.warning(
+            "Draining %s sessions in %s rooms",
+            len(self.connections),
+            sum(1 for participants in self.room_participants.values() if participants)
+        )
+        
+        notice = {"type": "reconnect", "reason": "draining", "gracePeriod": settings.DRAIN_GRACE_PERIOD}
+        if settings.ADMISSION_REDIRECT_URL:
+            notice["redirect"] = settings.ADMISSION_REDIRECT_URL
+        await asyncio.gather(
+            *(self._send_to_connection(connection_id, notice) for connection_id in list(self.websocket_connections)),
+            return_exceptions=True
+        )
+        
+        # Let clients leave by themselves, so they can rejoin elsewhere right away
+        grace_end = min(deadline, started + settings.DRAIN_GRACE_PERIOD)
+        while self.connections and time.monotonic() < grace_end:
+            await asyncio.sleep(0.1)
+        
+        # Close what's left concurrently; stopping the recorders finalises the files
+        remaining = set(self.connections) | set(self.websocket_connections)
+        closing = asyncio.gather(
+            *(self.close_peer_connection(connection_id) for connection_id in remaining), return_exceptions=True
+        )
+        try:
+            await asyncio.wait_for(closing, max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            logger.error("Drain deadline reached with %s sessions still closing", len(self.connections))
+        
+        if self.identity_tasks:
+            await asyncio.wait(set(self.identity_tasks), timeout=max(0.0, deadline - time.monotonic()))
+        
+        summaries, self.drained_summaries = self.drained_summaries, {}
+        saved = 0
+        if summaries:
+            try:
+                # Saving is what keeps the analysis, so it gets a moment even past the deadline
+                saved = await asyncio.wait_for(save_live_analysis(summaries), max(2.0, deadline - time.monotonic()))
+            except Exception as e:
+                logger.error("Saving live analysis of %s rooms failed: %s", len(summaries), e)
+        
+        logger.warning(
+            "Drain finished in %.1fs: closed %s sessions, saved analysis of %s interviews",
+            time.monotonic() - started, len(remaining), saved
+        )
+        return {"closed": len(remaining), "saved_interviews": saved}
+    
+    async def _run_reaper(self) -> None:
+        while True:
+            await asyncio.sleep(settings.SESSION_REAPER_INTERVAL)
+            try:
+                await self.reap_sessions()
+            except Exception as e:
+                logger.error("Session reaper failed: %s", e)
+    
+    async def reap_sessions(self) -> Dict[str, str]:
+        """
+        Tear down idle and stuck sessions, and ping the quiet websockets.
+        
+        Returns the reaped connection_ids with the reason for each:
+        - orphaned: recorder, relay or analysis state left without a peer connection
+        - setup_timeout: the peer connection never connected
+        - disconnected: the peer connection stayed disconnected or failed
+        - tracks_ended: every track the client sent has ended
+        - unreachable: the websocket could not be pinged
+        - idle: no message from the client, while no media flows either
+        """
+        now = time.monotonic()
+        reasons: Dict[str, str] = {}
+        
+        leftovers = (
+            set(self.relays) | set(self.analysis_services) | set(self.recorders)
+            | set(self.analysis_sinks) | set(self.published_tracks)
+        )
+        for connection_id in leftovers - set(self.connections):
+            reasons[connection_id] = "orphaned"
+        
+        for connection_id, pc in list(self.connections.items()):
+            in_state_for = now - self.state_changed_at.get(connection_id, now)
+            tracks = self.published_tracks.get(connection_id)
+            if pc.connectionState in ("new", "connecting") and in_state_for > settings.PEER_SETUP_TIMEOUT:
+                reasons[connection_id] = "setup_timeout"
+            elif (
+                pc.connectionState in ("disconnected", "failed") or pc.iceConnectionState == "disconnected"
+            ) and in_state_for > settings.PEER_DISCONNECTED_TIMEOUT:
+                reasons[connection_id] = "disconnected"
+            elif tracks and all(track.readyState == "ended" for track in tracks):
+                reasons[connection_id] = "tracks_ended"
+        
+        # Ping the websockets that have been quiet for a sweep; clients answer with a pong
+        quiet = [
+            connection_id for connection_id in list(self.websocket_connections)
+            if connection_id not in reasons
+            and now - self.last_seen.get(connection_id, now) >= settings.SESSION_REAPER_INTERVAL
+        ]
+        results = await asyncio.gather(
+            *(self._ping(connection_id) for connection_id in quiet), return_exceptions=True
+        )
+        for connection_id, result in zip(quiet, results):
+            if result is not True:
+                reasons[connection_id] = "unreachable"
+            elif now - self.last_seen.get(connection_id, now) > settings.WEBSOCKET_IDLE_TIMEOUT:
+                pc = self.connections.get(connection_id)
+                if pc is None or pc.connectionState != "connected":
+                    reasons[connection_id] = "idle"
+        
+        if reasons:
+            for connection_id, reason in reasons.items():
+                SESSIONS_REAPED.labels(reason).inc()
+                logger.info("Reaping session %s: %s", connection_id, reason)
+            await asyncio.gather(
+                *(self.close_peer_connection(connection_id) for connection_id in reasons),
+                return_exceptions=True
+            )
+        return reasons
+    
+    async def _ping(self, connection_id: str) -> bool:
+        """Send a heartbeat to the client; False if the websocket is gone"""
+        ws = self.websocket_connections.get(connection_id)
+        if ws is None:
+            return False
+        try:
+            await ws.send_json({"type": "ping", "timestamp": time.time()})
+        except Exception as e:
+            logger.info("Ping to %s failed: %s", connection_id, e)
+            return False
+        return True
+    
+    async def _forward_track(self, publisher_id: str, room_id: str, track: MediaStreamTrack) -> None:
+        """Fan out a newly received track to every other participant in the room"""
+        for subscriber_id in list(self.room_participants.get(room_id, ())):
+            if subscriber_id == publisher_id:
+                continue
+            if self._subscribe(publisher_id, subscriber_id, track):
+                await self._renegotiate(subscriber_id, room_id)
+    
+    def _subscribe_to_room(self, subscriber_id: str, room_id: str) -> None:
+        """Attach the tracks already published in the room to a newly joined connection"""
+        for publisher_id in list(self.room_participants.get(room_id, ())):
+            if publisher_id == subscriber_id:
+                continue
+            for track in self.published_tracks.get(publisher_id, []):
+                if track.readyState == "live":
+                    self._subscribe(publisher_id, subscriber_id, track)
+    
+    def _subscribe(self, publisher_id: str, subscriber_id: str, track: MediaStreamTrack) -> bool:
+        """Attach a relay proxy of a published track to a subscriber's peer connection"""
+        pc = self.connections.get(subscriber_id)
+        relay = self.relays.get(publisher_id)
+        if not pc or not relay or pc.connectionState == "closed":
+            return False
+        
+        forwarded = self.forwarded_tracks.setdefault(publisher_id, {})
+        key = (subscriber_id, track.id)
+        if key in forwarded:
+            return False
+        
+        # Unbuffered proxies only keep the latest frame, so a slow subscriber
+        # drops frames instead of growing a queue in front of its encoder
+        proxy = relay.subscribe(track, buffered=False)
+        pc.addTrack(proxy)
+        forwarded[key] = proxy
+        return True
+    
+    def _stop_forwarding(self, connection_id: str) -> None:
+        """Stop relay proxies published by or delivered to a connection"""
+        for proxy in self.forwarded_tracks.pop(connection_id, {}).values():
+            proxy.stop()
+        
+        for forwarded in self.forwarded_tracks.values():
+            for key in [key for key in forwarded if key[0] == connection_id]:
+                forwarded.pop(key).stop()
+    
+    async def _renegotiate(self, connection_id: str, room_id: str) -> None:
+        """Send a server-initiated offer after the connection's tracks changed"""
+        pc = self.connections.get(connection_id)
+        if not pc or pc.connectionState == "closed":
+            return
+        
+        # Only one offer/answer exchange at a time; retried once the client answers
+        if pc.signalingState != "stable" or pc.remoteDescription is None:
+            self.pending_renegotiation.add(connection_id)
+            return
+        
+        self.pending_renegotiation.discard(connection_id)
+        self.media_profile.apply_codec_preferences(pc)
+        offer = await pc.createOffer()
+        await pc.setLocalDescription(offer)
+        await self._send_to_connection(
+            connection_id,
+            {
+                "type": "offer",
+                "roomId": room_id,
+                "offer": {
+                    "sdp": self.media_profile.apply_to_sdp(pc.localDescription.sdp),
+                    "type": pc.localDescription.type
+                }
+            }
+        )
     
     def _ensure_room_exists(self, room_id: str) -> None:
         """Ensure that a room exists in the mapping"""
         if room_id not in self.room_participants:
             self.room_participants[room_id] = set()
     
-    def _setup_recorder(self, connection_id: str, room_id: str) -> None:
-        """Set up media recording for the connection"""
+    def _apply_room_reference(self, connection_id: str, room_id: str) -> None:
+        """Verify a session against the room's candidate template, loading it for the room on first use"""
+        if room_id not in self.room_references:
+            # Applied to the room's sessions once loaded
+            if room_id not in self.reference_tasks:
+                self.reference_tasks[room_id] = asyncio.create_task(self._load_room_reference(room_id))
+            return
+        reference = self.room_references[room_id]
+        analysis_service = self.analysis_services.get(connection_id)
+        if reference is None or analysis_service is None:
+            return
+        candidate_id, embedding = reference
+        if self._is_candidate(connection_id, candidate_id):
+            analysis_service.set_reference_embedding(embedding, self.match_threshold)
+    
+    def _is_candidate(self, connection_id: str, candidate_id: int) -> bool:
+        """Whether a session is the interview's candidate, going by its authenticated user"""
+        user_id = self.user_ids.get(connection_id)
+        # Sessions that didn't authenticate are verified too, so that the check
+        # can't be skipped by leaving the token out
+        return user_id is None or user_id == candidate_id
+    
+    async def _load_room_reference(self, room_id: str) -> None:
+        try:
+            try:
+                interview_id = int(room_id)
+            except ValueError:
+                reference = None
+            else:
+                reference = await load_interview_template(interview_id)
+            if self.match_threshold is None:
+                # Looked up from DeepFace, whose import is slow when the models aren't warmed up
+                self.match_threshold = await asyncio.to_thread(cosine_threshold)
+        except Exception as e:
+            # Not cached; the next session to join the room tries again
+            logger.error("Error loading the reference template of room %s: %s", room_id, e)
+            return
+        finally:
+            if self.reference_tasks.get(room_id) is asyncio.current_task():
+                del self.reference_tasks[room_id]
+        
+        if not any(connection_id in self.connections for connection_id in self.room_participants.get(room_id, ())):
+            return
+        self.room_references[room_id] = reference
+        if reference is None:
+            logger.warning("No reference template for room %s; its sessions aren't verified", room_id)
+            return
+        for connection_id in self.room_participants[room_id]:
+            self._apply_room_reference(connection_id, room_id)
+    
+    def _forget_room_reference(self, room_id: str) -> None:
+        """Drop a room's template once it has no sessions left, so a new upload is picked up next time"""
+        self.room_references.pop(room_id, None)
+        task = self.reference_tasks.pop(room_id, None)
+        if task:
+            task.cancel()
+    
+    def _schedule_identity_check(self, connection_id: str, analysis_service: FacialAnalysisService) -> None:
+        """Search an ended session's face embeddings against other users' templates in the background"""
+        reference = self.room_references.get(analysis_service.room_id)
+        if not settings.FACE_INDEX_ENABLED or reference is None or not analysis_service.embeddings:
+            return
+        task = asyncio.create_task(self._check_identity(
+            connection_id, analysis_service.room_id, reference[0], list(analysis_service.embeddings)
+        ))
+        self.identity_tasks.add(task)
+        task.add_done_callback(self.identity_tasks.discard)
+    
+    async def _check_identity(self, connection_id: str, room_id: str, candidate_id: int,
+                              embeddings: List[np.ndarray]) -> None:
+        try:
+            with tracer.span("analysis.identity_check", {"connection_id": connection_id, "room_id": room_id}):
+                result = await template_index.check_identity(candidate_id, embeddings)
+            if result["matches"]:
+                logger.warning(
+                    "Candidate %s of interview %s matches the face of users %s",
+                    candidate_id, room_id, [match['user_id'] for match in result['matches']]
+                )
+            await save_identity_check(int(room_id), connection_id, result)
+        except Exception as e:
+            logger.error("Error checking the identity of %s in room %s: %s", connection_id, room_id, e)
+    
+    def _schedule_recorder_setup(self, connection_id: str, room_id: str, pc: RTCPeerConnection) -> None:
+        """Set up recording in the background once, when the first track arrives"""
+        if connection_id in self.recorders or connection_id in self.recorder_tasks:
+            return
+        self.recorder_tasks[connection_id] = asyncio.create_task(
+            self._setup_recorder_when_negotiated(connection_id, room_id, pc)
+        )
+    
+    async def _setup_recorder_when_negotiated(self, connection_id: str, room_id: str, pc: RTCPeerConnection) -> None:
+        """
+        Wait for the answer that accepts the received tracks, then set up recording.
+        
+        Tracks are announced while the remote offer is applied, but their codecs
+        are only settled once the local answer is, so the recorder waits for
+        the signaling state to return to stable.
+        """
+        try:
+            if pc.signalingState != "stable":
+                negotiated = asyncio.Event()
+                
+                def on_signalingstatechange():
+                    if pc.signalingState in ("stable", "closed"):
+                        negotiated.set()
+                
+                pc.on("signalingstatechange", on_signalingstatechange)
+                try:
+                    await negotiated.wait()
+                finally:
+                    pc.remove_listener("signalingstatechange", on_signalingstatechange)
+            
+            if self.connections.get(connection_id) is not pc:
+                return
+            with tracer.span("recording.setup", {"connection_id": connection_id, "room_id": room_id}):
+                await self._setup_recorder(connection_id, room_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Recording failures never affect the call itself
+            logger.error("Error setting up recording for %s: %s", connection_id, e)
+        finally:
+            if self.recorder_tasks.get(connection_id) is asyncio.current_task():
+                del self.recorder_tasks[connection_id]
+    
+    async def _setup_recorder(self, connection_id: str, room_id: str) -> None:
+        """
+        Set up media recording and analysis for the connection.
+        
+        The recorder, the SFU forwarder and the analyzer each read their own
+        relay subscription of the received tracks, so none of them can stall
+        the others.
+        """
         pc = self.connections.get(connection_id)
-        if not pc:
+        relay = self.relays.get(connection_id)
+        tracks = self.published_tracks.get(connection_id)
+        if not pc or not relay or not tracks or connection_id in self.recorders:
             return
         
-        # Create a media recorder
-        recorder_path = f"recordings/{room_id}/{connection_id}_{uuid.uuid4()}.mp4"
-        recorder = MediaRecorder(recorder_path)
+        room_dir = f"{settings.RECORDINGS_DIR}/{room_id}"
+        await asyncio.to_thread(os.makedirs, room_dir, exist_ok=True)
+        recorder_path = f"{room_dir}/{connection_id}_{uuid.uuid4()}"
+        if settings.RECORDING_MODE == "passthrough":
+            # Store the received encoded frames as-is; remuxing or transcoding
+            # is left to the background job queue
+            recorder = PassthroughRecorder(recorder_path)
+            for transceiver in pc.getTransceivers():
+                if transceiver.receiver.track in tracks:
+                    recorder.addTransceiver(transceiver)
+        else:
+            # Create a media recorder writing fragmented MP4 flushed at least
+            # every second, which is playable while still being written and
+            # survives an unclean stop
+            recorder_path = f"{recorder_path}.mp4"
+            # Opening the output container touches the disk; keep it off the loop
+            recorder = await asyncio.to_thread(MediaRecorder, recorder_path, options=FRAGMENTED_MP4_OPTIONS)
+            for track in tracks:
+                # Buffered subscription so the recorder gets every frame at its own pace
+                recorder.addTrack(relay.subscribe(track))
         self.recorders[connection_id] = recorder
+        self.recording_paths[connection_id] = recorder_path
         
-        # Add transform track for video analysis
-        for transceiver in pc.getTransceivers():
-            if transceiver.receiver and transceiver.receiver.track:
-                track = transceiver.receiver.track
-                if track.kind == "video":
-                    # Create analysis track
-                    analysis_service = self.analysis_services[connection_id]
-                    transform_track = VideoTransformTrack(
-                        track=track,
-                        analysis_service=analysis_service
-                    )
-                    
-                    # Add track to recorder
-                    recorder.addTrack(transform_track)
-                elif track.kind == "audio":
-                    # Add audio track directly
-                    recorder.addTrack(track)
+        for track in tracks:
+            if track.kind == "video" and connection_id not in self.analysis_sinks:
+                await self._setup_analysis(connection_id, relay, track)
         
         # Start recording
-        recorder.start()
+        await recorder.start()
+    
+    async def _enqueue_post_processing(self, connection_id: str, recorder, recording_path: str) -> None:
+        """Hand a finished recording to the background job queue"""
+        try:
+            await enqueue_recording_jobs(
+                job_queue,
+                recording_path,
+                passthrough=isinstance(recorder, PassthroughRecorder),
+                connection_id=connection_id,
+                # Recordings are kept in a directory per room
+                room_id=os.path.basename(os.path.dirname(recording_path))
+            )
+        except Exception as e:
+            logger.error("Error queueing post-processing for %s: %s", recording_path, e)
+    
+    async def _setup_analysis(self, connection_id: str, relay: MediaRelay, track: MediaStreamTrack) -> None:
+        """Attach a lossy, latest-frame-only analysis consumer to a video track"""
+        analysis_service = self.analysis_services.get(connection_id)
+        if not analysis_service:
+            return
+        
+        transform_track = VideoTransformTrack(
+            track=relay.subscribe(track, buffered=False),
+            analysis_service=analysis_service
+        )
+        
+        # Nothing else consumes the transform track, so drain it here
+        analysis_sink = MediaBlackhole()
+        analysis_sink.addTrack(transform_track)
+        self.analysis_sinks[connection_id] = analysis_sink
+        # The consumer runs for the whole session; started under the recorder
+        # setup's span, every analysed frame would join the offer's trace
+        await detached_context().run(asyncio.create_task, analysis_sink.start())
     
-    async def register_websocket(self, connection_id: str, websocket: WebSocket) -> None:
-        """Register a websocket connection for signaling"""
+    async def register_websocket(self, connection_id: str, websocket: WebSocket, user_id: int = None) -> None:
+        """Register a websocket connection for signaling, opened by user_id if it authenticated"""
         await websocket.accept()
         self.websocket_connections[connection_id] = websocket
+        if user_id is not None:
+            self.user_ids[connection_id] = user_id
+        self.last_seen[connection_id] = time.monotonic()
     
     async def handle_websocket_message(self, connection_id: str, message: dict) -> None:
         """Handle a message from the websocket"""
-        try:
-            message_type = message.get("type")
-            room_id = message.get("roomId")
+        started = time.perf_counter()
+        if connection_id in self.last_seen:
+            self.last_seen[connection_id] = time.monotonic()
+        message_type = message.get("type")
+        # Unknown types are bucketed together to keep the label set bounded
+        label = message_type if message_type in SIGNALING_MESSAGE_TYPES else "other"
+        with tracer.span(
+            f"signaling.{label}",
+            {"connection_id": connection_id, "room_id": message.get("roomId")},
+            kind=KIND_SERVER
+        ) as span:
+            try:
+                await self._dispatch_websocket_message(connection_id, message_type, message)
+            except Exception as e:
+                logger.error("Error handling websocket message: %s", e)
+                span.set_error(e)
+        SIGNALING_MESSAGE_SECONDS.labels(label).observe(time.perf_counter() - started)
+    
+    async def _dispatch_websocket_message(self, connection_id: str, message_type: str, message: dict) -> None:
+        # Heartbeats aren't tied to a room; a pong only needs to be received
+        if message_type == "pong":
+            return
+        if message_type == "ping":
+            await self._send_to_connection(connection_id, {"type": "pong", "timestamp": message.get("timestamp")})
+            return
+        
+        room_id = message.get("roomId")
+        
+        if not room_id:
+            logger.error("Missing roomId in message: %s", message)
+            return
+        
+        if message_type == "join":
+            # Client is joining the room
+            user_info = message.get("userInfo", {})
             
-            if not room_id:
-                logger.error(f"Missing roomId in message: {message}")
-                return
+            # Add to room participants
+            self._ensure_room_exists(room_id)
+            self.room_participants[room_id].add(connection_id)
             
-            if message_type == "join":
-                # Client is joining the room
-                user_info = message.get("userInfo", {})
-                
-                # Add to room participants
-                self._ensure_room_exists(room_id)
-                self.room_participants[room_id].add(connection_id)
-                
-                # Notify other participants
-                await self._broadcast_to_room(
-                    room_id, 
+            # Notify other participants
+            await self._broadcast_to_room(
+                room_id, 
+                {
+                    "type": "user_joined",
+                    "userId": connection_id,
+                    "userInfo": user_info
+                },
+                exclude=[connection_id]
+            )
+            
+            # Send room participants to the new user
+            await self._send_to_connection(
+                connection_id,
+                {
+                    "type": "room_users",
+                    "users": list(self.room_participants[room_id])
+                }
+            )
+            
+        elif message_type == "offer":
+            # Client is sending an offer
+            offer = message.get("offer")
+            if offer and connection_id not in self.connections:
+                # Only new sessions go through admission; renegotiations always pass
+                reason = self.admission.check(room_id)
+                if reason:
+                    logger.warning("Refusing session %s in room %s: %s", connection_id, room_id, reason)
+                    await self._send_to_connection(connection_id, self.admission.rejection(reason))
+                    # Leave the room again; the client re-joins after the retry delay
+                    await self.close_peer_connection(connection_id, close_websocket=False)
+                    return
+            if offer:
+                answer = await self.handle_offer(connection_id, room_id, offer)
+                await self._send_to_connection(
+                    connection_id,
                     {
-                        "type": "user_joined",
-                        "userId": connection_id,
-                        "userInfo": user_info
-                    },
-                    exclude=[connection_id]
+                        "type": "answer",
+                        "answer": answer,
+                        # Caps for the client to apply with RTCRtpSender.setParameters()
+                        "constraints": self.media_profile.constraints()
+                    }
                 )
-                
-                # Send room participants to the new user
+                if connection_id in self.pending_renegotiation:
+                    await self._renegotiate(connection_id, room_id)
+            
+        elif message_type == "answer":
+            # Client is answering a server-initiated renegotiation
+            answer = message.get("answer")
+            if answer:
+                await self.handle_answer(connection_id, room_id, answer)
+            
+        elif message_type == "ice_candidate":
+            # Client is sending an ICE candidate, or a batch of them in "candidates"
+            candidate = message.get("candidates") or message.get("candidate")
+            if candidate:
+                await self.handle_ice_candidate(connection_id, candidate)
+            
+        elif message_type == "chat":
+            # Chat sent over signaling, e.g. before the data channel is open
+            await self._broadcast_to_room(
+                room_id,
+                {
+                    "type": "chat",
+                    "from": connection_id,
+                    "message": message.get("message")
+                },
+                exclude=[connection_id]
+            )
+            
+        elif message_type == "leave":
+            # Client is leaving the room
+            summary = await self.close_peer_connection(connection_id, close_websocket=False)
+            
+            # Send analysis summary if available
+            if summary:
                 await self._send_to_connection(
                     connection_id,
                     {
-                        "type": "room_users",
-                        "users": list(self.room_participants[room_id])
+                        "type": "analysis_summary",
+                        "summary": summary
                     }
                 )
-                
-            elif message_type == "offer":
-                # Client is sending an offer
-                offer = message.get("offer")
-                if offer:
-                    answer = await self.handle_offer(connection_id, room_id, offer)
-                    await self._send_to_connection(
-                        connection_id,
-                        {
-                            "type": "answer",
-                            "answer": answer
-                        }
-                    )
-                
-            elif message_type == "ice_candidate":
-                # Client is sending an ICE candidate
-                candidate = message.get("candidate")
-                if candidate:
-                    await self.handle_ice_candidate(connection_id, candidate)
-                
-            elif message_type == "leave":
-                # Client is leaving the room
-                summary = await self.close_peer_connection(connection_id)
-                
-                # Send analysis summary if available
-                if summary:
-                    await self._send_to_connection(
-                        connection_id,
-                        {
-                            "type": "analysis_summary",
-                            "summary": summary
-                        }
-                    )
-                
-        except Exception as e:
-            logger.error(f"Error handling websocket message: {e}")
+            await self._close_websocket(connection_id)
     
     async def _send_to_connection(self, connection_id: str, message: dict) -> None:
         """Send a message to a specific connection"""
@@ -324,7 +1071,7 @@ class WebRTCService:
             except WebSocketDisconnect:
                 await self.close_peer_connection(connection_id)
             except Exception as e:
-                logger.error(f"Error sending to connection {connection_id}: {e}")
+                logger.error("Error sending to connection %s: %s", connection_id, e)
     
     async def _broadcast_to_room(self, room_id: str, message: dict, exclude: List[str] = None) -> None:
         """Broadcast a message to all participants in a room"""
@@ -334,6 +1081,12 @@ class WebRTCService:
         if room_id not in self.room_participants:
             return
             
-        for connection_id in self.room_participants[room_id]:
-            if connection_id not in exclude:
-                await self._send_to_connection(connection_id, message)
\ No newline at end of file
+        started = time.perf_counter()
+        recipients = [
+            connection_id for connection_id in self.room_participants[room_id]
+            if connection_id not in exclude
+        ]
+        for connection_id in recipients:
+            await self._send_to_connection(connection_id, message)
+        BROADCAST_RECIPIENTS.observe(len(recipients))
+        BROADCAST_SECONDS.observe(time.perf_counter() - started)
\ No newline at end of file
@@ -57,7 +57,7 @@ async def startup_db_connection():
             await conn.commit()
             logger.info("Successfully connected to Neon PostgreSQL database")
     except Exception as e:
-        logger.error(f"Database connection error: {e}")
+        logger.error("Database connection error: %s", e)
         raise
 
 @app.on_event("shutdown")
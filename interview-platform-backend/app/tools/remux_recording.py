@@ -0,0 +1,263 @@
+# app/tools/remux_recording.py
+"""
+Turn a passthrough recording (`<name>.frames` + `<name>.json`) into a playable file.
+
+Remuxing copies the encoded frames into WebM (VP8/Opus) or MKV (H264/Opus)
+without decoding them. Transcoding to H.264/AAC MP4 is optional and meant to
+run later, outside the media path.
+
+Usage:
+    python -m app.tools.remux_recording recordings/<room>/<name>.frames [--transcode]
+"""
+import argparse
+import io
+import logging
+import os
+from fractions import Fraction
+from typing import Dict, Optional
+
+import av
+
+from app.services.recording import read_frames, read_metadata, recording_base_path
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_CODECS = {"vp8", "h264", "opus"}
+
+# Outputs are written under a temporary name and moved into place once
+# complete, so the container format can't be guessed from the file name
+CONTAINER_FORMATS = {".webm": "webm", ".mkv": "matroska", ".mp4": "mp4"}
+PARTIAL_SUFFIX = ".partial"
+
+
+def _codec_name(stream: dict) -> str:
+    return stream["codec"]["mimeType"].split("/")[-1].lower()
+
+
+def _is_keyframe(codec_name: str, data: bytes) -> bool:
+    if codec_name == "vp8":
+        # Inverse key frame flag in the first bit of the VP8 frame tag
+        return len(data) > 0 and not data[0] & 0x01
+    if codec_name == "h264":
+        # IDR slice or SPS in the Annex B byte stream
+        for chunk in data.split(b"\x00\x00\x01")[1:]:
+            if chunk and chunk[0] & 0x1F in (5, 7):
+                return True
+        return False
+    return True
+
+
+def _vp8_dimensions(data: bytes):
+    # Key frames carry a start code followed by 14-bit width and height
+    if len(data) < 10 or data[3:6] != b"\x9d\x01\x2a":
+        return None
+    width = int.from_bytes(data[6:8], "little") & 0x3FFF
+    height = int.from_bytes(data[8:10], "little") & 0x3FFF
+    return width, height
+
+
+def _container_format(output_path: str) -> Optional[str]:
+    return CONTAINER_FORMATS.get(os.path.splitext(output_path)[1].lower())
+
+
+def _discard(partial_path: str) -> None:
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+
+
+def _h264_template(path: str, index: int):
+    """Probe the H264 elementary stream to get dimensions and SPS/PPS extradata"""
+    buffer = io.BytesIO()
+    frames = 0
+    for stream_index, _, _, data in read_frames(path):
+        if stream_index != index or (frames == 0 and not _is_keyframe("h264", data)):
+            continue
+        buffer.write(data)
+        frames += 1
+        if frames >= 30:
+            break
+    if not frames:
+        return None
+    buffer.seek(0)
+    return av.open(buffer, format="h264")
+
+
+def remux(path: str, output_path: Optional[str] = None) -> str:
+    """
+    Remux a passthrough recording into WebM/MKV without re-encoding.
+
+    Returns the output path.
+    """
+    base = recording_base_path(path) or path
+    metadata = read_metadata(base)
+    streams = [s for s in metadata["streams"] if _codec_name(s) in SUPPORTED_CODECS]
+    for stream in metadata["streams"]:
+        if stream not in streams:
+            logger.warning("Skipping unsupported %s codec %s", stream['kind'], stream['codec']['mimeType'])
+    if not streams:
+        raise ValueError(f"No remuxable streams in {base}")
+
+    codecs = {s["index"]: _codec_name(s) for s in streams}
+    if output_path is None:
+        extension = ".mkv" if "h264" in codecs.values() else ".webm"
+        output_path = base + extension
+
+    # First key frame of every video stream, plus the earliest arrival time
+    # across streams so their timelines can be aligned
+    first_keyframes: Dict[int, bytes] = {}
+    first_arrival: Dict[int, int] = {}
+    for index, _, arrival_ms, data in read_frames(base):
+        if index not in codecs:
+            continue
+        if codecs[index] in ("vp8", "h264"):
+            if index not in first_keyframes and _is_keyframe(codecs[index], data):
+                first_keyframes[index] = data
+                first_arrival[index] = arrival_ms
+        elif index not in first_arrival:
+            first_arrival[index] = arrival_ms
+        if len(first_arrival) == len(codecs):
+            break
+    if not first_arrival:
+        raise ValueError(f"No decodable frames in {base}")
+    origin_ms = min(first_arrival.values())
+
+    # Nothing else may see the file (the recordings API lists it, other
+    # jobs decode it) before it is complete
+    partial_path = output_path + PARTIAL_SUFFIX
+    probes = []
+    completed = False
+    output = av.open(partial_path, "w", format=_container_format(output_path))
+    try:
+        out_streams = {}
+        time_bases: Dict[int, Fraction] = {}
+        for stream in streams:
+            index = stream["index"]
+            codec = codecs[index]
+            if index not in first_arrival:
+                continue
+            if codec == "h264":
+                probe = _h264_template(base, index)
+                if probe is None:
+                    continue
+                probes.append(probe)
+                out_stream = output.add_stream_from_template(probe.streams.video[0])
+            elif codec == "vp8":
+                width, height = _vp8_dimensions(first_keyframes[index]) or (640, 480)
+                out_stream = output.add_mux_stream("vp8", width=width, height=height)
+            else:
+                out_stream = output.add_mux_stream("opus", rate=stream["codec"]["clockRate"])
+            # The muxer may pick its own stream time base once the header is
+            # written, so packets keep the RTP clock and get rescaled on mux
+            time_bases[index] = Fraction(1, stream["codec"]["clockRate"])
+            out_stream.time_base = time_bases[index]
+            out_streams[index] = out_stream
+
+        # RTP timestamps are 32-bit and start at a random offset
+        first_timestamp: Dict[int, int] = {}
+        last_timestamp: Dict[int, int] = {}
+        unwrapped: Dict[int, int] = {}
+        last_pts: Dict[int, int] = {}
+        for index, timestamp, _, data in read_frames(base):
+            out_stream = out_streams.get(index)
+            if out_stream is None:
+                continue
+            if index not in first_timestamp:
+                if codecs[index] != "opus" and not _is_keyframe(codecs[index], data):
+                    continue
+                first_timestamp[index] = timestamp
+                last_timestamp[index] = timestamp
+                unwrapped[index] = 0
+
+            delta = (timestamp - last_timestamp[index]) & 0xFFFFFFFF
+            if delta >= 0x80000000:
+                delta -= 0x100000000
+            unwrapped[index] += delta
+            last_timestamp[index] = timestamp
+
+            offset = (first_arrival[index] - origin_ms) * time_bases[index].denominator // 1000
+            pts = unwrapped[index] + offset
+            if index in last_pts and pts <= last_pts[index]:
+                continue
+            last_pts[index] = pts
+
+            packet = av.Packet(data)
+            packet.stream = out_stream
+            packet.time_base = time_bases[index]
+            packet.pts = packet.dts = pts
+            output.mux(packet)
+        completed = True
+    finally:
+        output.close()
+        for probe in probes:
+            probe.close()
+        if not completed:
+            _discard(partial_path)
+
+    os.replace(partial_path, output_path)
+    return output_path
+
+
+def transcode(path: str, output_path: Optional[str] = None) -> str:
+    """
+    Transcode a recording to H.264/AAC MP4.
+
+    Returns the output path.
+    """
+    if output_path is None:
+        output_path = path.rsplit(".", 1)[0] + ".mp4"
+
+    partial_path = output_path + PARTIAL_SUFFIX
+    try:
+        _transcode(path, partial_path, _container_format(output_path))
+    except BaseException:
+        _discard(partial_path)
+        raise
+    os.replace(partial_path, output_path)
+    return output_path
+
+
+def _transcode(path: str, output_path: str, container_format: Optional[str]) -> None:
+    with av.open(path) as source, av.open(
+        output_path, "w", format=container_format, options={"movflags": "+faststart"}
+    ) as output:
+        streams = {}
+        for stream in source.streams:
+            if stream.type == "video":
+                out_stream = output.add_stream("libx264", rate=30)
+                out_stream.width = stream.codec_context.width
+                out_stream.height = stream.codec_context.height
+                out_stream.pix_fmt = "yuv420p"
+            elif stream.type == "audio":
+                out_stream = output.add_stream("aac", rate=48000)
+            else:
+                continue
+            # Keep the source timestamps; WebRTC video has a variable frame rate
+            out_stream.codec_context.time_base = stream.time_base
+            streams[stream.index] = out_stream
+
+        for packet in source.demux(*[source.streams[i] for i in streams]):
+            out_stream = streams[packet.stream.index]
+            for frame in packet.decode():
+                for out_packet in out_stream.encode(frame):
+                    output.mux(out_packet)
+
+        for out_stream in streams.values():
+            for out_packet in out_stream.encode(None):
+                output.mux(out_packet)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="Passthrough recording (.frames or .json path, or the common prefix)")
+    parser.add_argument("--output", help="Output path for the remuxed file")
+    parser.add_argument("--transcode", action="store_true", help="Also transcode the result to H.264/AAC MP4")
+    args = parser.parse_args()
+
+    output_path = remux(args.path, args.output)
+    print(f"Remuxed to {output_path}")
+    if args.transcode:
+        print(f"Transcoded to {transcode(output_path)}")
+
+
+if __name__ == "__main__":
+    main()
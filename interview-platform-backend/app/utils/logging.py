@@ -1,66 +1,169 @@
 # app/utils/logging.py
+"""
+Non-blocking logging for the application.
+
+Log calls only put the record on a bounded queue; a listener thread formats
+the records and writes them to stdout and the log file, so disk and console
+writes never happen on the event loop thread that also carries media.
+
+- Records are formatted on the listener thread, so use lazy %-style
+  arguments (`logger.info("ICE state %s", state)`) on hot paths.
+- Output is one JSON object per line by default (LOG_FORMAT="text" for the
+  classic format). Fields passed with `extra=` (room_id, connection_id, ...)
+  become JSON keys.
+- Each call site of the loggers in LOG_RATE_LIMITED_LOGGERS may emit at most
+  LOG_RATE_LIMIT records per second; the number suppressed is reported on the
+  next record that gets through.
+- When the queue is full, records are dropped rather than blocking the caller.
+"""
+import atexit
+import json
 import logging
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import Counter
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(process)d - %(threadName)s - %(message)s"
+
+# Attributes every LogRecord has; anything else was passed with `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+LOG_RECORDS_DROPPED = Counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any `extra=` fields"""
 
-# Recommended: Get log level from environment/config
-LOG_LEVEL = logging.INFO # Or get from settings: settings.LOG_LEVEL
-LOG_FILE = "interview_platform.log"
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
 
-def setup_logging():
+
+class RateLimitFilter(logging.Filter):
     """
-    Configures logging for the application.
+    Token bucket per call site (logger and line) of the loggers it applies to.
 
-    Sets up console and rotating file handlers.
+    Call sites are used rather than messages: the formatted message differs
+    on every call, and a %-style template may be shared by several call sites.
     """
-    # Get the root logger
-    root_logger = logging.getLogger()
-    root_logger.setLevel(LOG_LEVEL)
-
-    # Create a formatter
-    log_formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(process)d - %(threadName)s - %(message)s"
-    )
-
-    # --- Console Handler ---
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(log_formatter)
-    # Avoid adding duplicate handlers if already configured (e.g., by basicConfig)
-    if not any(isinstance(h, logging.StreamHandler) for h in root_logger.handlers):
-         root_logger.addHandler(console_handler)
-
-    # --- Rotating File Handler ---
-    # Creates a log file that rotates when it reaches a certain size.
-    # Keeps a specified number of backup files.
-    try:
-        file_handler = RotatingFileHandler(
-            LOG_FILE,
+
+    def __init__(self, rate: float, loggers=()):
+        super().__init__()
+        self.rate = rate
+        self.burst = max(1.0, rate)
+        self.prefixes = tuple(loggers)
+        self._buckets: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def _applies_to(self, name: str) -> bool:
+        return any(name == prefix or name.startswith(prefix + ".") for prefix in self.prefixes)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self._applies_to(record.name):
+            return True
+        now = time.monotonic()
+        with self._lock:
+            # bucket: [tokens, last refill, suppressed since last emitted record]
+            bucket = self._buckets.setdefault((record.name, record.lineno), [self.burst, now, 0])
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1.0
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread without formatting them.
+
+    The stock QueueHandler formats every record on the calling thread; here
+    only the arguments are kept, and records that don't fit in the queue are
+    counted and dropped.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging() -> QueueListener:
+    """
+    Route all logging through a queue to a background listener.
+
+    Call once, before the application starts logging; the listener is
+    stopped, flushing queued records, when the process exits.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = JsonFormatter() if settings.LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if settings.LOG_FILE:
+        handlers.append(RotatingFileHandler(
+            settings.LOG_FILE,
             maxBytes=10*1024*1024, # 10 MB
             backupCount=5 # Keep 5 backup logs
-        )
-        file_handler.setFormatter(log_formatter)
-        if not any(isinstance(h, RotatingFileHandler) for h in root_logger.handlers):
-            root_logger.addHandler(file_handler)
-    except Exception as e:
-        root_logger.error(f"Failed to set up file logging handler: {e}")
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
 
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    LOG_RECORDS_DROPPED.set_function(lambda: queue_handler.dropped)
+    if settings.LOG_RATE_LIMIT > 0:
+        queue_handler.addFilter(RateLimitFilter(settings.LOG_RATE_LIMIT, settings.LOG_RATE_LIMITED_LOGGERS))
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(settings.LOG_LEVEL)
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(queue_handler)
 
     # --- Configure specific loggers ---
-    # Example: Set different levels for noisy libraries
+    # Quieten noisy libraries
     logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
     logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    logging.getLogger("aioice").setLevel(logging.WARNING)
 
-    root_logger.info("Logging configured successfully.")
-
-# --- How to use in main.py ---
-# from app.utils.logging import setup_logging
-#
-# # Call this early, before creating the FastAPI app instance
-# setup_logging()
-#
-# # Then proceed with FastAPI app creation...
-# app = FastAPI(...)
-
-# Note: This provides more control than basicConfig.
-# If you call setup_logging(), you might remove the basicConfig call from main.py
-# to avoid potential conflicts or duplicate handlers, unless you specifically want both.
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener